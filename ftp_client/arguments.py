@@ -0,0 +1,28 @@
+import argparse
+import throttle
+
+
+def positive_int(value):
+    '''argparse type for positive integer values'''
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(
+            '{} is not a positive integer'.format(value))
+    return number
+
+
+def compression_level(value):
+    '''argparse type for deflate compression level'''
+    level = int(value)
+    if not 1 <= level <= 9:
+        raise argparse.ArgumentTypeError(
+            '{} is not a compression level from 1 to 9'.format(value))
+    return level
+
+
+def rate(value):
+    '''argparse type for bandwidth limits'''
+    try:
+        return throttle.parse_rate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
@@ -0,0 +1,224 @@
+import asyncio
+import contextlib
+import os
+import re
+import exceptions as exc
+import ftp
+
+
+class AsyncClient:
+    '''ftp client built on asyncio streams, one event loop
+    can drive many sessions at once, settings are taken from config
+    as in ftp.Client'''
+    def __init__(self, config=None):
+        self.config = config or ftp.Config()
+        self.isConnected = False
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host='', port=21, *args):
+        '''connect to remote ftp'''
+        if self.isConnected:
+            raise exc.NotConnectedException(
+                      'Already connected to {},'
+                      'use close first.'.format(self.hostName))
+
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.config.timeout)
+        self.isConnected = True
+        self.hostName = host
+        self.port = port
+
+        resp = await self._get_resp()
+        if resp.startswith('421'):
+            await self._disconnect()
+            raise exc.TimeoutException(resp)
+        return resp
+
+    async def login(self, name, password, *args):
+        '''relogin on remote ftp'''
+        resp = await self.send_cmd('USER', name)
+        resp = await self.send_cmd('PASS', password)
+        if resp.startswith('530'):
+            raise exc.FailedOperationException(resp)
+
+        self._userName = name
+        self._password = password
+        return resp
+
+    async def send_cmd(self, cmd, *params):
+        '''send a command to remote server and return resp'''
+        cmd = ' '.join((cmd, *params)) + ftp.END_OF_COMMAND
+
+        try:
+            self.writer.write(cmd.encode(self.config.encoding))
+            await self.writer.drain()
+            resp = await self._get_resp()
+        except (OSError, asyncio.TimeoutError):
+            await self._disconnect()
+            raise
+
+        if resp.startswith('421'):
+            await self._disconnect()
+            raise exc.TimeoutException(resp)
+        return resp
+
+    async def _get_resp(self):
+        '''read one, possibly multi-line, resp from control connection'''
+        line = await self._readline()
+        lines = [line]
+        if line[3:4] == '-':
+            end = line[:3] + ' '
+            while not line.startswith(end):
+                line = await self._readline()
+                lines.append(line)
+        return ''.join(lines)
+
+    async def _readline(self):
+        '''read line of resp from control connection'''
+        line = await asyncio.wait_for(self.reader.readline(),
+                                      self.config.timeout)
+        if not line:
+            raise exc.NotConnectedException('Connection closed.')
+        return line.decode(self.config.encoding)
+
+    async def _open_data(self, cmd, *params):
+        '''open data connection in current mode and send command'''
+        if self.config.isActive:
+            connected = asyncio.get_running_loop().create_future()
+            server = await self._enter_active_mode(connected)
+        else:
+            dataReader, dataWriter = await self._enter_pasv()
+
+        try:
+            resp = await self.send_cmd(cmd, *params)
+            if ftp.ERROR_PATTERN.match(resp):
+                raise exc.FailedOperationException(resp)
+            self._lastResp = resp
+            if self.config.isActive:
+                dataReader, dataWriter = await asyncio.wait_for(
+                    connected, self.config.timeout)
+        except BaseException:
+            if not self.config.isActive:
+                dataWriter.close()
+            raise
+        finally:
+            if self.config.isActive:
+                server.close()
+        return dataReader, dataWriter
+
+    async def _enter_pasv(self):
+        '''enter passive mode and connect to data port'''
+        resp = await self.send_cmd('PASV')
+        searchResult = re.match(r'.*\(((?:\d+,){5}\d+)\)', resp)
+        if not searchResult:
+            raise exc.FailedOperationException(resp)
+
+        data = searchResult.group(1).split(',')
+        dataHost = '.'.join(data[:4])
+        dataPort = int(data[4]) * 2**8 + int(data[5])
+        return await asyncio.wait_for(
+            asyncio.open_connection(dataHost, dataPort), self.config.timeout)
+
+    async def _enter_active_mode(self, connected):
+        '''listen data port and send it by PORT command'''
+        def accept(reader, writer):
+            if connected.done():
+                writer.close()
+            else:
+                connected.set_result((reader, writer))
+
+        host = self.writer.get_extra_info('sockname')[0]
+        server = await asyncio.start_server(accept, host, 0)
+        port = server.sockets[0].getsockname()[1]
+        portArgs = '{},{},{}'.format(host.replace('.', ','),
+                                     port // 256, port % 256)
+        try:
+            await self.send_cmd('PORT', portArgs)
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    async def ls(self, directoryName='', *args):
+        '''return lines of listing of remote directory'''
+        reader, writer = await self._open_data('LIST', directoryName)
+        with contextlib.closing(writer):
+            data = b''.join([block async for block
+                             in self._data_blocks(reader)])
+        await self._get_resp()
+        return data.decode(self.config.encoding).splitlines()
+
+    async def cd(self, directoryName='', *args):
+        '''change remote working directory'''
+        return await self.send_cmd('CWD', directoryName)
+
+    async def get(self, remoteFile='', localFile='', *args):
+        '''receive file'''
+        localFile = os.path.expanduser(localFile or remoteFile)
+        await self.send_cmd('TYPE I')
+        reader, writer = await self._open_data('RETR', remoteFile)
+        try:
+            with contextlib.closing(writer), open(localFile, 'wb') as f:
+                async for data in self._data_blocks(reader):
+                    f.write(data)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(localFile)
+            raise
+        return await self._get_resp()
+
+    async def _data_blocks(self, reader):
+        '''yield blocks of data connection until its end, timeout
+        is applied to each read, so long transfers do not fail'''
+        while True:
+            data = await asyncio.wait_for(
+                reader.read(self.config.bufferSize), self.config.timeout)
+            if not data:
+                return
+            yield data
+
+    async def send(self, localFile='', remoteFile='', *args):
+        '''send file'''
+        remoteFile = remoteFile or localFile
+        localFile = os.path.expanduser(localFile)
+        if not os.path.isfile(localFile):
+            raise exc.FailedOperationException('Local file not found')
+
+        await self.send_cmd('TYPE I')
+        reader, writer = await self._open_data('STOR', remoteFile)
+        with open(localFile, 'rb') as f:
+            try:
+                await asyncio.get_running_loop().sendfile(
+                    writer.transport, f)
+                writer.close()
+                await writer.wait_closed()
+            finally:
+                writer.close()
+        return await self._get_resp()
+
+    async def mkdir(self, dirName, *args):
+        '''make a directory on remote machine'''
+        return await self.send_cmd('MKD', dirName)
+
+    async def size(self, fileName, *args):
+        '''get size of file'''
+        return await self.send_cmd('SIZE', fileName)
+
+    async def close(self, *args):
+        '''terminate ftp session'''
+        try:
+            resp = await self.send_cmd('QUIT')
+        finally:
+            await self._disconnect()
+        return resp
+
+    async def _disconnect(self):
+        '''close control connection'''
+        if self.writer is not None:
+            self.writer.close()
+            with contextlib.suppress(OSError, asyncio.TimeoutError):
+                await self.writer.wait_closed()
+        self.isConnected = False
+        self.reader = None
+        self.writer = None
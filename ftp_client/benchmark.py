@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+
+ERROR_REGRESSION = 1
+ERROR_MODULES_MISSING = 2
+ERROR_NO_BASELINE = 3
+
+try:
+    import ftp
+    import loopserver
+except Exception as e:
+    print('Program modules not found: "{}"'.format(e), file=sys.stderr)
+    sys.exit(ERROR_MODULES_MISSING)
+
+
+SIZES = '1K,1M,64M'
+COUNTS = '100'
+MODES = 'pasv,active'
+SMALL_FILE_SIZE = 4 * 1024
+TOLERANCE = 0.2
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'benchmark_baseline.json')
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+BYTE_CASES = {'get', 'send', 'send_stream'}
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def main():
+    parser = setup_parser()
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.counts, args.modes, args.repeat,
+                 args.jobs, args.workdir)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+        return
+
+    if not os.path.exists(args.baseline):
+        # regression gate can not pass without anything to compare with
+        print('Baseline {} not found, nothing was compared, save it on '
+              'reference machine with --save-baseline'.format(args.baseline),
+              file=sys.stderr)
+        sys.exit(ERROR_NO_BASELINE)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, report, args.tolerance)
+    for regression in regressions:
+        print('Regression: {}'.format(regression), file=sys.stderr)
+    if regressions:
+        sys.exit(ERROR_REGRESSION)
+
+
+def run(sizes, counts, modes, repeat=3, jobs=1, workdir=None):
+    '''run benchmark matrix against loopback server in separate
+    process, return report with result of every case'''
+    files = {'/data/{}'.format(size): size for size in sizes}
+    for count in counts:
+        for i in range(count):
+            files['/tree{}/file{}'.format(count, i)] = SMALL_FILE_SIZE
+
+    results = []
+    with loopserver.serve_in_process(files) as port, \
+            tempfile.TemporaryDirectory(dir=workdir) as directory:
+        cases = _prepare_local_files(directory, sizes, counts)
+        for mode in modes:
+            client = ftp.Client(ftp.Config(isActive=mode == 'active'))
+            client.connect('127.0.0.1', port)
+            client.login('bench', 'bench')
+            try:
+                for case, size, count, operation in _cases(
+                        client, directory, cases, jobs):
+                    results.append(_measure(case, mode, size, count,
+                                            operation, repeat))
+            finally:
+                with contextlib.suppress(Exception):
+                    client.close()
+
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'buffer_size': ftp.BUFFER_SIZE,
+            'jobs': jobs,
+            'results': results}
+
+
+def _prepare_local_files(directory, sizes, counts):
+    '''make local sources of send cases, sparse files are used
+    to keep big files cheap'''
+    cases = {}
+    for size in sizes:
+        path = os.path.join(directory, 'send{}'.format(size))
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        cases[('send', size)] = path
+    for count in counts:
+        path = os.path.join(directory, 'sendtree{}'.format(count))
+        os.mkdir(path)
+        for i in range(count):
+            with open(os.path.join(path, 'file{}'.format(i)), 'wb') as f:
+                f.truncate(SMALL_FILE_SIZE)
+        cases[('send_tree', count)] = path
+    return cases
+
+
+def _cases(client, directory, cases, jobs):
+    '''yield (case, size, count, operation) of benchmark matrix'''
+    received = os.path.join(directory, 'received')
+    for (case, value), path in sorted(cases.items()):
+        if case == 'send':
+            yield ('get', value, 1, lambda value=value: client.get(
+                '/data/{}'.format(value), received, jobs=jobs))
+            yield ('send', value, 1, lambda path=path: client.send(
+                path, '/upload', jobs=jobs))
+            yield ('send_stream', value, 1,
+                   lambda value=value: _send_stream(client, value))
+        else:
+            tree = '/tree{}'.format(value)
+            yield ('ls', 0, value, lambda tree=tree: client.ls(tree))
+            yield ('get_tree', SMALL_FILE_SIZE * value, value,
+                   lambda tree=tree: client.get(
+                       tree, os.path.join(directory, 'received' + tree[1:]),
+                       jobs=jobs))
+            yield ('send_tree', SMALL_FILE_SIZE * value, value,
+                   lambda path=path, value=value: client.send(
+                       path, '/uploadtree{}'.format(value), jobs=jobs))
+
+
+def _send_stream(client, size):
+    '''upload size bytes which producer thread writes to pipe meanwhile,
+    return seconds from start to first block read for sending and
+    to end of producer'''
+    readFd, writeFd = os.pipe()
+    started = time.perf_counter()
+    timings = {}
+
+    def produce():
+        block = bytes(STREAM_BLOCK_SIZE)
+        with open(writeFd, 'wb') as f:
+            for offset in range(0, size, len(block)):
+                f.write(block[:size - offset])
+        timings['producer_seconds'] = time.perf_counter() - started
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    with open(readFd, 'rb') as f:
+        client.stor_from(_FirstRead(f, started, timings), '/stream')
+    producer.join()
+    return timings
+
+
+class _FirstRead:
+    '''pipe reader which notes when first data was read'''
+    def __init__(self, f, started, timings):
+        self.f = f
+        self.started = started
+        self.timings = timings
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        if data and 'first_byte_seconds' not in self.timings:
+            self.timings['first_byte_seconds'] = \
+                time.perf_counter() - self.started
+        return data
+
+
+def _measure(case, mode, size, count, operation, repeat):
+    '''run operation repeat times with silenced output, report
+    median wall and cpu time and timings returned by operation'''
+    seconds = []
+    cpu = []
+    timings = {}
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            started, startedCpu = time.perf_counter(), time.process_time()
+            returned = operation()
+            if isinstance(returned, dict):
+                for name, value in returned.items():
+                    timings.setdefault(name, []).append(value)
+            seconds.append(time.perf_counter() - started)
+            cpu.append(time.process_time() - startedCpu)
+
+    elapsed = statistics.median(seconds)
+    result = {'case': case, 'mode': mode, 'size': size, 'count': count,
+              'seconds': elapsed,
+              'cpu_seconds': statistics.median(cpu),
+              'mb_per_s': size / elapsed / 1e6 if size else None,
+              'files_per_s': count / elapsed}
+    for name, values in timings.items():
+        result[name] = statistics.median(values)
+    return result
+
+
+def compare(baseline, report, tolerance=TOLERANCE):
+    '''get descriptions of cases which are slower than in baseline
+    by more than tolerance share'''
+    previous = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        base = previous.get(_key(result))
+        if base is None:
+            continue
+        metric = 'mb_per_s' if result['case'] in BYTE_CASES \
+            else 'files_per_s'
+        if result[metric] < base[metric] * (1 - tolerance):
+            regressions.append('{} {:.2f} is lower than {:.2f} of '
+                               'baseline in {}'.format(
+                                   metric, result[metric], base[metric],
+                                   ' '.join(map(str, _key(result)))))
+    return regressions
+
+
+def _key(result):
+    return (result['case'], result['mode'], result['size'], result['count'])
+
+
+def setup_parser():
+    '''configure arguments parser'''
+    parser = argparse.ArgumentParser(
+        description='Benchmark of ftp client against loopback server')
+    parser.add_argument('-s', '--sizes', type=sizes, default=sizes(SIZES),
+                        help='comma separated sizes of files for get and '
+                             'send, K, M and G suffixes are allowed, '
+                             'default: {}'.format(SIZES))
+    parser.add_argument('-c', '--counts', type=counts,
+                        default=counts(COUNTS),
+                        help='comma separated numbers of files for ls and '
+                             'recursive transfers, default: {}'
+                             .format(COUNTS))
+    parser.add_argument('-m', '--modes', type=modes, default=modes(MODES),
+                        help='comma separated modes of data connection, '
+                             'default: {}'.format(MODES))
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help='number of runs of every case, default: 3')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of sessions for transfers, default: 1')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='write report to FILE instead of stdout')
+    parser.add_argument('-w', '--workdir', metavar='DIRECTORY',
+                        help='directory for local files, tmpfs is '
+                             'preferred, default: system temp directory')
+    parser.add_argument('--baseline', metavar='FILE', default=BASELINE,
+                        help='report to compare with, run fails if some '
+                             'case is slower, default: {}'.format(BASELINE))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save report as baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed share of slowdown, default: {}'
+                             .format(TOLERANCE))
+    return parser
+
+
+def sizes(value):
+    '''argparse type for list of sizes with suffixes'''
+    result = []
+    for item in value.split(','):
+        item = item.strip().upper()
+        number, unit = (item[:-1], item[-1]) if item[-1:] in UNITS \
+            else (item, '')
+        if not number.isdigit():
+            raise argparse.ArgumentTypeError('Invalid size: ' + item)
+        result.append(int(number) * UNITS[unit])
+    return result
+
+
+def counts(value):
+    '''argparse type for list of positive numbers'''
+    try:
+        result = [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid counts: ' + value)
+    if min(result) <= 0:
+        raise argparse.ArgumentTypeError('Invalid counts: ' + value)
+    return result
+
+
+def modes(value):
+    '''argparse type for list of data connection modes'''
+    result = value.split(',')
+    if not set(result) <= {'pasv', 'active'}:
+        raise argparse.ArgumentTypeError('Invalid modes: ' + value)
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import collections
+import time
+
+
+class ListingCache:
+    '''lru cache of remote directory listings, keyed by (host, path),
+    every key holds listings of several kinds (LIST, NLST, MLSD)'''
+    def __init__(self, ttl=60, maxSize=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, kind):
+        '''get listing or None if it is missing or expired'''
+        listings = self._entries.get(key)
+        if listings is not None and kind in listings:
+            expires, value = listings[kind]
+            if expires > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del listings[kind]
+        self.misses += 1
+        return None
+
+    def put(self, key, kind, value):
+        '''store listing, evicting least recently used keys'''
+        listings = self._entries.setdefault(key, {})
+        listings[kind] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        '''drop all listings of key'''
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,99 @@
+import collections
+import hashlib
+import zlib
+
+
+ALGORITHMS = ('crc32', 'md5', 'sha256')
+# names of algorithms in FEAT, OPTS HASH and HASH replies
+HASH_NAMES = {'crc32': 'CRC32', 'md5': 'MD5', 'sha256': 'SHA-256'}
+# commands of servers which do not support HASH
+COMMANDS = {'crc32': 'XCRC', 'md5': 'XMD5', 'sha256': 'XSHA256'}
+DIGEST_LENGTHS = {'crc32': 8, 'md5': 32, 'sha256': 64}
+BLOCK_SIZE = 256 * 1024
+
+
+class Checksum:
+    '''incremental hash of transferred data by one of ALGORITHMS'''
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self._crc = 0
+        self._hash = None
+        if algorithm != 'crc32':
+            self._hash = hashlib.new(algorithm)
+
+    def update(self, data):
+        if self._hash is None:
+            self._crc = zlib.crc32(data, self._crc)
+        else:
+            self._hash.update(data)
+
+    def update_from_file(self, path, length):
+        '''hash first length bytes of local file, which were
+        transferred before resuming'''
+        with open(path, 'rb') as f:
+            while length > 0:
+                data = f.read(min(BLOCK_SIZE, length))
+                if not data:
+                    break
+                self.update(data)
+                length -= len(data)
+
+    def hexdigest(self):
+        if self._hash is None:
+            return '{:08x}'.format(self._crc)
+        return self._hash.hexdigest()
+
+
+class HashingFile:
+    '''file wrapper which hashes all data read from or written to it,
+    it has no fileno, so transfers do not bypass it by sendfile'''
+    __slots__ = ('file', 'checksum')
+
+    def __init__(self, file, checksum):
+        self.file = file
+        self.checksum = checksum
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.checksum.update(data)
+        return data
+
+    def write(self, data):
+        self.checksum.update(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+
+class Result(collections.namedtuple('Result', 'algorithm path local remote')):
+    '''checksum of transferred file, remote is None if server
+    can not hash files'''
+    __slots__ = ()
+
+    @property
+    def verified(self):
+        return self.remote is not None and self.remote == self.local
+
+    def __str__(self):
+        return '{} {}  {} ({})'.format(
+            self.algorithm, self.local, self.path,
+            'verified' if self.verified else 'not verified by server')
+
+
+def parse_digest(text, algorithm):
+    '''get hex digest from reply to HASH, XCRC, XMD5 or XSHA256,
+    None if there is no digest in it'''
+    length = DIGEST_LENGTHS[algorithm]
+    words = text.split()
+    if len(words) >= 4 and words[1].upper() == HASH_NAMES[algorithm]:
+        # 213 <algorithm> <range> <digest> <path>
+        words = words[:1] + words[3:4]
+    for word in reversed(words[1:]):
+        word = word.lower()
+        # servers drop leading zeros of crc32
+        fits = len(word) == length or (algorithm == 'crc32' and
+                                       0 < len(word) < length)
+        if fits and all(c in '0123456789abcdef' for c in word):
+            return word.zfill(length)
+    return None
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import contextlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+ERROR_EXCEPTION = 1
+ERROR_MODULES_MISSING = 2
+IDLE_TIMEOUT = 300
+KEEPALIVE = 60
+EVICT_INTERVAL = 10
+
+try:
+    import exceptions
+    import ftp
+    import ftpc
+except Exception as e:
+    print('Program modules not found: "{}"'.format(e), file=sys.stderr)
+    sys.exit(ERROR_MODULES_MISSING)
+
+
+class SessionPool:
+    '''logged in clients kept warm by host, port, user, password and
+    settings of request; client runs one request at a time, so concurrent
+    requests with same key open more sessions'''
+    def __init__(self, timeout=IDLE_TIMEOUT, keepalive=KEEPALIVE,
+                 clock=time.monotonic):
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.clock = clock
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(sessions) for sessions in self._idle.values())
+
+    @contextlib.contextmanager
+    def session(self, request):
+        '''take idle session for request or open new one, return it
+        to pool after use unless it was closed'''
+        key = (request['host'], request['port'], request['user'],
+               request['password'], request['encoding'], request['active'])
+        client = self._take(key) or self._open(request)
+        try:
+            yield client
+        finally:
+            if client.isConnected or client.isLost:
+                with self._lock:
+                    self._idle.setdefault(key, []).append(
+                        (client, self.clock()))
+
+    def evict(self, timeout=None):
+        '''close sessions idle for timeout seconds, return their number'''
+        timeout = self.timeout if timeout is None else timeout
+        deadline = self.clock() - timeout
+        expired = []
+        with self._lock:
+            for key, sessions in list(self._idle.items()):
+                expired += [client for client, used in sessions
+                            if used <= deadline]
+                sessions[:] = [(client, used) for client, used in sessions
+                               if used > deadline]
+                if not sessions:
+                    del self._idle[key]
+        for client in expired:
+            with contextlib.suppress(Exception):
+                client.exit()
+        return len(expired)
+
+    def close(self):
+        '''close all idle sessions'''
+        return self.evict(-1)
+
+    def _take(self, key):
+        with self._lock:
+            sessions = self._idle.get(key)
+            if not sessions:
+                return None
+            client, used = sessions.pop()
+            if not sessions:
+                del self._idle[key]
+            return client
+
+    def _open(self, request):
+        config = ftp.Config(encoding=request['encoding'],
+                            isActive=request['active'])
+        client = ftp.Client(config)
+        try:
+            client.connect(request['host'], request['port'])
+            client.login(request['user'], request['password'])
+        except Exception:
+            with contextlib.suppress(Exception):
+                client.close()
+            raise
+        if self.keepalive:
+            client.start_keepalive(self.keepalive)
+        return client
+
+
+class ThreadOutput:
+    '''replacement of sys.stdout which sends output of request threads
+    to their thin clients and output of other threads to default'''
+    def __init__(self, default):
+        self.default = default
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def redirect(self, stream):
+        self._local.stream = stream
+        try:
+            yield
+        finally:
+            self._local.stream = None
+
+    @property
+    def stream(self):
+        return getattr(self._local, 'stream', None) or self.default
+
+    def write(self, text):
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        try:
+            return self.stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+
+class Output:
+    '''text stream which sends each write to thin client'''
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        if text:
+            send_message(self.wfile, output=text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class Handler(socketserver.StreamRequestHandler):
+    '''run one command of thin client in warm session and stream
+    its output back'''
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            command, args = request['command'], request['args']
+        except (ValueError, KeyError, TypeError):
+            self.reply(error='Invalid request.')
+            return
+        if command not in ftpc.COMMANDS:
+            self.reply(error='?Invalid command')
+            return
+
+        try:
+            args = localize(command, args, request['cwd'])
+            with self.server.sessions.session(request) as client, \
+                    self.server.output.redirect(Output(self.wfile)):
+                resp = client.execute(command, *args)
+        except Exception as e:
+            self.reply(error=str(e).rstrip() or type(e).__name__)
+            return
+        if ftp.ERROR_PATTERN.match(resp):
+            self.reply(error=resp.rstrip())
+        else:
+            self.reply(reply=resp)
+
+    def reply(self, **message):
+        with contextlib.suppress(OSError):
+            send_message(self.wfile, **message)
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    '''server on unix socket which runs commands of thin clients
+    in sessions of SessionPool, socket is accessible only by owner'''
+    daemon_threads = True
+
+    def __init__(self, path, timeout=IDLE_TIMEOUT, keepalive=KEEPALIVE):
+        _make_directory(path)
+        _remove_stale_socket(path)
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(umask)
+        self.path = path
+        self.sessions = SessionPool(timeout, keepalive)
+        self.output = ThreadOutput(sys.stdout)
+        self._stopped = threading.Event()
+
+    def serve_forever(self, poll_interval=0.5):
+        '''serve requests and evict idle sessions until shutdown'''
+        sys.stdout = self.output
+        evictor = threading.Thread(target=self._evict, daemon=True)
+        evictor.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._stopped.set()
+            sys.stdout = self.output.default
+
+    def server_close(self):
+        super().server_close()
+        self.sessions.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+    def _evict(self):
+        interval = min(EVICT_INTERVAL, self.sessions.timeout / 2)
+        while not self._stopped.wait(interval):
+            self.sessions.evict()
+
+
+def send_message(wfile, **message):
+    wfile.write(json.dumps(message).encode() + b'\n')
+    wfile.flush()
+
+
+def localize(command, args, cwd):
+    '''make local paths of get and send relative to working directory
+    of thin client, names of remote files are defaulted to them
+    as given'''
+    args = list(args)
+    options = []
+    if '-j' in args:
+        index = args.index('-j')
+        options = args[index:index + 2]
+        del args[index:index + 2]
+    if command in ('get', 'reget') and args:
+        local = args[1] if len(args) > 1 and args[1] else args[0]
+        if local == '-':
+            raise exceptions.FailedOperationException(
+                'Daemon can not write data to stdout of thin client')
+        args[1:2] = [os.path.join(cwd, os.path.expanduser(local))]
+    elif command in ('send', 'reput') and args:
+        if args[0] == '-':
+            raise exceptions.FailedOperationException(
+                'Daemon can not read data from stdin of thin client')
+        remote = args[1] if len(args) > 1 and args[1] else args[0]
+        args[:2] = [os.path.join(cwd, os.path.expanduser(args[0])), remote]
+    return args + options
+
+
+def _make_directory(path):
+    '''make directory of socket accessible only by user, directory of
+    default socket must be private, as other users could replace
+    socket in it'''
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.mkdir(directory, 0o700)
+    if path == ftpc.socket_path() and not ftpc.is_private(directory):
+        raise exceptions.FailedOperationException(
+            'Directory {} is accessible by other users'.format(directory))
+
+
+def _remove_stale_socket(path):
+    '''remove socket left by killed daemon, fail if daemon is running'''
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise exceptions.FailedOperationException(
+        'Daemon is already running on {}'.format(path))
+
+
+def main():
+    parser = setup_parser()
+    args = parser.parse_args()
+    try:
+        daemon = Daemon(args.socket, args.idle_timeout, args.keepalive)
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(ERROR_EXCEPTION)
+
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    print('Listening on {}'.format(args.socket))
+    with contextlib.suppress(KeyboardInterrupt), daemon:
+        daemon.serve_forever()
+
+
+def setup_parser():
+    '''configure arguments parser'''
+    parser = argparse.ArgumentParser(
+        description='Daemon which keeps ftp sessions logged in for '
+                    'commands of ftpc.py')
+    parser.add_argument('-S', '--socket', dest='socket',
+                        default=ftpc.socket_path(),
+                        help='unix socket to listen on, '
+                             'default: {}'.format(ftpc.socket_path()))
+    parser.add_argument('--idle-timeout', dest='idle_timeout',
+                        default=IDLE_TIMEOUT, type=float, metavar='SECONDS',
+                        help='close sessions unused for SECONDS, '
+                             'default: {}'.format(IDLE_TIMEOUT))
+    parser.add_argument('--keepalive', dest='keepalive',
+                        default=KEEPALIVE, type=float, metavar='SECONDS',
+                        help='send NOOP in idle sessions after SECONDS, '
+                             '0 disables it, default: {}'.format(KEEPALIVE))
+    return parser
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import socket
+
+
 class NotConnectedException(Exception):
     pass
 
@@ -8,3 +11,9 @@ class FailedOperationException(Exception):
 
 class TimeoutException(Exception):
     pass
+
+
+# failures of connection after which transfer is repeated, unlike errors
+# of local files which are raised at once
+NETWORK_ERRORS = (socket.timeout, ConnectionError, TimeoutException,
+                  NotConnectedException)
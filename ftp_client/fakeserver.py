@@ -1,3 +1,6 @@
+import asyncio
+
+
 class FakeServer:
     def __init__(self, addr, mockSock):
         self.mockSock = mockSock
@@ -15,7 +18,13 @@ class FakeServer:
                      b'MKD': self.mkdir,
                      b'PORT': self.port,
                      b'QUIT': self.quit,
-                     b'SIZE': self.size}
+                     b'SIZE': self.size,
+                     b'REST': self.rest,
+                     b'APPE': self.appe,
+                     b'PWD': self.pwd,
+                     b'FEAT': self.feat,
+                     b'MLSD': self.mlsd,
+                     b'NOOP': self.noop}
 
         self.files = [b'file1', b'file2', b'file3']
         self.data = {b'file1': b'file1data', b'file2': b'file2data',
@@ -30,15 +39,17 @@ class FakeServer:
                         {b'myfile1': b'myfile1data',
                          b'myfile2': b'myfile2data'})}
         self.currentDir = 'root'
+        self.restOffset = 0
+        self.stored = None
 
     def connect(self, *args):
         if self.addr != 'dataServ':
             self.mockSock.return_value.recv.return_value = b'220 smth\r\n'
 
-    def send(self, cmd):
-        cmd = cmd[:-2]
-        command, *args = cmd.split(b' ')
-        self.cmds[command](*args)
+    def send(self, data):
+        for cmd in data.split(b'\r\n')[:-1]:
+            command, *args = cmd.split(b' ')
+            self.cmds[command](*args)
 
     def pasv(self, *args):
         if self.dataServ is None:
@@ -56,7 +67,8 @@ class FakeServer:
             self.mockSock.return_value.recv.return_value =\
                 b'550 No such file or directory\r\n'
         else:
-            self.dataServ.data = self.data[name]
+            self.dataServ.data = self.data[name][self.restOffset:]
+            self.restOffset = 0
             self.mockSock.return_value.recv.return_value =\
                 b'226 Transfer complete.\r\n'
 
@@ -85,6 +97,7 @@ class FakeServer:
         mockObject().send.side_effect = self.dataServ.send_data
         mockObject().sendall.side_effect = self.dataServ.send_all_data
         mockObject().recv.side_effect = self.dataServ.recv_data
+        mockObject().recv_into.side_effect = self.dataServ.recv_data_into
         mockObject().makefile.side_effect = self.dataServ.recv_data_list
         return mockObject
 
@@ -93,11 +106,18 @@ class FakeServer:
 
     def send_all_data(self, data):
         self.data = data
-        self.parentServ.data[self.parentServ.files[-1]] = data
+        name, prefix = self.parentServ.stored
+        self.parentServ.data[name] = prefix + data
 
     def recv_data(self, *args, **kwargs):
         return self.data
 
+    def recv_data_into(self, buffer, *args):
+        chunk = self.data[:len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.data = self.data[len(chunk):]
+        return len(chunk)
+
     def recv_data_list(self, *args, encoding=None):
         if encoding is not None:
             if isinstance(self.data, list):
@@ -105,6 +125,7 @@ class FakeServer:
                 return self.data
 
             self.data = self.data.decode(encoding)
+            return self.data.splitlines(keepends=True)
         return [self.data]
 
     def enter_user(self, name):
@@ -121,8 +142,38 @@ class FakeServer:
     def stor(self, name):
         self.files.append(name)
         self.data[name] = self.dataServ.data
+        self.stored = (name, b'')
+        self.mockSock().recv.return_value = b'226 Transfer complete.\r\n'
+
+    def appe(self, name):
+        if name not in self.files:
+            self.files.append(name)
+        self.stored = (name, self.data.get(name, b''))
         self.mockSock().recv.return_value = b'226 Transfer complete.\r\n'
 
+    def rest(self, offset):
+        self.restOffset = int(offset)
+        self.mockSock().recv.return_value = b'350 Restarting.\r\n'
+
+    def feat(self, *args):
+        self.mockSock().recv.return_value =\
+            b'211-Features:\r\n MLSD\r\n SIZE\r\n211 End\r\n'
+
+    def mlsd(self, *args):
+        lines = [b'type=file;size=%d; %s' % (len(self.data[name]), name)
+                 for name in self.files]
+        lines += [b'type=dir; ' + name for name in self.dirs]
+        self.dataServ.data = b'\n'.join(lines) + b'\n'
+        self.mockSock.return_value.recv.return_value =\
+            b'226 Transfer complete.\r\n'
+
+    def pwd(self, *args):
+        self.mockSock().recv.return_value =\
+            b'257 "/" is the current directory\r\n'
+
+    def noop(self, *args):
+        self.mockSock().recv.return_value = b'200 NOOP ok.\r\n'
+
     def nlst(self, *args):
         self.dataServ.data = self.files
 
@@ -141,3 +192,100 @@ class FakeServer:
 
     def size(self, name):
         self.mockSock.return_value.recv.return_value = b'213 20\r\n'
+
+
+class AsyncFakeServer:
+    '''small ftp server on asyncio streams for testing of async client'''
+    def __init__(self):
+        self.files = {'file1': b'file1data', 'file2': b'file2data'}
+        self.dirs = {'mydir'}
+        self.users = {'me': 'qwerty'}
+        self.delay = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        session = {'user': None, 'data': None}
+        writer.write(b'220-Welcome\r\n220-to fake\r\n220 server\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command, _, arg = line.decode().rstrip('\r\n').partition(' ')
+            resp = await self.process(session, command, arg, writer)
+            writer.write(resp.encode() + b'\r\n')
+            await writer.drain()
+            if command == 'QUIT':
+                break
+        writer.close()
+
+    async def process(self, session, command, arg, writer):
+        if command == 'USER':
+            session['user'] = arg
+            return '331 Please specify the password.'
+        if command == 'PASS':
+            if self.users.get(session['user']) == arg:
+                return '230 Login successful.'
+            return '530 Login incorrect.'
+        if command == 'TYPE':
+            return '200 Switching to Binary mode.'
+        if command == 'CWD':
+            if arg in self.dirs:
+                return '250 Directory successfully changed.'
+            return '550 Failed to change directory.'
+        if command == 'MKD':
+            self.dirs.add(arg)
+            return '257 "{}" created'.format(arg)
+        if command == 'SIZE':
+            if arg not in self.files:
+                return '550 Could not get file size.'
+            return '213 {}'.format(len(self.files[arg]))
+        if command == 'PASV':
+            connected = asyncio.get_running_loop().create_future()
+            server = await asyncio.start_server(
+                lambda r, w: connected.set_result((r, w)), '127.0.0.1', 0)
+            session['data'] = (server, connected)
+            port = server.sockets[0].getsockname()[1]
+            return '227 Entering Passive Mode (127,0,0,1,{},{}).'.format(
+                port // 256, port % 256)
+        if command == 'PORT':
+            numbers = arg.split(',')
+            host = '.'.join(numbers[:4])
+            port = int(numbers[4]) * 256 + int(numbers[5])
+            session['data'] = (None, (host, port))
+            return '200 PORT command successful.'
+        if command in ('RETR', 'STOR', 'LIST'):
+            if command == 'RETR' and arg not in self.files:
+                return '550 Failed to open file.'
+            writer.write(b'150 Opening data connection.\r\n')
+            reader, dataWriter = await self.open_data(session)
+            if command == 'STOR':
+                self.files[arg] = await reader.read()
+            elif command == 'RETR':
+                dataWriter.write(self.files[arg])
+                await dataWriter.drain()
+            else:
+                for name in sorted(self.files):
+                    await asyncio.sleep(self.delay)
+                    dataWriter.write(name.encode() + b'\r\n')
+                    await dataWriter.drain()
+            dataWriter.close()
+            return '226 Transfer complete.'
+        if command == 'QUIT':
+            return '221 Goodbye.'
+        return '500 Unknown command.'
+
+    async def open_data(self, session):
+        server, connected = session['data']
+        if server is None:
+            return await asyncio.open_connection(*connected)
+        reader, writer = await connected
+        server.close()
+        return reader, writer
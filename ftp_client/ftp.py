@@ -1,10 +1,31 @@
 import exceptions as exc
 import re
+import sys
 import socket
+import select
+import stat
 import os
+import posixpath
 import help
 import contextlib
+import fnmatch
+import functools
+import time
+import threading
+import io
+import zlib
+import mmap
 import progress
+import parallel
+import reply
+import listing
+import cache
+import mirror
+import throttle
+import metrics
+import keepalive
+import checksum
+import pipeline
 
 
 TIMEOUT = 10
@@ -12,39 +33,129 @@ ENCODING = 'utf-8'
 END_OF_COMMAND = '\r\n'
 DEBUG = False
 IS_ACTIVE = False
+BUFFER_SIZE = 256 * 1024
+JOBS = 1
+BATCH_WINDOW = 64
+RESUME = False
+RETRIES = 3
+RETRY_DELAY = 1
+CACHE_TTL = 0
+CACHE_SIZE = 256
+LIMIT_RATE = 0
+TRANSFER_LIMIT_RATE = 0
+COMPRESSION = 0
+CHECKSUM = None
+WRITE_BUFFERS = pipeline.DEPTH
+MMAP = False
+EPSV = False
+PREFETCH = False
+# seconds after which prefetched data channel is not trusted
+PREFETCH_TTL = 5
 ERROR_PATTERN = re.compile(r'[4|5].*')
+IDEMPOTENT_VERBS = {'CWD', 'PWD', 'SIZE', 'MDTM', 'FEAT', 'TYPE', 'MLST',
+                    'SYST', 'STAT', 'XCRC', 'XMD5', 'XSHA256'}
+
+
+class Config:
+    '''settings of one Client, module constants are their defaults,
+    sessions spawned by client share its config'''
+    def __init__(self, **settings):
+        self.timeout = TIMEOUT
+        self.encoding = ENCODING
+        self.debug = DEBUG
+        self.isActive = IS_ACTIVE
+        self.bufferSize = BUFFER_SIZE
+        self.jobs = JOBS
+        self.batchWindow = BATCH_WINDOW
+        self.resume = RESUME
+        self.retries = RETRIES
+        self.retryDelay = RETRY_DELAY
+        self.cacheTtl = CACHE_TTL
+        self.cacheSize = CACHE_SIZE
+        self.limitRate = LIMIT_RATE
+        self.transferLimitRate = TRANSFER_LIMIT_RATE
+        self.compression = COMPRESSION
+        self.checksum = CHECKSUM
+        self.writeBuffers = WRITE_BUFFERS
+        self.mmap = MMAP
+        self.epsv = EPSV
+        self.prefetch = PREFETCH
+        for name, value in settings.items():
+            if not hasattr(self, name):
+                raise TypeError('Unknown setting: {}'.format(name))
+            setattr(self, name, value)
 
 
 class Client:
-    def __init__(self):
-        self.UNDEMANDING_COMMANDS = {'exit', 'quit', 'reconnect', 'help'}
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.UNDEMANDING_COMMANDS = {'exit', 'quit', 'reconnect', 'help',
+                                     'rate', 'stats'}
+        self.IDEMPOTENT_COMMANDS = {'ls', 'cd', 'pwd', 'get', 'sizes',
+                                    'help', 'stats'}
 
         self.commands = {
             'ls': self.ls,
             'cd': self.cd,
-            'get': self.get,
+            'pwd': self.pwd,
+            'get': _with_jobs_option(self.get, self.config),
             'reconnect': self.reconnect,
             'close': self.close,
             'exit': self.exit,
             'quit': self.exit,
             'help': self.help,
-            'send': self.send}
+            'send': _with_jobs_option(self.send, self.config),
+            'sizes': self.sizes,
+            'reget': self.reget,
+            'reput': self.reput,
+            'mirror': self.mirror,
+            'rate': self.rate,
+            'stats': self.stats}
 
+        self.progress = None
+        self.metrics = metrics.Metrics()
+        self.limit = throttle.TokenBucket(self.config.limitRate)
+        self.transferRate = self.config.transferLimitRate
+        self.cache = None
+        if self.config.cacheTtl > 0:
+            self.cache = cache.ListingCache(self.config.cacheTtl,
+                                            self.config.cacheSize)
+        self.keepalive = None
+        self.checksums = {}
+        self.isLost = False
+        self._userName = None
+        self._workdir = '.'
+        self._lock = threading.RLock()
+        self._lastActivity = time.monotonic()
+        self._prefetched = None
+        self._pendingSetup = None
         self._adjust()
 
     def _adjust(self, needToReconnect=False):
         '''update client state after disconnecting or for first usage'''
         self.isConnected = False
         self.timeToExit = False
-        self.sock = socket.socket()
-        self.sock.settimeout(TIMEOUT)
+        self._new_control_socket(socket.AF_INET)
+        self._features = None
+        self._mode = None
+        self._cwd = None
+        self._epsv = None
+        self._drop_prefetched()
 
         if needToReconnect:
             print(self.connect(self.hostName, self.port))
             return self.login(self._userName, self._password)
 
+    def _new_control_socket(self, family):
+        self.sock = socket.socket(family)
+        self.sock.settimeout(self.config.timeout)
+        self._replies = reply.ReplyReader(self.sock, self.config.encoding)
+
     def _setup_connection(self, host, port):
         '''configure client at connection'''
+        if ':' in host:
+            self.sock.close()
+            self._new_control_socket(socket.AF_INET6)
         try:
             self.sock.connect((host, port))
         except socket.timeout:
@@ -54,77 +165,330 @@ class Client:
         self.isConnected = True
         self.hostName = host
         self.port = port
+        self._replies.encoding = self.config.encoding
 
     def enter_pasv(self):
-        '''enter passive mode'''
-        resp = self.send_cmd('PASV')
+        '''enter passive mode by EPSV or PASV'''
+        with self.metrics.timer('ftp_phase_seconds', phase='pasv'):
+            command = self._passive_command()
+            resp = self.send_cmd(command)
+            if command == 'EPSV' and self._refuses_extended(resp):
+                resp = self.send_cmd('PASV')
+            sock = socket.socket(self.sock.family)
+            sock.connect(self._passive_address(resp))
+            sock.settimeout(self.config.timeout)
+        return sock
+
+    def enter_active_mode(self):
+        '''enter active mode by EPRT or PORT'''
+        self.dataSock = self._listen()
+        command = self._active_command(self.dataSock)
+        resp = self.send_cmd(*command)
+        if command[0] == 'EPRT' and self._refuses_extended(resp):
+            self.send_cmd(*self._active_command(self.dataSock))
+        return self.dataSock
+
+    def _extended(self):
+        '''use EPSV and EPRT, IPv6 has no other way'''
+        if self.sock.family == socket.AF_INET6:
+            return True
+        return self.config.epsv and self._epsv is not False
+
+    def _refuses_extended(self, resp):
+        '''fall back to PASV and PORT if server of IPv4 session
+        does not know EPSV or EPRT'''
+        if not resp.startswith('5') or self.sock.family == socket.AF_INET6:
+            return False
+        self._epsv = False
+        return True
+
+    def _passive_command(self):
+        return 'EPSV' if self._extended() else 'PASV'
+
+    def _passive_address(self, resp):
+        '''get address of data channel from reply to EPSV or PASV,
+        EPSV gives only port of host of control connection'''
+        if resp.startswith('229'):
+            searchResult = re.search(r'\((.)\1\1(\d+)\1\)', resp)
+            if not searchResult:
+                raise exc.FailedOperationException(resp)
+            return self.sock.getpeername()[0], int(searchResult.group(2))
+
         searchResult = re.match(r'.*\(((?:\d+,){5}\d+)\)', resp)
         if not searchResult:
             raise exc.FailedOperationException(resp)
-
         data = searchResult.group(1).split(',')
         dataHost = '.'.join(data[:4])
         dataPort = int(data[4]) * 2**8 + int(data[5])
+        return dataHost, dataPort
 
-        sock = socket.socket()
-        sock.connect((dataHost, dataPort))
-        sock.settimeout(TIMEOUT)
+    def _listen(self):
+        '''open socket for data connection of active mode'''
+        sock = socket.socket(self.sock.family)
+        sock.settimeout(self.config.timeout)
+        sock.bind(('', 0))
+        sock.listen(1)
         return sock
 
-    def enter_active_mode(self):
-        '''enter active mode'''
-        self.dataSock = socket.socket()
-        self.dataSock.settimeout(TIMEOUT)
-        self.dataSock.bind(('', 0))
-        self.dataSock.listen(1)
-
-        host = self.sock.getsockname()[0].replace('.', ',') + ','
-        port = self.dataSock.getsockname()[1]
-        port = '{},{}'.format(port // 256, port % 256)
-        portArgs = host + port
-
-        self.send_cmd('PORT', portArgs)
-        return self.dataSock
+    def _active_command(self, listener):
+        '''get EPRT or PORT command with address of listener'''
+        host = self.sock.getsockname()[0]
+        port = listener.getsockname()[1]
+        if self._extended():
+            return 'EPRT', '|{}|{}|{}|'.format(2 if ':' in host else 1,
+                                               host, port)
+        return 'PORT', '{},{},{}'.format(host.replace('.', ','),
+                                         port // 256, port % 256)
 
     def _disconnect(self, needToReconnect=False):
         '''close connection'''
         self.sock.close()
         return self._adjust(needToReconnect)
 
-    def _prepare_before_get_data(self, cmd, *params):
-        '''enter mode and send command'''
-        cmd = ' '.join((cmd, *params)) + END_OF_COMMAND
+    def _lose_connection(self):
+        '''close broken control connection, next command restores it
+        if client has logged in'''
+        self.isLost = self._userName is not None
+        self._disconnect()
 
-        if IS_ACTIVE:
-            sock = self.enter_active_mode()
-        else:
-            sock = self.enter_pasv()
+    def _restore_connection(self):
+        '''connect and login again if connection was lost, return to
+        remote working directory of lost session'''
+        if self.isConnected or not self.isLost:
+            return
+        self.isLost = False
+        directory = self._workdir
+        try:
+            self.metrics.count('ftp_reconnects_total')
+            self.connect(self.hostName, self.port)
+            self.login(self._userName, self._password)
+            if directory != '.':
+                self.cd(directory)
+        except Exception:
+            self._lose_connection()
+            self._workdir = directory
+            raise
+
+    def _prepare_before_get_data(self, cmd, *params, offset=None):
+        '''enter mode and send command, data channel prefetched by
+        previous transfer is used if there is one; REST offset is sent
+        right before command, as setup of channel can reset it'''
+        started = time.monotonic()
+        with self.metrics.timer('ftp_phase_seconds', phase='data_connection',
+                                command=cmd):
+            cmd = ' '.join((cmd, *params)) + END_OF_COMMAND
+
+            self._restore_connection()
+            self._negotiate_mode()
+            sock = self._take_prefetched()
+            prefetched = sock is not None
+            if not prefetched:
+                sock = self._open_data_channel()
+
+            if cmd.startswith(('STOR ', 'APPE ')):
+                self._invalidate(posixpath.dirname(params[0]))
+
+            self._restart(sock, offset)
+            if self.config.prefetch:
+                # in one segment, so Nagle does not hold prefetch request
+                self._send_line(cmd + self._prefetch())
+            else:
+                self._send_line(cmd)
+            resp = self._read_reply()
+            if resp.is_error:
+                # server replies to prefetch request after command
+                self._finish_prefetch()
+            if prefetched and resp.code == '425':
+                # server has dropped prefetched channel
+                sock.close()
+                sock = self._take_prefetched() or self._open_data_channel()
+                self._restart(sock, offset)
+                self._send_line(cmd)
+                resp = self._read_reply()
+            if resp.is_error:
+                sock.close()
+                raise exc.FailedOperationException(resp.text)
+            self._lastResp = resp.text
+
+            if self.config.isActive:
+                conn, addr = sock.accept()
+                sock.close()
+                sock = conn
+        if self.config.debug:
+            print('Data connection: {:.1f} ms{}'.format(
+                (time.monotonic() - started) * 1000,
+                ', prefetched' if prefetched else ''))
+        return sock
 
-        self.sock.sendall(cmd.encode(ENCODING))
-        resp = get_resp(self.sock)
-        if ERROR_PATTERN.match(resp):
+    def _restart(self, sock, offset):
+        '''set restart marker of next transfer command'''
+        if offset is None:
+            return
+        resp = self.send_cmd('REST', str(offset))
+        if not resp.startswith('350'):
+            sock.close()
             raise exc.FailedOperationException(resp)
-        self._lastResp = resp
 
-        if IS_ACTIVE:
-            conn, addr = sock.accept()
-            sock = conn
+    def _open_data_channel(self):
+        if self.config.isActive:
+            return self.enter_active_mode()
+        return self.enter_pasv()
+
+    def _prefetch(self):
+        '''get request of data channel of next transfer, which is sent
+        with command of current one, server replies to it after final
+        reply of transfer, so it costs no round trip'''
+        isActive = self.config.isActive
+        listener = None
+        if isActive:
+            listener = self._listen()
+            command = self._active_command(listener)
+        else:
+            command = (self._passive_command(),)
+        self._pendingSetup = (listener, isActive, command[0])
+        return ' '.join(command) + END_OF_COMMAND
+
+    def _finish_transfer(self):
+        '''read final reply of transfer and reply to prefetch request
+        sent with it'''
+        resp = self._get_resp()
+        self._finish_prefetch()
+        return resp
+
+    def _finish_prefetch(self):
+        '''read reply to prefetch request, connect passive channel
+        without waiting, so it is ready for next transfer'''
+        if self._pendingSetup is None:
+            return
+        listener, isActive, command = self._pendingSetup
+        self._pendingSetup = None
+        try:
+            setup = self._read_reply()
+            if setup.is_error:
+                if command in ('EPSV', 'EPRT'):
+                    self._refuses_extended(setup.text)
+                raise exc.FailedOperationException(setup.text)
+            sock = listener or self._connect_later(
+                self._passive_address(setup.text))
+        except (OSError, exc.FailedOperationException,
+                exc.TimeoutException, exc.NotConnectedException):
+            # next transfer sets data channel up itself
+            if listener is not None:
+                listener.close()
+            return
+        self._prefetched = (sock, isActive, time.monotonic())
+
+    def _connect_later(self, address):
+        '''start connecting socket to address without waiting'''
+        sock = socket.socket(self.sock.family)
+        sock.setblocking(False)
+        sock.connect_ex(address)
         return sock
 
+    def _take_prefetched(self):
+        '''get data channel prefetched for this transfer, None if there
+        is no usable one'''
+        if self._prefetched is None:
+            return None
+        sock, isActive, stamp = self._prefetched
+        self._prefetched = None
+        usable = (isActive == self.config.isActive and
+                  time.monotonic() - stamp < PREFETCH_TTL)
+        if usable and not isActive:
+            _, writable, _ = select.select([], [sock], [],
+                                           self.config.timeout)
+            usable = writable and not sock.getsockopt(socket.SOL_SOCKET,
+                                                      socket.SO_ERROR)
+        if not usable:
+            sock.close()
+            return None
+        sock.settimeout(self.config.timeout)
+        return sock
+
+    def _drop_prefetched(self):
+        if self._prefetched is not None:
+            self._prefetched[0].close()
+            self._prefetched = None
+        if self._pendingSetup is not None and self._pendingSetup[0]:
+            self._pendingSetup[0].close()
+        self._pendingSetup = None
+
     def send_cmd(self, cmd, *params):
         '''send a command to remote server and return resp'''
+        return self.request(cmd, *params).text
+
+    def request(self, cmd, *params):
+        '''send a command to remote server and return parsed reply,
+        restore lost connection before it, idempotent commands are sent
+        once more if connection is lost while waiting for reply'''
+        self._restore_connection()
+        try:
+            return self._request(cmd, *params)
+        except (OSError, exc.TimeoutException, exc.NotConnectedException):
+            if _verb(cmd) not in IDEMPOTENT_VERBS or not self.isLost:
+                raise
+        self._restore_connection()
+        return self._request(cmd, *params)
+
+    def _request(self, cmd, *params):
+        '''send a command once and read its reply'''
+        timer = self.metrics.timer('ftp_command_seconds', command=_verb(cmd))
         cmd = ' '.join((cmd, *params)) + END_OF_COMMAND
 
+        with timer:
+            self._send_line(cmd)
+            resp = self._read_reply()
+
+        if resp.code == '421':
+            self._lose_connection()
+            raise exc.TimeoutException(resp.text)
+        return resp
+
+    def _send_line(self, line):
+        '''send command line to control connection'''
         try:
-            self.sock.sendall(cmd.encode(ENCODING))
-            resp = get_resp(self.sock)
-        except socket.timeout:
-            self._disconnect()
+            self.sock.sendall(line.encode(self.config.encoding))
+        except OSError:
+            self._lose_connection()
             raise
 
-        if resp.startswith('421'):
-            self._disconnect()
-            raise exc.TimeoutException(resp)
+    def batch(self, commands, window=None):
+        '''send commands without waiting for their replies, keeping at
+        most window of them unanswered, return replies in order'''
+        window = window or self.config.batchWindow
+        commands = [' '.join(command) + END_OF_COMMAND
+                    for command in commands]
+        replies = []
+        sent = 0
+
+        self._restore_connection()
+        while len(replies) < len(commands):
+            waiting = sent - len(replies)
+            if sent < len(commands) and waiting <= window // 2:
+                chunk = commands[sent:len(replies) + window]
+                self._send_line(''.join(chunk))
+                sent += len(chunk)
+            resp = self._read_reply()
+            if resp.code == '421':
+                self._lose_connection()
+                raise exc.TimeoutException(resp.text)
+            replies.append(resp)
+        return replies
+
+    def _get_resp(self):
+        '''read next resp from control connection'''
+        return self._read_reply().text
+
+    def _read_reply(self):
+        '''read next reply, counting negative ones in metrics'''
+        try:
+            resp = self._replies.read()
+        except (OSError, exc.NotConnectedException):
+            self._lose_connection()
+            raise
+        self._lastActivity = time.monotonic()
+        if resp.is_error:
+            self.metrics.count('ftp_error_replies_total', code=resp.code)
         return resp
 
     def connect(self, host='', port=21, *args):
@@ -135,7 +499,7 @@ class Client:
                       'use close first.'.format(self.hostName))
 
         self._setup_connection(host, port)
-        resp = get_resp(self.sock)
+        resp = self._get_resp()
 
         if resp.startswith('421'):
             self._disconnect()
@@ -162,63 +526,526 @@ class Client:
 
         self._userName = name
         self._password = password
+        self._workdir = '.'
         return resp
 
     def ls(self, directoryName='', *args):
         '''list contents of remote directory'''
-        sock = self._prepare_before_get_data('LIST', directoryName)
+        if self.cache is not None:
+            lines, resp = self._cached('LIST', directoryName,
+                                       self._list_lines)
+            for line in lines:
+                print(line)
+            return resp
 
-        with sock:
-            if DEBUG:
-                print(self._lastResp)
-            for line in sock.makefile(encoding=ENCODING):
-                print(line[:-1])
+        for line in self.iter_list(directoryName):
+            print(line)
+        return self._lastResp
+
+    def iter_list(self, directoryName=''):
+        '''yield lines of LIST of remote directory while they arrive,
+        control connection is busy until generator is exhausted
+        or closed'''
+        return self._iter_lines('LIST', directoryName)
+
+    def _iter_lines(self, cmd, *params):
+        '''yield lines of listing from data connection, keep final
+        resp in _lastResp'''
+        sock = self._prepare_before_get_data(cmd, *params)
+        with self._finishing_transfer():
+            with sock, self._data_file(sock) as lines:
+                if self.config.debug:
+                    print(self._lastResp)
+                for line in lines:
+                    yield line.rstrip('\n')
+
+    @contextlib.contextmanager
+    def _finishing_transfer(self):
+        '''read final reply of transfer inside to _lastResp, also when
+        generator of transfer is closed before its end'''
+        try:
+            yield
+        except GeneratorExit:
+            # server aborts transfer whose data connection is closed
+            with contextlib.suppress(OSError, exc.TimeoutException,
+                                     exc.NotConnectedException):
+                self._finish_transfer()
+            raise
+        self._lastResp = self._finish_transfer()
+
+    def _list_lines(self, directoryName):
+        '''get lines of LIST and final resp'''
+        lines = list(self.iter_list(directoryName))
+        return lines, self._lastResp
+
+    def _cached(self, kind, directoryName, load):
+        '''get listing of directory from cache or by load function'''
+        if self.cache is None:
+            return load(directoryName)
+        key = (self.hostName, self.absolute_path(directoryName))
+        value = self.cache.get(key, kind)
+        if value is None:
+            value = load(directoryName)
+            self.cache.put(key, kind, value)
+        return value
+
+    def _invalidate(self, directoryName):
+        '''drop cached listings of remote directory'''
+        if self.cache is not None:
+            self.cache.invalidate(
+                (self.hostName, self.absolute_path(directoryName)))
+
+    def absolute_path(self, path=''):
+        '''get absolute remote path for path relative to working directory'''
+        if self._cwd is None:
+            self._cwd = self._remote_dir() or '/'
+        return posixpath.normpath(posixpath.join(self._cwd, path))
+
+    def features(self):
+        '''get set of extensions supported by server from FEAT'''
+        if self._features is None:
+            resp = self.request('FEAT')
+            self._features = set()
+            if resp.code == '211':
+                for line in resp.lines[1:-1]:
+                    words = line.upper().split()
+                    if words:
+                        self._features.update((words[0], ' '.join(words)))
+        return self._features
+
+    def _negotiate_mode(self):
+        '''switch data connections to MODE Z once per connection if
+        compression is enabled and server supports it, stay in MODE S
+        otherwise, return transfer mode'''
+        if self._mode is None:
+            self._mode = 'S'
+            if (self.config.compression and 'MODE Z' in self.features() and
+                    not self.request('MODE', 'Z').is_error):
+                self._mode = 'Z'
+                self.request('OPTS', 'MODE', 'Z', 'LEVEL',
+                             str(self.config.compression))
+        return self._mode
 
-        return get_resp(self.sock)
+    @contextlib.contextmanager
+    def _data_file(self, sock):
+        '''get text file of listing which reads data connection
+        while it is read'''
+        if self._mode != 'Z':
+            yield sock.makefile(encoding=self.config.encoding)
+            return
+        with self.metrics.transfer('in', metrics.Meter()) as meter:
+            raw = _ChunkReader(self._inflated_chunks(sock, meter))
+            with io.TextIOWrapper(io.BufferedReader(raw),
+                                  encoding=self.config.encoding,
+                                  newline=None) as f:
+                yield f
+
+    def mlsd(self, directoryName='', *args):
+        '''get list of entries of remote directory by MLSD,
+        or by parsing unix LIST format if server does not support it'''
+        return self._cached('MLSD', directoryName, self._mlsd)
+
+    def _mlsd(self, directoryName):
+        '''get list of entries from server'''
+        params = (directoryName,) if directoryName else ()
+        if self.features() & {'MLST', 'MLSD'}:
+            lines = self._iter_lines('MLSD', *params)
+            parse = listing.parse_mlsd_line
+        else:
+            lines = self._iter_lines('LIST', *params)
+            parse = listing.parse_unix_line
+
+        entries = []
+        unparsed = False
+        for line in lines:
+            entry = parse(line)
+            if entry is None:
+                if line.strip() and not line.startswith('total'):
+                    unparsed = True
+            elif (entry.name not in ('.', '..')
+                    and entry.type not in ('cdir', 'pdir')):
+                entries.append(entry)
+        if not entries and unparsed:
+            # listing is not in unix format, for example of IIS, so types
+            # of entries are unknown and get finds them by CWD
+            entries = [listing.Entry(posixpath.basename(name), type=None)
+                       for name in self._load_nlst(directoryName)]
+        return entries
+
+    def mlst(self, path='', *args):
+        '''get entry of remote file by MLST'''
+        if 'MLST' not in self.features():
+            raise exc.FailedOperationException(
+                  'Server does not support MLST')
+        resp = self.request('MLST', *((path,) if path else ()))
+        if resp.is_error or len(resp.lines) < 3:
+            raise exc.FailedOperationException(resp.text)
+        return listing.parse_mlsd_line(resp.lines[1].lstrip())
 
     def cd(self, directoryName='', *args):
         '''change remote working directory'''
-        return self.send_cmd('CWD', directoryName)
+        resp = self.send_cmd('CWD', directoryName)
+        if resp.startswith('2'):
+            self._workdir = posixpath.normpath(
+                posixpath.join(self._workdir, directoryName))
+            if self._cwd is not None:
+                self._cwd = posixpath.normpath(
+                    posixpath.join(self._cwd, directoryName))
+        return resp
 
-    def get(self, remoteFile='', localFile='', *args):
-        '''receive file'''
+    def get(self, remoteFile='', localFile='', *args, jobs=1):
+        '''receive file, local file "-" is stdout'''
+        if localFile == '-':
+            return self._get_to_stdout(remoteFile)
         localFile = localFile or remoteFile
         localFile = os.path.expanduser(localFile)
         resp = self.cd(remoteFile)
         if not resp.startswith('5'):
             self.cd('..')
-            return self._get_dir(remoteFile, localFile)
+            if jobs > 1:
+                return self._get_dir_parallel(remoteFile, localFile, jobs)
+            with self._aggregate_progress():
+                return self._get_dir(remoteFile, localFile)
+        return self.get_file(remoteFile, localFile, jobs)
+
+    def get_file(self, remoteFile, localFile, jobs=1, resume=None):
+        '''receive file which is known to be not a directory, so it is
+        not probed by CWD, resume overrides resume of config'''
         if os.path.isdir(localFile):
             raise exc.FailedOperationException(
                   'Second argument must be file, not directory')
+        if self.config.resume if resume is None else resume:
+            return self._retry(self._reget_once, remoteFile, localFile)
 
         self.send_cmd('TYPE I')
-        size = self.size(remoteFile)
+        size = _size_value(self.size(remoteFile))
+        if (jobs > 1 and size is not None and self.config.checksum is None and
+                self._negotiate_mode() == 'S' and
+                len(parallel.split_ranges(size, jobs)) > 1):
+            return self._get_segmented(remoteFile, localFile, size, jobs)
         sock = self._prepare_before_get_data('RETR', remoteFile)
         try:
-            with sock, open(localFile, 'wb') as f:
-                bar = progress.Progress(size)
-                if DEBUG:
+            resp, output = self._receive(
+                sock, self._local_output(localFile, size), size)
+        except Exception:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(localFile)
+            raise
+        self._verify(remoteFile, output)
+        return resp
+
+    @contextlib.contextmanager
+    def _local_output(self, localFile, size):
+        '''open local file for receiving, preallocated if size is known'''
+        mode = 'w+b' if self.config.mmap else 'wb'
+        with open(localFile, mode) as f:
+            preallocated = pipeline.preallocate(f, size)
+            yield f
+            if preallocated:
+                f.truncate()
+
+    def _get_to_stdout(self, remoteFile):
+        '''write remote file to stdout, messages of transfer go to
+        stderr meanwhile'''
+        output = sys.stdout.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            resp = self.retr_into(remoteFile, output)
+        output.flush()
+        return resp
+
+    def retr_into(self, remoteFile, f):
+        '''receive remote file into any writable object f, for example
+        pipe or socket file, without temporary files'''
+        self.send_cmd('TYPE I')
+        size = _size_value(self.size(remoteFile))
+        sock = self._prepare_before_get_data('RETR', remoteFile)
+        resp, output = self._receive(sock, contextlib.nullcontext(f), size)
+        self._verify(remoteFile, output)
+        return resp
+
+    def _receive(self, sock, output, size=None):
+        '''receive data of RETR into file of output context manager,
+        return final resp and file which was written'''
+        try:
+            with sock, output as f:
+                bar = self._new_progress(size)
+                if self.config.debug:
                     print(self._lastResp)
-                for line in sock.makefile('rb'):
-                    bar.update(len(line))
-                    f.write(line)
+                f = self._hashing_file(f)
+                self._recv_to_file(sock, f, bar)
+                bar.finish()
         except Exception as e:
+            if not isinstance(e, exc.FailedOperationException):
+                self._finish_transfer()
+            raise
+        return self._finish_transfer(), f
+
+    def iter_retr(self, remoteFile, chunkSize=None):
+        '''yield data of remote file by memoryview chunks of at most
+        chunkSize bytes while they arrive, chunk is valid only until next
+        one is taken; control connection is busy until generator is
+        exhausted or closed'''
+        self.send_cmd('TYPE I')
+        sock = self._prepare_before_get_data('RETR', remoteFile)
+        hasher = self._hashing_file(None)
+        with self._finishing_transfer():
+            with sock:
+                if self.config.debug:
+                    print(self._lastResp)
+                bar = self._new_progress()
+                with self.metrics.transfer('in', metrics.Meter(bar)) as bar:
+                    if self._mode == 'Z':
+                        chunks = self._inflated_chunks(sock, bar, chunkSize)
+                    else:
+                        chunks = self._recv_chunks(sock, bar, None,
+                                                   chunkSize)
+                    for chunk in chunks:
+                        if hasher is not None:
+                            hasher.checksum.update(chunk)
+                        yield chunk
+                bar.finish()
+        if hasher is not None:
+            self._verify(remoteFile, hasher)
+
+    def _get_segmented(self, remoteFile, localFile, size, jobs):
+        '''receive file by ranges over several sessions at once'''
+        bar = self._new_progress(size)
+        try:
+            resp = parallel.get_segmented(self, self._remote_dir(),
+                                          remoteFile, localFile, size,
+                                          jobs, bar)
+        except Exception:
             with contextlib.suppress(FileNotFoundError):
                 os.remove(localFile)
-            if not isinstance(e, exc.FailedOperationException):
-                get_resp(self.sock)
             raise
+        bar.finish()
+        return resp
+
+    def _new_progress(self, size=None):
+        '''make progress of one transfer, counted in aggregate progress
+        if it is set and throttled by rate limits if they are set'''
+        if self.progress is not None:
+            bar = self.progress.transfer(size)
         else:
-            return get_resp(self.sock)
+            bar = progress.Progress(size)
 
-    def _nlst(self, *args):
-        '''get list of files'''
-        sock = self._prepare_before_get_data('NLST')
+        buckets = [self.limit] if self.limit.rate else []
+        if self.transferRate:
+            buckets.append(throttle.TokenBucket(self.transferRate))
+        return throttle.Throttled(bar, buckets) if buckets else bar
+
+    @contextlib.contextmanager
+    def _aggregate_progress(self, totalBytes=None, totalFiles=None):
+        '''count all transfers inside in one aggregate progress'''
+        if self.progress is not None:
+            yield self.progress
+            return
+
+        self.progress = progress.AggregateProgress(totalBytes, totalFiles)
+        try:
+            yield self.progress
+        finally:
+            self.progress.finish()
+            self.progress = None
+
+    def reget(self, remoteFile='', localFile='', *args):
+        '''continue receiving of file from the end of local file,
+        reconnect and continue again on connection failures'''
+        localFile = os.path.expanduser(localFile or remoteFile)
+        if os.path.isdir(localFile):
+            raise exc.FailedOperationException(
+                  'Second argument must be file, not directory')
+        return self._retry(self._reget_once, remoteFile, localFile)
+
+    def _reget_once(self, remoteFile, localFile):
+        '''receive rest of file once'''
+        self.send_cmd('TYPE I')
+        resp = self.size(remoteFile)
+        size = _size_value(resp)
+        with open(localFile, 'ab') as f:
+            offset = f.tell()
+            if size is not None and offset > size:
+                raise exc.FailedOperationException(
+                      'Local file is larger than remote one')
+            if offset == size:
+                return resp
+            bar = self._new_progress(size)
+            if offset:
+                bar.update(offset)
+            f = self._hashing_file(f, localFile, offset)
+            resp = self.retr_range(remoteFile, f, None, bar)
+        bar.finish()
+        self._verify(remoteFile, f)
+        return resp
+
+    def _retry(self, function, *args):
+        '''call function, on connection failures call it again after
+        growing delay, control connection is restored by its first
+        command'''
+        delay = self.config.retryDelay
+        for attempt in range(self.config.retries + 1):
+            try:
+                return function(*args)
+            except exc.NETWORK_ERRORS:
+                if attempt == self.config.retries:
+                    raise
+                if self.isConnected:
+                    self._lose_connection()
+            time.sleep(delay)
+            delay *= 2
+
+    def retr_range(self, remoteFile, f, length, bar):
+        '''receive length bytes of remote file starting from
+        current position of f, or all the rest if length is None'''
+        self.send_cmd('TYPE I')
+        sock = self._prepare_before_get_data('RETR', remoteFile,
+                                             offset=f.tell())
         with sock:
-            result = [line[:-1] for line in sock.makefile(encoding=ENCODING)]
-        get_resp(self.sock)
-        return result
+            self._recv_to_file(sock, f, bar, length)
+        return self._finish_transfer()
+
+    def _recv_to_file(self, sock, f, bar, length=None):
+        '''receive data and write it to file, stop after length bytes
+        if it is given'''
+        with self.metrics.transfer('in', metrics.Meter(bar)) as bar:
+            if self._mode == 'Z':
+                return self._recv_inflated(sock, f, bar)
+            if (self.config.mmap and length is None and _is_regular_file(f) and
+                    '+' in f.mode and self._recv_mapped(sock, f, bar)):
+                return
+            if self.config.writeBuffers > 1:
+                return self._recv_write_behind(sock, f, bar, length)
+            self._recv_blocks(sock, f, bar, length)
+
+    def _recv_blocks(self, sock, f, bar, length=None):
+        '''receive data by fixed-size blocks and write them to file'''
+        for chunk in self._recv_chunks(sock, bar, length):
+            f.write(chunk)
+
+    def _recv_chunks(self, sock, bar, length=None, chunkSize=None):
+        '''yield received data by memoryview chunks of one buffer,
+        stop after length bytes if it is given'''
+        buffer = memoryview(bytearray(chunkSize or self.config.bufferSize))
+        blockSize = len(buffer)
+        while length is None or length > 0:
+            if length is not None:
+                blockSize = min(len(buffer), length)
+            received = sock.recv_into(buffer, blockSize)
+            if not received:
+                break
+            bar.update(received)
+            yield buffer[:received]
+            if length is not None:
+                length -= received
+
+    def _recv_write_behind(self, sock, f, bar, length=None):
+        '''receive data into ring of buffers while writer thread
+        writes filled ones to file'''
+        with pipeline.WriteBehind(f, self.config.bufferSize,
+                                  self.config.writeBuffers) as writer:
+            received = None
+            while received != 0 and (length is None or length > 0):
+                buffer = writer.buffer()
+                blockSize = len(buffer) if length is None \
+                    else min(len(buffer), length)
+                filled = 0
+                while filled < blockSize:
+                    received = sock.recv_into(buffer[filled:blockSize])
+                    if not received:
+                        break
+                    filled += received
+                    bar.update(received)
+                if filled:
+                    writer.write(buffer, filled)
+                if length is not None:
+                    length -= filled
+
+    def _recv_mapped(self, sock, f, bar):
+        '''receive data straight into memory map of preallocated file
+        from its start, then rest of data if file has grown by blocks,
+        return False if file can not be mapped'''
+        size = os.fstat(f.fileno()).st_size
+        if f.tell() != 0 or not size:
+            return False
+        position = 0
+        with mmap.mmap(f.fileno(), size) as mapped:
+            view = memoryview(mapped)
+            try:
+                while position < size:
+                    received = sock.recv_into(
+                        view[position:position + self.config.bufferSize])
+                    if not received:
+                        break
+                    position += received
+                    bar.update(received)
+            finally:
+                view.release()
+        f.seek(position)
+        if position == size:
+            self._recv_blocks(sock, f, bar)
+        return True
+
+    def _recv_inflated(self, sock, f, bar):
+        '''receive MODE Z data and write it inflated to file'''
+        for chunk in self._inflated_chunks(sock, bar):
+            f.write(chunk)
+
+    def _inflated_chunks(self, sock, bar, chunkSize=None):
+        '''yield inflated data of MODE Z connection by chunks of at most
+        chunkSize bytes'''
+        buffer = memoryview(bytearray(self.config.bufferSize))
+        decompressor = zlib.decompressobj()
+        while True:
+            received = sock.recv_into(buffer)
+            if not received:
+                break
+            bar.update_wire(received)
+            data = buffer[:received]
+            while data:
+                chunk = decompressor.decompress(data, chunkSize or 0)
+                data = decompressor.unconsumed_tail
+                if chunk:
+                    bar.update(len(chunk))
+                    yield memoryview(chunk)
+        chunk = decompressor.flush()
+        if chunk:
+            bar.update(len(chunk))
+            yield memoryview(chunk)
+
+    def spawn_session(self, directory=''):
+        '''open new session with address and credentials of this client,
+        change its working directory to directory if it is given'''
+        session = Client(self.config)
+        session.limit = self.limit
+        session.metrics = self.metrics
+        session.transferRate = self.transferRate
+        session.connect(self.hostName, self.port)
+        session.login(self._userName, self._password)
+        if directory:
+            session.cd(directory)
+        return session
+
+    def pwd(self, *args):
+        '''print remote working directory'''
+        return self.send_cmd('PWD')
+
+    def _remote_dir(self):
+        '''get path of remote working directory'''
+        searchResult = re.match(r'257 "((?:[^"]|"")*)"', self.pwd())
+        if not searchResult:
+            return ''
+        self._cwd = searchResult.group(1).replace('""', '"')
+        self._workdir = self._cwd
+        return self._cwd
+
+    def _nlst(self, directoryName='', *args):
+        '''get list of files'''
+        return self._cached('NLST', directoryName, self._load_nlst)
+
+    def _load_nlst(self, directoryName):
+        '''get list of files from server'''
+        params = (directoryName,) if directoryName else ()
+        return list(self._iter_lines('NLST', *params))
 
     def _get_dir(self, directoryName, localDirectory, *args):
         '''receive directory'''
@@ -226,36 +1053,140 @@ class Client:
         if not os.path.isdir(localDirectory):
             os.mkdir(localDirectory)
         resp = self.cd(directoryName)
-        os.chdir(localDirectory)
 
-        for note in self._nlst():
-            resp = self.get(os.path.basename(note))
+        for entry in self.mlsd():
+            localPath = os.path.join(localDirectory, entry.name)
+            if entry.is_dir:
+                resp = self._get_dir(entry.name, localPath)
+            elif entry.is_file:
+                resp = self.get_file(entry.name, localPath)
+            else:
+                resp = self.get(entry.name, localPath)
 
         self.cd('..')
-        os.chdir('..')
         return resp
 
+    def _get_dir_parallel(self, directoryName, localDirectory, jobs):
+        '''receive directory by several sessions at once'''
+        directory = self._remote_dir()
+        tasks = []
+        try:
+            totalBytes = self._collect_get_tasks(
+                directoryName, directoryName,
+                localDirectory or directoryName, tasks)
+        finally:
+            self.cd(directory)
+        return self._run_in_pool(tasks, directory, jobs, totalBytes)
+
+    def _collect_get_tasks(self, name, remoteDir, localDir, tasks):
+        '''make local copy of remote directories tree and collect
+        tasks for its files, return known total size of files'''
+        if not os.path.isdir(localDir):
+            os.mkdir(localDir)
+        self.cd(name)
+
+        totalBytes = 0
+        for entry in self.mlsd():
+            remotePath = posixpath.join(remoteDir, entry.name)
+            localPath = os.path.join(localDir, entry.name)
+            if entry.is_dir:
+                totalBytes += self._collect_get_tasks(
+                    entry.name, remotePath, localPath, tasks)
+            elif entry.is_file:
+                tasks.append(('get_file', remotePath, localPath))
+                totalBytes += entry.size or 0
+            else:
+                tasks.append(('get', remotePath, localPath))
+
+        self.cd('..')
+        return totalBytes
+
+    def _run_in_pool(self, tasks, directory, jobs, totalBytes=None):
+        '''run transfer tasks over pool of sessions,
+        showing one aggregate progress of all of them'''
+        if not tasks:
+            return ''
+        with self._aggregate_progress(totalBytes, len(tasks)) as bar, \
+                parallel.SessionPool(self, min(jobs, len(tasks)),
+                                     directory) as pool:
+            for session in pool.sessions:
+                session.progress = bar
+                session.checksums = self.checksums
+            return pool.run(tasks)
+
     def close(self, *args):
         '''terminate ftp session'''
+        self.isLost = False
+        if not self.isConnected:
+            return ''
         resp = self.send_cmd('QUIT')
         self._disconnect()
         return resp
 
     def exit(self, *args):
-        '''terminate ftp session and exit'''
+        '''terminate ftp session and exit, keepalive is stopped before
+        QUIT and session is closed under lock, so no NOOP interleaves'''
+        if self.keepalive is not None:
+            self.keepalive.stop()
         try:
-            if self.isConnected:
-                return self.close()
+            with self._lock:
+                if self.isConnected:
+                    return self.close()
         finally:
             self.timeToExit = True
         return ''
 
     def reconnect(self, *args):
-        '''reconnect to remote server'''
+        '''reconnect to remote server and return to remote working
+        directory'''
+        self.metrics.count('ftp_reconnects_total')
+        self.isLost = False
+        directory = self._workdir
         if self.isConnected:
-            return self._disconnect(True)
+            resp = self._disconnect(True)
         else:
-            return self._adjust(True)
+            resp = self._adjust(True)
+        if directory != '.':
+            self.cd(directory)
+        return resp
+
+    def execute(self, command, *args):
+        '''run command of commands table, keepalive waits for its end,
+        commands which change nothing on server are run once more
+        if connection is lost during them'''
+        with self._lock:
+            self.checksums.clear()
+            function = self.commands[command]
+            try:
+                return function(*args)
+            except (OSError, exc.TimeoutException,
+                    exc.NotConnectedException):
+                if (command not in self.IDEMPOTENT_COMMANDS or
+                        not self.isLost):
+                    raise
+            return function(*args)
+
+    def start_keepalive(self, interval):
+        '''send NOOP after interval seconds of idle control connection
+        in background thread'''
+        self.keepalive = keepalive.Keepalive(self, interval)
+        self.keepalive.start()
+
+    def keep_alive(self, interval):
+        '''send NOOP if no replies were read for interval seconds and
+        no command is running, return delay of next check'''
+        if not self._lock.acquire(blocking=False):
+            return interval
+        try:
+            idle = time.monotonic() - self._lastActivity
+            if not self.isConnected or idle < interval:
+                return interval - idle if self.isConnected else interval
+            with contextlib.suppress(OSError, exc.TimeoutException,
+                                     exc.NotConnectedException):
+                self.request('NOOP')
+            return interval
+        finally:
+            self._lock.release()
 
     def help(self, command='', *args):
         '''print local help information'''
@@ -270,24 +1201,207 @@ class Client:
             help_str = help.help[command]
         return help_str
 
-    def send(self, localFile='', remoteFile='', *args):
-        '''send file'''
+    def send(self, localFile='', remoteFile='', *args, jobs=1):
+        '''send file, local file "-" is stdin'''
+        if localFile == '-':
+            return self._send_from_stdin(remoteFile)
         remoteFile = remoteFile or localFile
         localFile = os.path.expanduser(localFile)
         if os.path.isdir(localFile):
-            return self._send_dir(localFile, remoteFile)
+            if jobs > 1:
+                return self._send_dir_parallel(localFile, remoteFile, jobs)
+            with self._aggregate_progress():
+                return self._send_dir(localFile, remoteFile)
+        return self.send_file(localFile, remoteFile)
+
+    def send_file(self, localFile, remoteFile, resume=None):
+        '''send local file which is not a directory, resume overrides
+        resume of config'''
         if not os.path.isfile(localFile):
             raise exc.FailedOperationException('Local file not found')
 
+        if self.config.resume if resume is None else resume:
+            return self._retry(self._reput_once, localFile, remoteFile)
+
         self.send_cmd('TYPE I')
+        with open(localFile, 'rb') as f:
+            return self._store(f, remoteFile, os.path.getsize(localFile))
+
+    def _send_from_stdin(self, remoteFile):
+        '''send data of stdin, for example output of pipe, progress
+        and messages stay on stdout'''
+        if not remoteFile:
+            raise exc.FailedOperationException(
+                  'Remote file name is required to send stdin')
+        f = sys.stdin.buffer
+        return self.stor_from(f, remoteFile, _remaining_size(f))
+
+    def stor_from(self, f, remoteFile, sizeHint=None):
+        '''send data of any readable object f, for example pipe or
+        socket file, to remote file without temporary files; server is
+        told sizeHint by ALLO if it is known, upload starts as soon as
+        first block is read'''
+        self.send_cmd('TYPE I')
+        if sizeHint is not None:
+            # allocation is only a hint, servers which do not need it
+            # reply 202 and errors do not prevent upload
+            self.request('ALLO', str(sizeHint))
+        return self._store(f, remoteFile)
+
+    def _store(self, f, remoteFile, size=None):
+        '''send data of f by STOR, progress has no total if size
+        is unknown'''
         sock = self._prepare_before_get_data('STOR', remoteFile)
-        with sock, open(localFile, 'rb') as f:
-            if DEBUG:
+        with sock:
+            bar = self._new_progress(size)
+            if self.config.debug:
                 print(self._lastResp)
-            for line in f:
-                sock.sendall(line)
+            f = self._hashing_file(f)
+            self._send_from_file(sock, f, bar)
+        bar.finish()
+
+        resp = self._finish_transfer()
+        self._verify(remoteFile, f)
+        return resp
+
+    def reput(self, localFile='', remoteFile='', *args):
+        '''continue sending of file from the end of remote file,
+        reconnect and continue again on connection failures'''
+        remoteFile = remoteFile or localFile
+        localFile = os.path.expanduser(localFile)
+        if not os.path.isfile(localFile):
+            raise exc.FailedOperationException('Local file not found')
+        return self._retry(self._reput_once, localFile, remoteFile)
+
+    def _reput_once(self, localFile, remoteFile):
+        '''send rest of file once'''
+        self.send_cmd('TYPE I')
+        resp = self.size(remoteFile)
+        offset = _size_value(resp) or 0
+        size = os.path.getsize(localFile)
+        if offset > size:
+            raise exc.FailedOperationException(
+                  'Remote file is larger than local one')
+        if offset == size:
+            return resp
+
+        with open(localFile, 'rb') as f:
+            f.seek(offset)
+            sock = self._prepare_before_get_data(
+                'APPE' if offset else 'STOR', remoteFile)
+            with sock:
+                bar = self._new_progress(size)
+                if offset:
+                    bar.update(offset)
+                if self.config.debug:
+                    print(self._lastResp)
+                f = self._hashing_file(f, localFile, offset)
+                self._send_from_file(sock, f, bar)
+        bar.finish()
+
+        resp = self._finish_transfer()
+        self._verify(remoteFile, f)
+        return resp
+
+    def _hashing_file(self, f, path=None, offset=0):
+        '''wrap transferred file to hash its data if checksums are
+        enabled, offset bytes of resumed transfer are hashed from path'''
+        if self.config.checksum is None:
+            return f
+        hasher = checksum.Checksum(self.config.checksum)
+        if offset:
+            hasher.update_from_file(path, offset)
+        return checksum.HashingFile(f, hasher)
+
+    def _verify(self, remoteFile, f):
+        '''compare hash of transferred data with hash of remote file
+        computed by server, keep result in checksums'''
+        if not isinstance(f, checksum.HashingFile):
+            return
+        local = f.checksum.hexdigest()
+        remote = self.remote_checksum(remoteFile, self.config.checksum)
+        path = self.absolute_path(remoteFile)
+        self.checksums[path] = checksum.Result(self.config.checksum, path,
+                                               local, remote)
+        if remote is not None and remote != local:
+            raise exc.FailedOperationException(
+                  'Checksum mismatch of {}: {} {} locally, {} on server'
+                  .format(path, self.config.checksum, local, remote))
+
+    def remote_checksum(self, remoteFile, algorithm):
+        '''get hex digest of remote file by HASH, or by XCRC, XMD5 or
+        XSHA256, None if server can not hash files'''
+        features = self.features()
+        name = checksum.HASH_NAMES[algorithm]
+        hashes = [feature for feature in features
+                  if feature.startswith('HASH ')]
+        if hashes and name in hashes[0][5:].replace('*', '').split(';'):
+            resp = self.request('OPTS', 'HASH', name)
+            if resp.is_error:
+                return None
+            resp = self.request('HASH', remoteFile)
+        elif checksum.COMMANDS[algorithm] in features:
+            resp = self.request(checksum.COMMANDS[algorithm], remoteFile)
+        else:
+            return None
+        if resp.is_error:
+            return None
+        return checksum.parse_digest(resp.lines[-1], algorithm)
+
+    def _send_from_file(self, sock, f, bar):
+        '''send file data, by kernel sendfile if file is regular'''
+        with self.metrics.transfer('out', metrics.Meter(bar)) as bar:
+            if self._mode == 'Z':
+                self._send_deflated(sock, f, bar)
+            elif not (hasattr(os, 'sendfile') and _is_regular_file(f)
+                      and self._sendfile(sock, f, bar)):
+                self._send_blocks(sock, f, bar)
 
-        return get_resp(self.sock)
+    def _sendfile(self, sock, f, bar):
+        '''send file from its current position without copying it to
+        user space, return False if sendfile is not supported for it'''
+        offset = start = f.tell()
+        while True:
+            try:
+                sent = os.sendfile(sock.fileno(), f.fileno(),
+                                   offset, self.config.bufferSize)
+            except BlockingIOError:
+                if not select.select([], [sock], [], sock.gettimeout())[1]:
+                    raise socket.timeout('timed out')
+                continue
+            except OSError:
+                if offset > start:
+                    raise
+                return False
+            if not sent:
+                return True
+            offset += sent
+            bar.update(sent)
+
+    def _send_blocks(self, sock, f, bar):
+        '''send file data by fixed-size blocks, file can be a pipe'''
+        while True:
+            data = f.read(self.config.bufferSize)
+            if not data:
+                break
+            sock.sendall(data)
+            bar.update(len(data))
+
+    def _send_deflated(self, sock, f, bar):
+        '''send file data deflated for MODE Z'''
+        compressor = zlib.compressobj(self.config.compression)
+        while True:
+            data = f.read(self.config.bufferSize)
+            if not data:
+                break
+            compressed = compressor.compress(data)
+            if compressed:
+                sock.sendall(compressed)
+                bar.update_wire(len(compressed))
+            bar.update(len(data))
+        compressed = compressor.flush()
+        sock.sendall(compressed)
+        bar.update_wire(len(compressed))
 
     def _send_dir(self, localDir, remoteDir, *args):
         '''send directory'''
@@ -303,34 +1417,194 @@ class Client:
                       'Could not create directory')
 
         for root, dirs, files in os.walk(localDir):
-            os.chdir(localDir)
             for f in files:
-                resp = self.send(f)
+                resp = self.send(os.path.join(root, f), f)
             for d in dirs:
-                resp = self._send_dir(d, d)
-            os.chdir('..')
+                resp = self._send_dir(os.path.join(root, d), d)
             break
         self.cd('..')
         return resp
 
+    def _send_dir_parallel(self, localDir, remoteDir, jobs):
+        '''send directory by several sessions at once'''
+        directory = self._remote_dir()
+        tasks = []
+        totalBytes = 0
+        for root, dirs, files in os.walk(localDir):
+            relativeRoot = os.path.relpath(root, localDir)
+            remoteRoot = posixpath.normpath(posixpath.join(
+                remoteDir, relativeRoot.replace(os.sep, '/')))
+            self._make_remote_dir(remoteRoot, directory)
+            self._invalidate(remoteRoot)
+            for f in files:
+                localPath = os.path.join(root, f)
+                tasks.append(('send', localPath,
+                              posixpath.join(remoteRoot, f)))
+                totalBytes += os.path.getsize(localPath)
+        return self._run_in_pool(tasks, directory, jobs, totalBytes)
+
+    def _make_remote_dir(self, dirName, directory):
+        '''make remote directory if it does not exist,
+        then return to directory'''
+        resp = self.mkdir(dirName)
+        if resp.startswith('5'):
+            if self.cd(dirName).startswith('5'):
+                raise exc.FailedOperationException(resp)
+            self.cd(directory)
+
     def mkdir(self, dirName, *args):
         '''make a directory on remote machine'''
+        self._invalidate(posixpath.dirname(dirName))
+        self._invalidate(dirName)
         return self.send_cmd('MKD', dirName)
 
+    def delete(self, fileName, *args):
+        '''delete file on remote machine'''
+        self._invalidate(posixpath.dirname(fileName))
+        return self.send_cmd('DELE', fileName)
+
+    def mirror(self, *args):
+        '''transfer new and changed files of directory tree,
+        "mirror get|send source [target] [--delete]"'''
+        delete = '--delete' in args
+        args = [arg for arg in args if arg != '--delete']
+        if len(args) not in (2, 3) or args[0] not in ('get', 'send'):
+            raise exc.FailedOperationException(
+                  '?Usage: mirror get|send source [target] [--delete]')
+
+        direction, source, *target = args
+        target = target[0] if target else source
+        with self._aggregate_progress():
+            if direction == 'get':
+                counts = mirror.download(self, source,
+                                         os.path.expanduser(target), delete)
+            else:
+                counts = mirror.upload(self, os.path.expanduser(source),
+                                       target, delete)
+        print('{} transferred, {} unchanged, {} deleted'.format(*counts))
+        return ''
+
+    def rate(self, *args):
+        '''print or change bandwidth limits,
+        "rate [total-rate [transfer-rate]]"'''
+        if len(args) > 2:
+            raise exc.FailedOperationException(
+                  '?Usage: rate [total-rate [transfer-rate]]')
+        try:
+            rates = [throttle.parse_rate(arg) for arg in args]
+        except ValueError as e:
+            raise exc.FailedOperationException('?' + str(e))
+
+        if rates:
+            self.limit.set_rate(rates[0])
+        if len(rates) > 1:
+            self.transferRate = rates[1]
+        print('total: {}, per transfer: {}'.format(
+            throttle.format_rate(self.limit.rate),
+            throttle.format_rate(self.transferRate)))
+        return ''
+
+    def stats(self, format='json', *args):
+        '''print collected metrics, "stats [json|prometheus]"'''
+        if format == 'json':
+            print(self.metrics.to_json())
+        elif format == 'prometheus':
+            print(self.metrics.to_prometheus(), end='')
+        else:
+            raise exc.FailedOperationException(
+                  '?Usage: stats [json|prometheus]')
+        return ''
+
     def size(self, fileName, *args):
         '''get size of file'''
         return self.send_cmd('SIZE', fileName)
 
+    def sizes(self, pattern='*', *args):
+        '''print sizes of remote files matching pattern'''
+        directoryName, namePattern = posixpath.split(pattern)
+        names = [posixpath.join(directoryName, posixpath.basename(name))
+                 for name in self._nlst(directoryName)
+                 if fnmatch.fnmatch(posixpath.basename(name), namePattern)]
 
-def get_resp(sock):
-    '''get resp form the socket'''
-    data = b''
+        self.send_cmd('TYPE I')
+        total = 0
+        for name, resp in zip(names, self.batch(('SIZE', name)
+                                                for name in names)):
+            if resp.code == '213':
+                size = int(resp.lines[-1][4:])
+                total += size
+                print('{:>14} {}'.format(size, name))
+            else:
+                print('{:>14} {}'.format('?', name))
+        print('{:>14} total'.format(total))
+        return ''
+
+
+def _verb(cmd):
+    '''get verb of command given with or without its parameters,
+    for example TYPE of "TYPE I"'''
+    return cmd.split(' ', 1)[0].upper()
+
+
+def _size_value(resp):
+    '''get number of bytes from SIZE resp, None if it is unknown'''
+    if not resp.startswith('213'):
+        return None
+    return int(resp.split(' ')[-1])
+
+
+def _with_jobs_option(command, config):
+    '''make command accept "-j jobs" option in its arguments'''
+    @functools.wraps(command)
+    def wrapper(*args):
+        args = list(args)
+        jobs = config.jobs
+        if '-j' in args:
+            index = args.index('-j')
+            try:
+                jobs = int(args[index + 1])
+            except (IndexError, ValueError):
+                jobs = 0
+            if jobs < 1:
+                raise exc.FailedOperationException(
+                      '?Invalid number of jobs')
+            del args[index:index + 2]
+        return command(*args, jobs=jobs)
+    return wrapper
+
+
+class _ChunkReader(io.RawIOBase):
+    '''readable stream of data of chunks generator'''
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            self._chunk = next(self.chunks, None)
+            if self._chunk is None:
+                self._chunk = memoryview(b'')
+                return 0
+        length = min(len(buffer), len(self._chunk))
+        buffer[:length] = self._chunk[:length]
+        self._chunk = self._chunk[length:]
+        return length
+
+
+def _remaining_size(f):
+    '''get number of bytes left in file object backed by regular file,
+    None for pipes and terminals'''
+    if not _is_regular_file(f):
+        return None
+    return max(os.fstat(f.fileno()).st_size - f.tell(), 0)
 
-    while True:
-        dataPoint = sock.recv(4096)
-        data += dataPoint
-        strings = dataPoint.decode(ENCODING).split('\n')
-        if len(strings) < 2 or re.match(r'^\d{3} .*', strings[-2]):
-            break
 
-    return data.decode(ENCODING)
+def _is_regular_file(f):
+    '''check that file object is backed by regular file'''
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):
+        return False
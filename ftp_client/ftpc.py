@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import socket
+import stat
+import struct
+
+ERROR_EXCEPTION = 1
+ERROR_USAGE = 2
+ERROR_NOT_RUNNING = 4
+
+# commands which daemon runs for thin client, they end on their own
+COMMANDS = ('ls', 'get', 'send', 'reget', 'reput', 'sizes', 'pwd')
+USAGE = ('usage: ftpc.py [-S socket] [-P password] [-p port] [-e encoding] '
+         '[-a] HOST LOGIN COMMAND [ARG ...]\n'
+         'commands: ' + ', '.join(COMMANDS))
+
+
+def main():
+    try:
+        request, path = parse(sys.argv[1:])
+    except ValueError as e:
+        print('{}\n{}'.format(e, USAGE), file=sys.stderr)
+        sys.exit(ERROR_USAGE)
+    sys.exit(call(request, path))
+
+
+def socket_path():
+    '''default socket of daemon, it is in directory accessible only by
+    user: $XDG_RUNTIME_DIR or /tmp/ftp-client-UID made by daemon'''
+    name = 'ftp-client-{}'.format(os.getuid())
+    directory = (os.environ.get('XDG_RUNTIME_DIR') or
+                 os.path.join('/tmp', name))
+    return os.path.join(directory, name + '.sock')
+
+
+def is_private(directory):
+    '''check that directory is owned by user and closed to others'''
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and
+            not info.st_mode & 0o077)
+
+
+def is_trusted(sock, path):
+    '''check that daemon on other end of socket runs as user, where
+    credentials of peer are unknown socket must be in private directory,
+    so password is not sent to socket made by someone else'''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return is_private(os.path.dirname(path))
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                  struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid == os.getuid()
+
+
+def parse(argv):
+    '''get request for daemon and its socket from command line arguments,
+    argparse is not used to keep start of thin client fast'''
+    options = {'-S': socket_path(), '-p': '21', '-e': 'utf-8',
+               '-P': os.environ.get('FTP_PASSWORD', 'anonymous@')}
+    active = False
+    argv = list(argv)
+    while argv and argv[0].startswith('-'):
+        option = argv.pop(0)
+        if option == '-a':
+            active = True
+        elif option in options and argv:
+            options[option] = argv.pop(0)
+        else:
+            raise ValueError('Invalid option: {}'.format(option))
+    if len(argv) < 3:
+        raise ValueError('HOST, LOGIN and COMMAND are required')
+    host, user, command, *args = argv
+    if command not in COMMANDS:
+        raise ValueError('Invalid command: {}'.format(command))
+    if not options['-p'].isdigit():
+        raise ValueError('Invalid port: {}'.format(options['-p']))
+    request = {'host': host, 'port': int(options['-p']), 'user': user,
+               'password': options['-P'], 'encoding': options['-e'],
+               'active': active, 'command': command, 'args': args,
+               'cwd': os.getcwd()}
+    return request, options['-S']
+
+
+def call(request, path):
+    '''send request to daemon listening on path, print output of command
+    while it runs, return exit code'''
+    sock = socket.socket(socket.AF_UNIX)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        sock.close()
+        print('Daemon is not running on {}: {}'.format(path, e.strerror),
+              file=sys.stderr)
+        return ERROR_NOT_RUNNING
+    if not is_trusted(sock, path):
+        sock.close()
+        print('Socket {} is not made by daemon of this user'.format(path),
+              file=sys.stderr)
+        return ERROR_NOT_RUNNING
+
+    with sock, sock.makefile('rb') as replies:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        for line in replies:
+            message = json.loads(line)
+            if 'output' in message:
+                sys.stdout.write(message['output'])
+            elif 'error' in message:
+                sys.stdout.flush()
+                print(message['error'], file=sys.stderr)
+                return ERROR_EXCEPTION
+            else:
+                return 0
+    print('Daemon closed connection.', file=sys.stderr)
+    return ERROR_EXCEPTION
+
+
+if __name__ == '__main__':
+    main()
@@ -12,21 +12,75 @@ help = {
               '{1}.\n'.format('cd',
                               'remote-directory'),
 
+        'sizes': '{0} {1}\n\t'
+                 'Print sizes of remote files whose names match {1}\n\t'
+                 'pattern. SIZE commands for all files are sent at once\n\t'
+                 'without waiting for each reply.\n'
+                 .format('sizes', '[{0}]'.format('pattern')),
+
+        'reget': '{0} {1} {2}\n\t'
+                 'Continue receiving of remote-file from the end of\n\t'
+                 'partially received local file. Transfer is continued\n\t'
+                 'again after reconnecting if connection fails.\n'
+                 .format('reget', 'remote-file',
+                         '[{0}]'.format('local-file')),
+
+        'reput': '{0} {1} {2}\n\t'
+                 'Continue sending of local-file from the end of\n\t'
+                 'partially sent remote file. Transfer is continued\n\t'
+                 'again after reconnecting if connection fails.\n'
+                 .format('reput', 'local-file',
+                         '[{0}]'.format('remote-file')),
+
+        'mirror': '{0} {1} {2} {3} {4}\n\t'
+                  'Transfer only new and changed files of {2} tree\n\t'
+                  'to {3} directory: from remote machine with get,\n\t'
+                  'to remote machine with send. Transferred files are\n\t'
+                  'recorded in manifest file in local directory, so\n\t'
+                  'interrupted mirroring continues where it stopped.\n\t'
+                  'With --delete files which have gone from {2} are\n\t'
+                  'deleted from {3}.\n'
+                  .format('mirror', 'get|send', 'source',
+                          '[{0}]'.format('target'), '[--delete]'),
+
+        'rate': '{0} {1}\n\t'
+                'Print or change bandwidth limits: total rate of all\n\t'
+                'transfers and rate of each transfer, in bytes per\n\t'
+                'second with optional K, M or G suffix. 0 means no\n\t'
+                'limit.\n'
+                .format('rate', '[total-rate [transfer-rate]]'),
+
+        'stats': '{0} {1}\n\t'
+                 'Print metrics of session: latency percentiles of\n\t'
+                 'commands and data connections, transferred bytes,\n\t'
+                 'throughput, reconnects and negative replies, in json\n\t'
+                 'or prometheus text format.\n'
+                 .format('stats', '[json|prometheus]'),
+
+        'pwd': '{0}\n\t'
+               'Print the name of the current working directory on the\n\t'
+               'remote machine.\n'.format('pwd'),
+
         'get':
-        ('{0} {1} {2}\n\t'
+        ('{0} {1} {2} {3}\n\t'
          'Retrieve the remote-file and store it on the local machine.\n\t'
          'If the local file name is not specified, it is given the same\n\t'
-         'name it has on the remote machine. {1} can be directory as well.\n\t'
+         'name it has on the remote machine. {2} can be directory as well.\n\t'
          'If download target is directory, then all tree of subdirectories\n\t'
-         'will be downloaded.\n').format('get',
-                                         'remote-file',
-                                         '[{0}]'.format(
-                                                       'local-file')),
+         'will be downloaded. With -j option file is received by ranges\n\t'
+         'over several sessions at once, and files of directory are\n\t'
+         'received by several sessions at once. Local file "-" writes\n\t'
+         'remote file to standard output.\n').format('get',
+                                                    '[-j jobs]',
+                                                    'remote-file',
+                                                    '[{0}]'.format(
+                                                        'local-file')),
 
         'reconnect':
         '{0}\n\t'
         'Reconnect to remote server. It works even if you already\n\t'
-        'disconnected from the remote server.\n'.format('reconnect'),
+        'disconnected from the remote server. Remote working\n\t'
+        'directory is restored after login.\n'.format('reconnect'),
 
 
         'close': '{0}\n\t'
@@ -46,11 +100,13 @@ help = {
         .format('help', '[{0}]'.format('command')),
 
         'send':
-        '{0} {1} {2}\n\t'
-        'Store a local file on the remote machine. If {2} is\n\t'
+        '{0} {1} {2} {3}\n\t'
+        'Store a local file on the remote machine. If {3} is\n\t'
         'left unspecified, the local file name is used.\n\t'
-        '{1} can be directory as well.\n\t'
+        '{2} can be directory as well.\n\t'
         'If upload target is directory, then all tree of subdirectories\n\t'
-        'will be uploaded.\n'
-        .format('send', 'local-file',
+        'will be uploaded. With -j option files of directory are sent\n\t'
+        'by several sessions at once. If {2} is "-", data of\n\t'
+        'standard input is sent to {3}, which is required then.\n'
+        .format('send', '[-j jobs]', 'local-file',
                 '[{0}]'.format('remote-file'))}
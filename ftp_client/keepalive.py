@@ -0,0 +1,20 @@
+import threading
+
+
+class Keepalive(threading.Thread):
+    '''daemon thread which sends NOOP on control connection of client
+    after interval seconds without replies, so server does not close
+    idle session'''
+    def __init__(self, client, interval):
+        super().__init__(daemon=True)
+        self.client = client
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            delay = self.client.keep_alive(self.interval)
+
+    def stop(self):
+        self._stopped.set()
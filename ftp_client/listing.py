@@ -0,0 +1,90 @@
+import time
+
+
+MONTHS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+          'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+UNIX_TYPES = {'-': 'file', 'd': 'dir', 'l': 'link'}
+
+
+class Entry:
+    '''entry of remote directory listing, modify is a string
+    in YYYYMMDDHHMMSS format as in MLSD'''
+    __slots__ = ('name', 'type', 'size', 'modify', 'perm')
+
+    def __init__(self, name, type='file', size=None, modify=None,
+                 perm=None):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.modify = modify
+        self.perm = perm
+
+    @property
+    def is_dir(self):
+        return self.type == 'dir'
+
+    @property
+    def is_file(self):
+        return self.type == 'file'
+
+    def __eq__(self, other):
+        if not isinstance(other, Entry):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot)
+                   for slot in self.__slots__)
+
+    def __repr__(self):
+        return 'Entry({})'.format(', '.join(
+            '{}={!r}'.format(slot, getattr(self, slot))
+            for slot in self.__slots__))
+
+
+def parse_mlsd_line(line):
+    '''parse line of MLSD listing or MLST reply to Entry'''
+    facts, _, name = line.strip('\r\n').partition(' ')
+    entry = Entry(name, type=None)
+    for fact in facts.split(';'):
+        key, _, value = fact.partition('=')
+        key = key.lower()
+        if key == 'type':
+            entry.type = value.lower()
+        elif key == 'size' or key == 'sizd':
+            entry.size = int(value) if value.isdigit() else None
+        elif key == 'modify':
+            entry.modify = value[:14]
+        elif key == 'perm':
+            entry.perm = value
+    return entry
+
+
+def parse_unix_line(line, now=None):
+    '''parse line of unix LIST format, return None for lines
+    which are not entries, for example "total 8"'''
+    parts = line.rstrip('\r\n').split(None, 8)
+    if len(parts) < 9 or parts[0][:1] not in UNIX_TYPES:
+        return None
+
+    mode, _, _, _, size, month, day, yearOrTime, name = parts
+    type = UNIX_TYPES[mode[0]]
+    if type == 'link':
+        name = name.split(' -> ', 1)[0]
+    return Entry(name, type, int(size) if size.isdigit() else None,
+                 _unix_time(month, day, yearOrTime, now), mode[1:])
+
+
+def _unix_time(month, day, yearOrTime, now=None):
+    '''convert unix listing date to YYYYMMDDHHMMSS string'''
+    month = MONTHS.get(month[:3].lower())
+    if month is None or not day.isdigit():
+        return None
+
+    if ':' in yearOrTime:
+        now = time.gmtime() if now is None else now
+        hour, _, minute = yearOrTime.partition(':')
+        year = now.tm_year
+        if (month, int(day)) > (now.tm_mon, now.tm_mday + 1):
+            year -= 1
+    else:
+        year, hour, minute = yearOrTime, 0, 0
+    return '{:04}{:02}{:02}{:02}{:02}00'.format(
+        int(year), month, int(day), int(hour), int(minute))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import contextlib
+import json
+import os
+import posixpath
+import random
+import socket
+import tempfile
+import threading
+import time
+
+ERROR_EXCEPTION = 1
+ERROR_MODULES_MISSING = 2
+
+try:
+    import arguments
+    import exceptions
+    import ftp
+    import loopserver
+    import metrics
+except Exception as e:
+    print('Program modules not found: "{}"'.format(e), file=sys.stderr)
+    sys.exit(ERROR_MODULES_MISSING)
+
+
+OPERATIONS = ('ls', 'get', 'send', 'cd')
+MIX = 'ls=4,get=3,send=1,cd=2'
+LOCAL_FILE_SIZE = 64 * 1024
+
+
+class Schedule:
+    '''shared schedule of operation starts at target rate per second,
+    rate 0 starts operations as soon as sessions are free'''
+    def __init__(self, rate, duration, clock=time.monotonic):
+        self.clock = clock
+        self.interval = 1 / rate if rate else 0
+        self.started = clock()
+        self.deadline = self.started + duration
+        self._next = self.started
+        self._lock = threading.Lock()
+
+    def next(self):
+        '''get planned start of next operation, None after deadline'''
+        with self._lock:
+            planned = max(self._next, self.clock()) if not self.interval \
+                else self._next
+            if planned >= self.deadline:
+                return None
+            self._next = planned + self.interval
+            return planned
+
+
+class Session:
+    '''one simulated user with own credentials, connection is opened
+    lazily and reopened after it is lost'''
+    def __init__(self, index, options, credentials, registry):
+        self.index = index
+        self.options = options
+        self.name, self.password = credentials
+        self.registry = registry
+        self.client = None
+        self.localFile = os.path.join(options.workdir,
+                                      'session{}'.format(index))
+
+    def run(self, schedule, generator):
+        '''run operations of mix by schedule until its deadline'''
+        operations, weights = zip(*self.options.mix)
+        while True:
+            planned = schedule.next()
+            if planned is None:
+                break
+            delay = planned - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            operation = generator.choices(operations, weights)[0]
+            code = self._execute(operation)
+            # latency is counted from planned start, so slow server
+            # is not hidden by sessions falling behind schedule
+            self.registry.observe('loadtest_operation_seconds',
+                                  time.monotonic() - planned,
+                                  operation=operation)
+            self.registry.count('loadtest_operations_total',
+                                operation=operation)
+            if code is not None:
+                self.registry.count('loadtest_errors_total',
+                                    operation=operation, code=code)
+        self.close()
+
+    def _execute(self, operation):
+        '''run operation, return error code or None on success'''
+        try:
+            if self.client is None or not self.client.isConnected:
+                self._login()
+            resp = getattr(self, '_' + operation)()
+        except exceptions.TimeoutException:
+            self.client = None
+            return '421'
+        except (exceptions.FailedOperationException,
+                exceptions.NotConnectedException) as e:
+            return _reply_code(str(e), type(e).__name__)
+        except socket.timeout:
+            self.client = None
+            return 'timeout'
+        except Exception as e:
+            self.client = None
+            return type(e).__name__
+        if resp and ftp.ERROR_PATTERN.match(resp):
+            return _reply_code(resp, 'error')
+        return None
+
+    def _login(self):
+        self.client = ftp.Client(ftp.Config(isActive=self.options.active))
+        self.client.metrics = self.registry
+        self.client.connect(self.options.host, self.options.port)
+        self.client.login(self.name, self.password)
+
+    def _ls(self):
+        return self.client.ls(self.options.directory)
+
+    def _get(self):
+        return self.client.get(self.options.remote_file, self.localFile)
+
+    def _send(self):
+        return self.client.send(
+            self.options.send_file,
+            posixpath.join(self.options.directory,
+                           'loadtest-{}'.format(self.index)))
+
+    def _cd(self):
+        return self.client.cd(self.options.directory)
+
+    def close(self):
+        if self.client is not None and self.client.isConnected:
+            with contextlib.suppress(Exception):
+                self.client.close()
+
+
+def main():
+    parser = setup_parser()
+    options = parser.parse_args()
+
+    credentials = [(options.name, options.passw)]
+    if options.credentials:
+        with open(options.credentials) as f:
+            credentials = [tuple(line.rstrip('\n').split(':', 1))
+                           for line in f if ':' in line]
+
+    with contextlib.ExitStack() as stack:
+        if options.local:
+            options.host = '127.0.0.1'
+            options.port = stack.enter_context(
+                loopserver.serve_in_process(
+                    {posixpath.join(options.directory,
+                                    options.remote_file): options.file_size}))
+        options.workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        options.send_file = os.path.join(options.workdir, 'send')
+        with open(options.send_file, 'wb') as f:
+            f.write(os.urandom(options.file_size))
+
+        try:
+            report = run(options, credentials)
+        except Exception as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(ERROR_EXCEPTION)
+
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+def run(options, credentials):
+    '''run sessions by shared schedule and summarize their metrics'''
+    registry = metrics.Metrics()
+    schedule = Schedule(options.rate, options.duration)
+    sessions = [Session(i, options, credentials[i % len(credentials)],
+                        registry)
+                for i in range(options.sessions)]
+    threads = [threading.Thread(target=session.run,
+                                args=(schedule,
+                                      random.Random(options.seed + i)))
+               for i, session in enumerate(sessions)]
+
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(registry.snapshot(), time.monotonic() - schedule.started,
+                     options.sessions)
+
+
+def summarize(snapshot, elapsed, sessions):
+    '''make report of operations latency, errors and throughput
+    from metrics snapshot'''
+    operations = {}
+    errors = {}
+    bytes = {'in': 0, 'out': 0}
+    for counter in snapshot['counters']:
+        name, labels, value = (counter['name'], counter['labels'],
+                               counter['value'])
+        if name == 'loadtest_operations_total':
+            operations.setdefault(labels['operation'], {})['count'] = value
+        elif name == 'loadtest_errors_total':
+            operation = operations.setdefault(labels['operation'], {})
+            operation['errors'] = operation.get('errors', 0) + value
+            errors[labels['code']] = errors.get(labels['code'], 0) + value
+        elif name == 'ftp_bytes_total':
+            bytes[labels['direction']] += value
+    for histogram in snapshot['histograms']:
+        if histogram['name'] == 'loadtest_operation_seconds':
+            operation = operations[histogram['labels']['operation']]
+            for q in ('p50', 'p95', 'p99'):
+                operation[q] = histogram[q]
+
+    total = sum(operation['count'] for operation in operations.values())
+    failed = sum(errors.values())
+    return {'sessions': sessions,
+            'seconds': elapsed,
+            'operations': operations,
+            'errors': errors,
+            'error_rate': failed / total if total else 0,
+            'operations_per_s': total / elapsed,
+            'bytes_in': bytes['in'],
+            'bytes_out': bytes['out'],
+            'mb_per_s': (bytes['in'] + bytes['out']) / elapsed / 1e6}
+
+
+def print_report(report):
+    print('{} sessions, {:.1f} s, {:.1f} operations/s, {:.2f} MB/s, '
+          '{:.2%} errors'.format(report['sessions'], report['seconds'],
+                                 report['operations_per_s'],
+                                 report['mb_per_s'], report['error_rate']))
+    print('{:<6} {:>8} {:>7} {:>9} {:>9} {:>9}'.format(
+        'op', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, operation in sorted(report['operations'].items()):
+        print('{:<6} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            name, operation['count'], operation.get('errors', 0),
+            *(operation[q] * 1000 for q in ('p50', 'p95', 'p99'))))
+    for code, count in sorted(report['errors'].items()):
+        print('error {}: {}'.format(code, count))
+
+
+def setup_parser():
+    '''configure arguments parser'''
+    parser = argparse.ArgumentParser(
+        description='Load generator for ftp servers')
+    parser.add_argument('host', nargs='?', metavar='HOST',
+                        default='127.0.0.1',
+                        help='name of server, ignored with --local')
+    parser.add_argument('name', nargs='?', metavar='[LOGIN]',
+                        default='anonymous',
+                        help='username, default: anonymous')
+    parser.add_argument('-P', '--Password', dest='passw',
+                        default='anonymous@',
+                        help='password, default: anonymous@')
+    parser.add_argument('-p', '--port', dest='port', default=21, type=int,
+                        help='port, default: 21')
+    parser.add_argument('-C', '--credentials', metavar='FILE',
+                        help='file with "login:password" lines, sessions '
+                             'take them in turn')
+    parser.add_argument('-a', '--active', action='store_true',
+                        help='connect with active mode')
+    parser.add_argument('-s', '--sessions', type=arguments.positive_int,
+                        default=10,
+                        help='number of concurrent sessions, default: 10')
+    parser.add_argument('-r', '--rate', type=float, default=0,
+                        help='target operations per second of all '
+                             'sessions, default: 0 (as fast as possible)')
+    parser.add_argument('-t', '--duration', type=float, default=10,
+                        help='duration of test in seconds, default: 10')
+    parser.add_argument('-m', '--mix', type=mix, default=mix(MIX),
+                        help='weights of operations, default: ' + MIX)
+    parser.add_argument('-d', '--directory', default='/',
+                        help='remote directory for ls, cd and send, '
+                             'default: /')
+    parser.add_argument('-f', '--remote-file', dest='remote_file',
+                        default='loadtest.bin',
+                        help='remote file for get, default: loadtest.bin')
+    parser.add_argument('--file-size', dest='file_size', type=int,
+                        default=LOCAL_FILE_SIZE,
+                        help='size of sent file and of remote file of '
+                             'local server, default: {}'
+                             .format(LOCAL_FILE_SIZE))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of operations choice, default: 0')
+    parser.add_argument('--local', action='store_true',
+                        help='run against loopback server started '
+                             'in child process')
+    parser.add_argument('--json', action='store_true',
+                        help='print report in json')
+    return parser
+
+
+def mix(value):
+    '''argparse type for "operation=weight,..." mix'''
+    result = []
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS or not weight.isdigit():
+            raise argparse.ArgumentTypeError('Invalid mix: ' + value)
+        if int(weight):
+            result.append((operation, int(weight)))
+    if not result:
+        raise argparse.ArgumentTypeError('Invalid mix: ' + value)
+    return result
+
+
+def _reply_code(message, default):
+    code = message[:3]
+    return code if code.isdigit() else default
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+import contextlib
+import hashlib
+import multiprocessing
+import posixpath
+import socket
+import socketserver
+import threading
+import zlib
+
+
+BLOCK_SIZE = 256 * 1024
+STORE_LIMIT = 64 * 1024 * 1024
+MODIFY = '20240101000000'
+HASHES = {'SHA-256': 'sha256', 'MD5': 'md5', 'CRC32': 'crc32'}
+
+
+class SyntheticFile:
+    '''file content of given size made of repeated pattern,
+    it takes no memory however large it is'''
+    __slots__ = ('size',)
+    PATTERN = bytes(range(256)) * (BLOCK_SIZE // 256)
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def blocks(self, offset=0):
+        '''yield content from offset by blocks'''
+        position = offset
+        while position < self.size:
+            start = position % len(self.PATTERN)
+            block = self.PATTERN[start:start + self.size - position]
+            position += len(block)
+            yield block
+
+
+class DeflateStream:
+    '''data connection of MODE Z, it deflates sent data
+    and inflates received data'''
+    def __init__(self, sock, level):
+        self.sock = sock
+        self.compressor = zlib.compressobj(level)
+        self.decompressor = zlib.decompressobj()
+        self.pending = b''
+        self.sent = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *args):
+        with self.sock:
+            if self.sent and excType is None:
+                self.sock.sendall(self.compressor.flush())
+
+    def sendall(self, data):
+        self.sent = True
+        compressed = self.compressor.compress(data)
+        if compressed:
+            self.sock.sendall(compressed)
+
+    def recv_into(self, buffer):
+        while not self.pending:
+            data = self.sock.recv(len(buffer))
+            if not data:
+                self.pending = self.decompressor.flush()
+                break
+            self.pending = self.decompressor.decompress(data)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class MemoryFS:
+    '''in-memory tree of files, values are bytes or SyntheticFile'''
+    def __init__(self, files=None):
+        self.files = {}
+        self.dirs = {'/'}
+        self._lock = threading.Lock()
+        for path, content in (files or {}).items():
+            if isinstance(content, int):
+                content = SyntheticFile(content)
+            self.write(path, content)
+
+    def write(self, path, content):
+        with self._lock:
+            self.files[path] = content
+            parent = posixpath.dirname(path)
+            while parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = posixpath.dirname(parent)
+
+    def mkdir(self, path):
+        with self._lock:
+            if path in self.dirs or path in self.files:
+                return False
+            self.dirs.add(path)
+            return True
+
+    def remove(self, path):
+        with self._lock:
+            return self.files.pop(path, None) is not None
+
+    def listdir(self, path):
+        '''get sorted (name, content or None for directory) of directory'''
+        with self._lock:
+            entries = [(posixpath.basename(p), None) for p in self.dirs
+                       if p != '/' and posixpath.dirname(p) == path]
+            entries += [(posixpath.basename(p), content)
+                        for p, content in self.files.items()
+                        if posixpath.dirname(p) == path]
+        return sorted(entries, key=lambda entry: entry[0])
+
+
+class Handler(socketserver.StreamRequestHandler):
+    '''ftp session over real sockets with file tree in memory,
+    it supports commands used by ftp.Client'''
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.fs = self.server.fs
+        self.cwd = '/'
+        self.offset = 0
+        self.dataAddress = None
+        self.passive = None
+        self.mode = 'S'
+        self.level = zlib.Z_DEFAULT_COMPRESSION
+        self.hash = 'SHA-256'
+
+    def handle(self):
+        self.reply('220 loopback server')
+        for line in self.rfile:
+            line = line.decode(self.server.encoding).rstrip('\r\n')
+            command, _, argument = line.partition(' ')
+            command = command.upper()
+            if command == 'QUIT':
+                self.reply('221 Goodbye.')
+                break
+            method = getattr(self, 'ftp_' + command.lower(), None)
+            if method is None:
+                self.reply('502 Command not implemented.')
+            else:
+                method(argument)
+            if command != 'REST':
+                # restart marker is valid only for command right after it
+                self.offset = 0
+
+    def finish(self):
+        self._close_passive()
+        super().finish()
+
+    def reply(self, text):
+        self.wfile.write(text.encode(self.server.encoding) + b'\r\n')
+
+    def path(self, argument):
+        return posixpath.normpath(posixpath.join(self.cwd, argument or '.'))
+
+    def ftp_user(self, argument):
+        self.reply('331 Password required.')
+
+    def ftp_pass(self, argument):
+        self.reply('230 Login successful.')
+
+    def ftp_type(self, argument):
+        self.reply('200 Type set.')
+
+    def ftp_noop(self, argument):
+        self.reply('200 NOOP ok.')
+
+    def ftp_syst(self, argument):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_feat(self, argument):
+        self.wfile.write(b'211-Features:\r\n MLSD\r\n SIZE\r\n'
+                         b' REST STREAM\r\n MODE Z\r\n EPSV\r\n'
+                         b' HASH SHA-256*;MD5;CRC32\r\n XCRC\r\n'
+                         b'211 End\r\n')
+
+    def ftp_mode(self, argument):
+        if argument.upper() not in ('S', 'Z'):
+            self.reply('504 Unsupported mode.')
+            return
+        self.mode = argument.upper()
+        self.reply('200 Mode set to {}.'.format(self.mode))
+
+    def ftp_opts(self, argument):
+        words = argument.upper().split()
+        if words[:1] == ['HASH'] and len(words) == 2:
+            if words[1] not in HASHES:
+                self.reply('504 Unsupported hash algorithm.')
+                return
+            self.hash = words[1]
+            self.reply('200 ' + self.hash)
+            return
+        if words[:3] != ['MODE', 'Z', 'LEVEL'] or len(words) != 4 or \
+                not words[3].isdigit():
+            self.reply('501 Invalid option.')
+            return
+        self.level = int(words[3])
+        self.reply('200 Level set to {}.'.format(self.level))
+
+    def ftp_pwd(self, argument):
+        self.reply('257 "{}" is the current directory.'.format(
+            self.cwd.replace('"', '""')))
+
+    def ftp_cwd(self, argument):
+        path = self.path(argument)
+        if path not in self.fs.dirs:
+            self.reply('550 No such directory.')
+            return
+        self.cwd = path
+        self.reply('250 Directory changed.')
+
+    def ftp_mkd(self, argument):
+        path = self.path(argument)
+        if not self.fs.mkdir(path):
+            self.reply('550 Directory exists.')
+            return
+        self.reply('257 "{}" created.'.format(path))
+
+    def ftp_dele(self, argument):
+        if self.fs.remove(self.path(argument)):
+            self.reply('250 File removed.')
+        else:
+            self.reply('550 No such file.')
+
+    def ftp_size(self, argument):
+        content = self.fs.files.get(self.path(argument))
+        if content is None:
+            self.reply('550 No such file.')
+        else:
+            self.reply('213 {}'.format(len(content)))
+
+    def ftp_mdtm(self, argument):
+        if self.path(argument) not in self.fs.files:
+            self.reply('550 No such file.')
+        else:
+            self.reply('213 ' + MODIFY)
+
+    def ftp_hash(self, argument):
+        digest = self._digest(argument, HASHES[self.hash])
+        if digest is not None:
+            self.reply('213 {} 0-{} {} {}'.format(
+                self.hash, len(self.fs.files[self.path(argument)]),
+                digest, argument))
+
+    def ftp_xcrc(self, argument):
+        digest = self._digest(argument, 'crc32')
+        if digest is not None:
+            self.reply('250 ' + digest.upper())
+
+    def _digest(self, argument, algorithm):
+        content = self.fs.files.get(self.path(argument))
+        if content is None:
+            self.reply('550 No such file.')
+            return None
+        blocks = content.blocks() if isinstance(content, SyntheticFile) \
+            else [content]
+        if algorithm == 'crc32':
+            crc = 0
+            for block in blocks:
+                crc = zlib.crc32(block, crc)
+            return '{:08x}'.format(crc)
+        digest = hashlib.new(algorithm)
+        for block in blocks:
+            digest.update(block)
+        return digest.hexdigest()
+
+    def ftp_rest(self, argument):
+        self.offset = int(argument)
+        self.reply('350 Restarting at {}.'.format(self.offset))
+
+    def ftp_pasv(self, argument):
+        host, port = self._listen_passive()[:2]
+        self.reply('227 Entering Passive Mode ({},{},{}).'.format(
+            host.replace('.', ','), port // 256, port % 256))
+
+    def ftp_epsv(self, argument):
+        port = self._listen_passive()[1]
+        self.reply('229 Entering Extended Passive Mode (|||{}|).'.format(
+            port))
+
+    def ftp_port(self, argument):
+        self._close_passive()
+        numbers = argument.split(',')
+        self.dataAddress = ('.'.join(numbers[:4]),
+                            int(numbers[4]) * 256 + int(numbers[5]))
+        self.reply('200 PORT command successful.')
+
+    def ftp_eprt(self, argument):
+        self._close_passive()
+        delimiter = argument[:1]
+        protocol, host, port = argument[1:-1].split(delimiter)
+        self.dataAddress = (host, int(port))
+        self.reply('200 EPRT command successful.')
+
+    def _listen_passive(self):
+        self._close_passive()
+        self.passive = socket.socket(self.server.address_family)
+        self.passive.bind((self.server.server_address[0], 0))
+        self.passive.listen(1)
+        self.dataAddress = None
+        return self.passive.getsockname()
+
+    def ftp_list(self, argument):
+        self._send_listing(argument, _unix_line)
+
+    def ftp_nlst(self, argument):
+        self._send_listing(argument, lambda name, content: name)
+
+    def ftp_mlsd(self, argument):
+        self._send_listing(argument, _mlsd_line)
+
+    def ftp_retr(self, argument):
+        content = self.fs.files.get(self.path(argument))
+        if content is None:
+            self.reply('550 No such file.')
+            return
+
+        offset, self.offset = self.offset, 0
+        try:
+            with self._open_data('150 Opening data connection.') as sock:
+                if isinstance(content, SyntheticFile):
+                    for block in content.blocks(offset):
+                        sock.sendall(block)
+                else:
+                    view = memoryview(content)
+                    for start in range(offset, len(content), BLOCK_SIZE):
+                        sock.sendall(view[start:start + BLOCK_SIZE])
+        except OSError:
+            self.reply('426 Connection closed; transfer aborted.')
+            return
+        self.reply('226 Transfer complete.')
+
+    def ftp_allo(self, argument):
+        self.reply('202 No storage allocation necessary.')
+
+    def ftp_stor(self, argument):
+        self._store(self.path(argument), append=False)
+
+    def ftp_appe(self, argument):
+        self._store(self.path(argument), append=True)
+
+    def _store(self, path, append):
+        old = self.fs.files.get(path, b'') if append else b''
+        size = len(old)
+        data = None
+        if size <= STORE_LIMIT:
+            data = bytearray(b''.join(old.blocks())
+                             if isinstance(old, SyntheticFile) else old)
+        buffer = memoryview(bytearray(BLOCK_SIZE))
+        with self._open_data('150 Ok to send data.') as sock:
+            while True:
+                received = sock.recv_into(buffer)
+                if not received:
+                    break
+                size += received
+                if size > STORE_LIMIT:
+                    data = None
+                elif data is not None:
+                    data += buffer[:received]
+        self.fs.write(path, SyntheticFile(size) if data is None
+                      else bytes(data))
+        self.reply('226 Transfer complete.')
+
+    def _send_listing(self, argument, format):
+        path = self.path(argument)
+        if path not in self.fs.dirs:
+            self.reply('550 No such directory.')
+            return
+        lines = [format(name, content) + '\r\n'
+                 for name, content in self.fs.listdir(path)]
+        with self._open_data('150 Here comes the listing.') as sock:
+            sock.sendall(''.join(lines).encode(self.server.encoding))
+        self.reply('226 Directory send OK.')
+
+    def _open_data(self, preliminary):
+        '''open data connection of PASV or PORT after preliminary reply'''
+        self.reply(preliminary)
+        if self.passive is not None:
+            sock, _ = self.passive.accept()
+            self._close_passive()
+        else:
+            sock = socket.create_connection(self.dataAddress)
+        if self.mode == 'Z':
+            return DeflateStream(sock, self.level)
+        return sock
+
+    def _close_passive(self):
+        if self.passive is not None:
+            self.passive.close()
+            self.passive = None
+
+
+class LoopbackServer(socketserver.ThreadingTCPServer):
+    '''threaded ftp server on loopback interface serving MemoryFS,
+    use port 0 to take any free port'''
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, fs=None, port=0, host='127.0.0.1', encoding='utf-8'):
+        if ':' in host:
+            self.address_family = socket.AF_INET6
+        super().__init__((host, port), Handler)
+        self.fs = fs or MemoryFS()
+        self.encoding = encoding
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        '''serve in background thread'''
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@contextlib.contextmanager
+def serve_in_process(files):
+    '''run loopback server with files (sizes of synthetic files or bytes)
+    in child process, so it does not share cpu time and interpreter lock
+    with client, yield its port'''
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(files, child),
+                                      daemon=True)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _serve(files, connection):
+    server = LoopbackServer(MemoryFS(files))
+    connection.send(server.port)
+    server.serve_forever()
+
+
+def _unix_line(name, content):
+    if content is None:
+        return 'drwxr-xr-x 2 owner group 0 Jan 01 00:00 ' + name
+    return '-rw-r--r-- 1 owner group {} Jan 01 2024 {}'.format(
+        len(content), name)
+
+
+def _mlsd_line(name, content):
+    if content is None:
+        return 'type=dir;modify={}; {}'.format(MODIFY, name)
+    return 'type=file;size={};modify={}; {}'.format(len(content), MODIFY,
+                                                     name)
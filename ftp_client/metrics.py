@@ -0,0 +1,188 @@
+import collections
+import contextlib
+import json
+import math
+import threading
+import time
+
+
+SAMPLES = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+HELP = {
+    'ftp_command_seconds': 'latency of control connection commands',
+    'ftp_phase_seconds': 'latency of data connection setup phases',
+    'ftp_transfer_seconds': 'duration of data transfers',
+    'ftp_transfer_bytes_per_second': 'throughput of data transfers',
+    'ftp_bytes_total': 'bytes transferred over data connections',
+    'ftp_logical_bytes_total': 'bytes of files and listings before '
+                               'compression',
+    'ftp_transfers_total': 'number of data transfers',
+    'ftp_reconnects_total': 'number of reconnections to server',
+    'ftp_error_replies_total': 'number of negative replies by code'}
+
+
+class Histogram:
+    '''count and sum of all observed values and quantiles
+    of the last SAMPLES of them'''
+    __slots__ = ('count', 'sum', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.samples = collections.deque(maxlen=SAMPLES)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantile(self, q):
+        '''get q-quantile by nearest rank, None if nothing is observed'''
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class Meter:
+    '''progress of transfer which also counts transferred bytes,
+    wire bytes are counted separately only for compressed transfers'''
+    __slots__ = ('bar', 'bytes', 'wire')
+
+    def __init__(self, bar=None):
+        self.bar = bar
+        self.bytes = 0
+        self.wire = None
+
+    def update(self, length):
+        self.bytes += length
+        if self.bar is not None:
+            self.bar.update(length)
+
+    def update_wire(self, length):
+        self.wire = (self.wire or 0) + length
+        if self.bar is not None:
+            self.bar.update_wire(length)
+
+    def finish(self):
+        self.bar.finish()
+
+
+class Metrics:
+    '''registry of labeled counters and histograms of client,
+    it can be shared by sessions working in several threads'''
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        '''observe time spent inside in seconds'''
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - started, **labels)
+
+    @contextlib.contextmanager
+    def transfer(self, direction, meter):
+        '''record bytes counted by meter inside, duration
+        and throughput of transfer'''
+        started = self.clock()
+        try:
+            yield meter
+        finally:
+            elapsed = self.clock() - started
+            wire = meter.bytes if meter.wire is None else meter.wire
+            self.count('ftp_bytes_total', wire, direction=direction)
+            self.count('ftp_logical_bytes_total', meter.bytes,
+                       direction=direction)
+            self.count('ftp_transfers_total', direction=direction)
+            self.observe('ftp_transfer_seconds', elapsed,
+                         direction=direction)
+            if elapsed > 0:
+                self.observe('ftp_transfer_bytes_per_second',
+                             wire / elapsed, direction=direction)
+
+    def snapshot(self):
+        '''get all metrics as dictionary of plain values'''
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels),
+                         'value': value}
+                        for (name, labels), value
+                        in sorted(self.counters.items())]
+            histograms = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                item = {'name': name, 'labels': dict(labels),
+                        'count': histogram.count, 'sum': histogram.sum}
+                for q in QUANTILES:
+                    item['p{:g}'.format(q * 100)] = histogram.quantile(q)
+                histograms.append(item)
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        '''format metrics in prometheus text exposition format'''
+        snapshot = self.snapshot()
+        lines = []
+        described = set()
+
+        def describe(name, type):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append('# HELP {} {}'.format(name, HELP[name]))
+                lines.append('# TYPE {} {}'.format(name, type))
+
+        for counter in snapshot['counters']:
+            describe(counter['name'], 'counter')
+            lines.append('{}{} {}'.format(counter['name'],
+                                          _labels(counter['labels']),
+                                          counter['value']))
+        for histogram in snapshot['histograms']:
+            name, labels = histogram['name'], histogram['labels']
+            describe(name, 'summary')
+            for q in QUANTILES:
+                value = histogram['p{:g}'.format(q * 100)]
+                lines.append('{}{} {}'.format(
+                    name, _labels(dict(labels, quantile=str(q))),
+                    'NaN' if value is None else repr(value)))
+            lines.append('{}_sum{} {!r}'.format(name, _labels(labels),
+                                                histogram['sum']))
+            lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        '''write metrics to file, in prometheus format if its
+        extension is .prom and in json otherwise'''
+        text = (self.to_prometheus() if path.endswith('.prom')
+                else self.to_json() + '\n')
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"'))
+        for key, value in sorted(labels.items())))
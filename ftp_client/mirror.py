@@ -0,0 +1,193 @@
+import contextlib
+import os
+import posixpath
+import sqlite3
+
+
+MANIFEST_NAME = '.ftp-mirror.sqlite'
+
+
+class Manifest:
+    '''sqlite index of mirrored files: size and modification time
+    of every file at the moment it was transferred'''
+    def __init__(self, path, source):
+        self.source = source
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files ('
+                        'source TEXT, path TEXT, size INTEGER, modify TEXT, '
+                        'PRIMARY KEY (source, path))')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, path):
+        '''get (size, modify) of file or None if it is not tracked'''
+        return self.db.execute(
+            'SELECT size, modify FROM files WHERE source = ? AND path = ?',
+            (self.source, path)).fetchone()
+
+    def update(self, path, size, modify):
+        '''store facts of transferred file at once'''
+        self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                        (self.source, path, size, modify))
+        self.db.commit()
+
+    def remove(self, path):
+        self.db.execute('DELETE FROM files WHERE source = ? AND path = ?',
+                        (self.source, path))
+        self.db.commit()
+
+    def paths(self):
+        '''get set of tracked paths'''
+        return {path for path, in self.db.execute(
+            'SELECT path FROM files WHERE source = ?', (self.source,))}
+
+    def close(self):
+        self.db.close()
+
+
+def download(client, remoteDir, localDir, delete=False):
+    '''receive new and changed files of remote tree into local directory,
+    return (transferred, skipped, deleted) counts'''
+    os.makedirs(localDir, exist_ok=True)
+    source = '{}:{}'.format(client.hostName,
+                            client.absolute_path(remoteDir))
+    transferred = skipped = 0
+    seen = set()
+
+    client.send_cmd('TYPE I')
+    with Manifest(os.path.join(localDir, MANIFEST_NAME), source) as manifest:
+        for path, entry in _walk_remote(client, remoteDir,
+                                        client.absolute_path()):
+            if path.startswith(MANIFEST_NAME):
+                continue
+            seen.add(path)
+            remotePath = posixpath.join(remoteDir, path)
+            localPath = os.path.join(localDir, *path.split('/'))
+            facts = _remote_facts(client, remotePath, entry)
+            if (_unchanged(manifest.get(path), facts) and
+                    os.path.isfile(localPath)):
+                skipped += 1
+                continue
+
+            os.makedirs(os.path.dirname(localPath), exist_ok=True)
+            # changed file is received in full, resuming would keep
+            # its old content
+            client.get_file(remotePath, localPath, resume=False)
+            manifest.update(path, *facts)
+            transferred += 1
+
+        deleted = 0
+        if delete:
+            for path in manifest.paths() - seen:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(localDir, *path.split('/')))
+                manifest.remove(path)
+                deleted += 1
+    return transferred, skipped, deleted
+
+
+def upload(client, localDir, remoteDir, delete=False):
+    '''send new and changed files of local tree into remote directory,
+    return (transferred, skipped, deleted) counts'''
+    source = '{}:{}'.format(client.hostName,
+                            client.absolute_path(remoteDir))
+    transferred = skipped = 0
+    seen = set()
+    made = set()
+
+    with Manifest(os.path.join(localDir, MANIFEST_NAME), source) as manifest:
+        for root, dirs, files in os.walk(localDir):
+            dirs.sort()
+            relativeRoot = os.path.relpath(root, localDir)
+            relativeRoot = ('' if relativeRoot == '.'
+                            else relativeRoot.replace(os.sep, '/'))
+            for name in sorted(files):
+                if not relativeRoot and name.startswith(MANIFEST_NAME):
+                    continue
+                path = posixpath.join(relativeRoot, name)
+                seen.add(path)
+                stat = os.stat(os.path.join(root, name))
+                facts = (stat.st_size, str(stat.st_mtime_ns))
+                if manifest.get(path) == facts:
+                    skipped += 1
+                    continue
+
+                _make_remote_dirs(client, remoteDir, relativeRoot, made)
+                client.send_file(os.path.join(root, name),
+                                 posixpath.join(remoteDir, path),
+                                 resume=False)
+                manifest.update(path, *facts)
+                transferred += 1
+
+        deleted = 0
+        if delete:
+            for path in manifest.paths() - seen:
+                # file which was not deleted stays tracked to retry later
+                resp = client.delete(posixpath.join(remoteDir, path))
+                if not resp.startswith('2'):
+                    continue
+                manifest.remove(path)
+                deleted += 1
+    return transferred, skipped, deleted
+
+
+def _make_remote_dirs(client, remoteDir, relative, made):
+    '''make remote directory and all its parents once per mirroring'''
+    parts = relative.split('/') if relative else []
+    for i in range(len(parts) + 1):
+        path = posixpath.join(remoteDir, *parts[:i])
+        if path not in made:
+            client.mkdir(path)
+            made.add(path)
+
+
+def _walk_remote(client, remoteDir, workdir, relative=''):
+    '''yield (relative path, entry) for all files of remote tree,
+    entry of unknown type is probed by CWD like get does'''
+    for entry in client.mlsd(posixpath.join(remoteDir, relative)):
+        path = posixpath.join(relative, entry.name)
+        if entry.is_dir or entry.type is None and _is_remote_dir(
+                client, posixpath.join(remoteDir, path), workdir):
+            yield from _walk_remote(client, remoteDir, workdir, path)
+        elif entry.is_file or entry.type is None:
+            yield path, entry
+
+
+def _is_remote_dir(client, remotePath, workdir):
+    '''check by CWD that remote path is directory, working directory
+    is restored after successful probe'''
+    if client.cd(remotePath).startswith('5'):
+        return False
+    client.cd(workdir)
+    return True
+
+
+def _unchanged(stored, facts):
+    '''check that known facts of remote file match ones stored in
+    manifest, file without known facts is always transferred'''
+    if stored is None or facts == (None, None):
+        return False
+    return all(fact == old for fact, old in zip(facts, stored)
+               if fact is not None)
+
+
+def _remote_facts(client, remotePath, entry):
+    '''get (size, modify) of remote file, asking server by SIZE and MDTM
+    for facts missing in listing'''
+    size, modify = entry.size, entry.modify
+    if size is None:
+        resp = client.size(remotePath)
+        if resp.startswith('213'):
+            size = int(resp.split(' ')[-1])
+    if modify is None:
+        resp = client.send_cmd('MDTM', remotePath)
+        if resp.startswith('213'):
+            modify = resp.split(' ')[-1].strip()[:14]
+    return size, modify
@@ -0,0 +1,146 @@
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import exceptions as exc
+import pipeline
+
+
+SEGMENT_RETRIES = 3
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+
+class SharedProgress:
+    '''progress bar which can be updated from several threads'''
+    def __init__(self, bar):
+        self.bar = bar
+        self._lock = threading.Lock()
+
+    def update(self, length):
+        with self._lock:
+            self.bar.update(length)
+
+    def update_wire(self, length):
+        with self._lock:
+            self.bar.update_wire(length)
+
+
+class SessionPool:
+    '''pool of logged in sessions which run queued commands at once'''
+    def __init__(self, client, size, directory=''):
+        self.sessions = []
+        self._lock = threading.Lock()
+        self._resp = ''
+        try:
+            for _ in range(size):
+                self.sessions.append(client.spawn_session(directory))
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run(self, tasks):
+        '''run (command, *args) tasks on free sessions,
+        return resp of the last finished task'''
+        work = queue.Queue()
+        for task in tasks:
+            work.put(task)
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(len(self.sessions)) as executor:
+            futures = [executor.submit(self._work, session, work, stop)
+                       for session in self.sessions]
+        for future in futures:
+            future.result()
+        return self._resp
+
+    def _work(self, session, work, stop):
+        '''run tasks from queue until it is empty or some task failed'''
+        while not stop.is_set():
+            try:
+                command, *args = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                resp = getattr(session, command)(*args)
+            except Exception:
+                stop.set()
+                raise
+            with self._lock:
+                self._resp = resp
+
+    def close(self):
+        '''terminate all sessions of pool'''
+        for session in self.sessions:
+            with contextlib.suppress(Exception):
+                session.close()
+        self.sessions = []
+
+
+def split_ranges(size, jobs):
+    '''split file of given size to list of (offset, length) ranges'''
+    jobs = max(1, min(jobs, size // MIN_SEGMENT_SIZE))
+    step, rest = divmod(size, jobs)
+    ranges = []
+    offset = 0
+    for i in range(jobs):
+        length = step + (1 if i < rest else 0)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+
+def get_segmented(client, directory, remoteFile, localFile, size, jobs,
+                  bar):
+    '''receive remote file from remote directory by ranges
+    over several sessions at once'''
+    ranges = split_ranges(size, jobs)
+    with open(localFile, 'wb') as f:
+        if not pipeline.preallocate(f, size):
+            f.truncate(size)
+
+    bar = SharedProgress(bar)
+    with ThreadPoolExecutor(len(ranges)) as executor:
+        futures = [executor.submit(_get_segment, client, directory,
+                                   remoteFile, localFile, offset, length,
+                                   bar)
+                   for offset, length in ranges]
+        resps = [future.result() for future in futures]
+    return resps[-1]
+
+
+def _get_segment(client, directory, remoteFile, localFile, offset, length,
+                 bar):
+    '''receive one range of file, reopening session after growing delay
+    on connection failures, negative replies are not retried'''
+    end = offset + length
+    delay = client.config.retryDelay
+    with open(localFile, 'r+b') as f:
+        f.seek(offset)
+        for attempt in range(SEGMENT_RETRIES + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            session = None
+            try:
+                session = client.spawn_session(directory)
+                resp = session.retr_range(remoteFile, f, end - f.tell(), bar)
+                if f.tell() == end:
+                    return resp
+            except exc.NETWORK_ERRORS:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+            finally:
+                if session is not None:
+                    with contextlib.suppress(Exception):
+                        session.close()
+
+    raise exc.FailedOperationException(
+          'Could not receive bytes {}-{} of {}'.format(offset, end,
+                                                      remoteFile))
@@ -0,0 +1,108 @@
+import contextlib
+import errno
+import os
+import queue
+import stat
+import threading
+
+
+DEPTH = 4
+
+
+class WriteBehind:
+    '''writer thread which drains ring of reusable buffers filled by
+    receiver to file, so slow disk does not stall socket, receiver waits
+    for free buffer when all depth buffers are filled; the thread is
+    started by second block, so one-block files are written in place'''
+    def __init__(self, f, bufferSize, depth=DEPTH):
+        self.f = f
+        self.bufferSize = bufferSize
+        self.depth = depth
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        self._allocated = 0
+        self._pending = None
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+            return
+        # error of writer must not replace error which is raised,
+        # for example of socket, as it decides on retry and cleanup
+        with contextlib.suppress(Exception):
+            self.close()
+
+    def buffer(self):
+        '''get free buffer, waiting for writer if all of them are filled'''
+        if self._error is not None:
+            raise self._error
+        if self._free.empty():
+            if self._allocated < self.depth:
+                self._allocated += 1
+                return memoryview(bytearray(self.bufferSize))
+            if self._thread is None:
+                self._start()
+        return self._free.get()
+
+    def write(self, buffer, length):
+        '''queue first length bytes of buffer for writing'''
+        if self._thread is None:
+            if self._pending is None:
+                self._pending = (buffer, length)
+                return
+            self._start()
+        self._filled.put((buffer, length))
+
+    def close(self):
+        '''wait until queued blocks are written, raise error of writer'''
+        if self._thread is not None:
+            self._filled.put(None)
+            self._thread.join()
+            self._thread = None
+        elif self._pending is not None:
+            buffer, length = self._pending
+            self.f.write(buffer[:length])
+        self._pending = None
+        if self._error is not None:
+            raise self._error
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._filled.put(self._pending)
+
+    def _run(self):
+        while True:
+            item = self._filled.get()
+            if item is None:
+                break
+            buffer, length = item
+            if self._error is None:
+                try:
+                    self.f.write(buffer[:length])
+                except Exception as e:
+                    self._error = e
+            self._free.put(buffer)
+
+
+def preallocate(f, size):
+    '''reserve disk space of regular file of known size, so it is not
+    fragmented and lack of space is found before transfer'''
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+            return False
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, TypeError, ValueError):
+        return False
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        return False
+    return True
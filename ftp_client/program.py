@@ -10,6 +10,7 @@ import contextlib
 ERROR_EXCEPTION = 1
 ERROR_MODULES_MISSING = 2
 ERROR_LOGIN = 3
+KEEPALIVE = 60
 
 if sys.platform.startswith('linux'):
     import readline
@@ -20,61 +21,115 @@ try:
     import help
     import progress
     import fakeserver
+    import arguments
+    import checksum
 except Exception as e:
     print('Program modules not found: "{}"'.format(e), file=sys.stderr)
     sys.exit(ERROR_MODULES_MISSING)
 
 
 def main():
-    client = ftp.Client()
     parser = setup_parser()
     args = parser.parse_args()
+    metricsFile = args.metrics_file
 
     try:
-        ftp.IS_ACTIVE = args.active
-        ftp.DEBUG = args.debug
-        ftp.ENCODING = args.encoding
+        config = ftp.Config(
+            isActive=args.active,
+            debug=args.debug,
+            encoding=args.encoding,
+            bufferSize=args.buffer_size,
+            jobs=args.jobs,
+            resume=args.resume,
+            cacheTtl=args.cache_ttl,
+            cacheSize=args.cache_size,
+            limitRate=args.limit_rate,
+            transferLimitRate=args.transfer_limit_rate,
+            compression=args.compress,
+            checksum=args.checksum,
+            writeBuffers=args.write_buffers,
+            mmap=args.mmap,
+            epsv=args.epsv,
+            prefetch=args.prefetch)
+        client = ftp.Client(config)
         print(client.connect(args.host, args.port))
         print(client.login(args.name, args.passw))
+        if args.keepalive:
+            client.start_keepalive(args.keepalive)
     except Exception as e:
         print(str(e), file=sys.stderr)
         sys.exit(ERROR_LOGIN)
 
+    # commands of -c options leave stdin free for data of send -
+    requests = iter(args.commands) if args.commands else None
+    failed = False
     while True:
         try:
-            request = input('> ')
+            request = read_request(requests)
             try:
                 command, *args = shlex.split(request)
             except Exception:
                 print('?Invalid command')
+                failed = True
                 continue
             if command not in client.commands:
                 print('?Invalid command')
+                failed = True
                 continue
             resp = execute_command(client, command, *args)
         except (EOFError, KeyboardInterrupt):
             initiate_exit(client)
         except Exception as e:
             print(str(e), file=sys.stderr)
+            failed = True
         else:
-            if ftp.DEBUG or command == 'reconnect' or command == 'help':
-                print(resp)
+            stream = sys.stderr if writes_data(command, args) else sys.stdout
+            if (client.config.debug or command == 'reconnect' or
+                    command == 'help'):
+                print(resp, file=stream)
+            for result in client.checksums.values():
+                print(result, file=stream)
 
         if client.timeToExit:
             break
 
+    if metricsFile:
+        try:
+            client.metrics.dump(metricsFile)
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+    if failed and requests is not None:
+        sys.exit(ERROR_EXCEPTION)
+
+
+def read_request(requests):
+    '''get next command line from -c options or from user'''
+    if requests is None:
+        return input('> ')
+    request = next(requests, None)
+    if request is None:
+        raise EOFError
+    return request
+
 
 def execute_command(client, command, *args):
     if (command not in client.UNDEMANDING_COMMANDS
-            and not client.isConnected):
+            and not client.isConnected and not client.isLost):
         raise exceptions.NotConnectedException('Not connected.')
 
-    resp = client.commands[command](*args)
+    resp = client.execute(command, *args)
     if ftp.ERROR_PATTERN.match(resp):
         raise exceptions.FailedOperationException(resp)
     return resp
 
 
+def writes_data(command, args):
+    '''check if command writes transferred data to stdout'''
+    args = [arg for i, arg in enumerate(args)
+            if arg != '-j' and args[i - 1:i] != ['-j']]
+    return command == 'get' and args[1:2] == ['-']
+
+
 def setup_parser():
     '''configure arguments parser'''
     name = os.path.basename(sys.argv[0])
@@ -100,6 +155,82 @@ def setup_parser():
     parser.add_argument('-a', '--active', action='store_true',
                         dest='active',
                         help='connect with active mode')
+    parser.add_argument('-b', '--buffer-size', dest='buffer_size',
+                        default=ftp.BUFFER_SIZE,
+                        type=arguments.positive_int,
+                        help='size of transfer blocks in bytes, '
+                             'default: {}'.format(ftp.BUFFER_SIZE))
+    parser.add_argument('-j', '--jobs', dest='jobs', default=1,
+                        type=arguments.positive_int,
+                        help='number of sessions for get and send, '
+                             'default: 1')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        dest='resume',
+                        help='continue partial transfers instead of '
+                             'starting them again')
+    parser.add_argument('--cache-ttl', dest='cache_ttl', default=0,
+                        type=float, metavar='SECONDS',
+                        help='keep listings of remote directories for '
+                             'SECONDS, default: 0 (no cache)')
+    parser.add_argument('--cache-size', dest='cache_size',
+                        default=ftp.CACHE_SIZE,
+                        type=arguments.positive_int,
+                        help='maximum number of cached directories, '
+                             'default: {}'.format(ftp.CACHE_SIZE))
+    parser.add_argument('--limit-rate', dest='limit_rate', default=0,
+                        type=arguments.rate, metavar='RATE',
+                        help='limit bandwidth of all transfers to RATE '
+                             'bytes per second, K, M and G suffixes are '
+                             'allowed, default: 0 (no limit)')
+    parser.add_argument('--transfer-limit-rate', dest='transfer_limit_rate',
+                        default=0, type=arguments.rate, metavar='RATE',
+                        help='limit bandwidth of each transfer to RATE '
+                             'bytes per second, default: 0 (no limit)')
+    parser.add_argument('-z', '--compress', dest='compress', nargs='?',
+                        default=0, const=6,
+                        type=arguments.compression_level,
+                        metavar='LEVEL',
+                        help='compress transfers and listings by MODE Z '
+                             'with deflate LEVEL from 1 to 9 if server '
+                             'supports it, default LEVEL: 6')
+    parser.add_argument('--write-buffers', dest='write_buffers',
+                        default=ftp.WRITE_BUFFERS,
+                        type=arguments.positive_int,
+                        metavar='N',
+                        help='number of blocks received ahead of writing '
+                             'them to disk in separate thread, 1 writes '
+                             'them in place, default: {}'
+                             .format(ftp.WRITE_BUFFERS))
+    parser.add_argument('--mmap', action='store_true', dest='mmap',
+                        help='receive files of known size straight into '
+                             'memory map of local file')
+    parser.add_argument('--epsv', action='store_true', dest='epsv',
+                        help='open data connections by EPSV and EPRT, '
+                             'which need no address of host and work '
+                             'through NAT, they are always used over IPv6')
+    parser.add_argument('--prefetch', action='store_true', dest='prefetch',
+                        help='request data connection of next transfer '
+                             'together with end of current one')
+    parser.add_argument('--checksum', dest='checksum',
+                        choices=checksum.ALGORITHMS,
+                        help='hash data of get and send while it is '
+                             'transferred and compare it with hash of '
+                             'server (HASH, XCRC, XMD5) if it supports it')
+    parser.add_argument('--keepalive', dest='keepalive',
+                        default=KEEPALIVE, type=float, metavar='SECONDS',
+                        help='send NOOP after SECONDS of idle session so '
+                             'server does not close it, 0 disables it, '
+                             'default: {}'.format(KEEPALIVE))
+    parser.add_argument('-c', '--command', dest='commands',
+                        action='append', metavar='COMMAND',
+                        help='run COMMAND and exit instead of reading '
+                             'commands from stdin, can be repeated, '
+                             'exit code is 1 if any of them fails')
+    parser.add_argument('--metrics-file', dest='metrics_file',
+                        metavar='FILE',
+                        help='write metrics of session to FILE on exit, '
+                             'in prometheus text format if FILE ends '
+                             'with .prom and in json otherwise')
     return parser
 
 
@@ -1,23 +1,163 @@
-from progressbar import Percentage, ProgressBar, FileTransferSpeed, ETA
+import sys
+import threading
+import time
+from progressbar import (Percentage, ProgressBar, FileTransferSpeed, ETA,
+                         DataSize, UnknownLength)
+
+
+REFRESH_INTERVAL = 0.25
 
 
 class Progress:
-    def __init__(self, size):
-        self.size = int(size.split(' ')[-1])
-        p_format = '%(percentage)3d%%    '
-        self.pbar =\
-            ProgressBar(widgets=[Percentage(format=p_format),
-                                 ETA(), FileTransferSpeed()],
-                        max_value=self.size)
+    '''progress of one transfer, counts bytes and redraws bar
+    not more often than REFRESH_INTERVAL, only on terminal'''
+    def __init__(self, size=None, stream=None):
+        self.size = size
         self.counter = 0
-        # self.pbar.start()
+        self.wire = 0
+        self.stream = stream or sys.stdout
+        self.visible = _is_terminal(self.stream)
+        self.pbar = None
+        self._nextDraw = 0
 
     def update(self, length):
         self.counter += length
-        updateValue = self.counter
+        if self.visible:
+            now = time.monotonic()
+            if now >= self._nextDraw:
+                self._nextDraw = now + REFRESH_INTERVAL
+                self._draw()
 
-        if updateValue >= self.size:
+    def update_wire(self, length):
+        '''count bytes of compressed transfer which went over network'''
+        self.wire += length
+
+    def finish(self):
+        if self.visible:
+            self._draw()
             self.pbar.finish()
+            if self.wire:
+                print(_wire_summary(self.counter, self.wire),
+                      file=self.stream)
+            self.visible = False
+
+    def _draw(self):
+        if self.pbar is None:
+            if self.size:
+                p_format = '%(percentage)3d%%    '
+                widgets = [Percentage(format=p_format), ETA(),
+                           FileTransferSpeed()]
+            else:
+                widgets = [DataSize(), '    ', FileTransferSpeed()]
+            self.pbar =\
+                ProgressBar(widgets=widgets,
+                            max_value=self.size or UnknownLength,
+                            fd=self.stream)
+            self.pbar.start()
+        if self.size:
+            self.pbar.update(min(self.counter, self.size))
         else:
-            self.pbar.update(updateValue)
-        print(end='\r')
+            self.pbar.update(self.counter)
+
+
+class AggregateProgress:
+    '''summary progress of many transfers, which can be made from
+    several threads: bytes, files done and remaining, speed and ETA'''
+    def __init__(self, totalBytes=None, totalFiles=None, stream=None):
+        self.totalBytes = totalBytes
+        self.totalFiles = totalFiles
+        self.bytes = 0
+        self.wire = 0
+        self.files = 0
+        self.stream = stream or sys.stdout
+        self.visible = _is_terminal(self.stream)
+        self.started = time.monotonic()
+        self._nextDraw = 0
+        self._lock = threading.Lock()
+
+    def transfer(self, size=None):
+        '''make progress of one transfer counted in this summary'''
+        return Transfer(self)
+
+    def update(self, length):
+        with self._lock:
+            self.bytes += length
+            if self.visible:
+                now = time.monotonic()
+                if now >= self._nextDraw:
+                    self._nextDraw = now + REFRESH_INTERVAL
+                    self._draw(now)
+
+    def update_wire(self, length):
+        with self._lock:
+            self.wire += length
+
+    def file_done(self):
+        with self._lock:
+            self.files += 1
+            if self.visible:
+                self._draw(time.monotonic())
+
+    def finish(self):
+        with self._lock:
+            if self.visible:
+                self._draw(time.monotonic())
+                print(file=self.stream)
+                self.visible = False
+
+    def _draw(self, now):
+        elapsed = max(now - self.started, 1e-6)
+        speed = self.bytes / elapsed
+        files = str(self.files)
+        if self.totalFiles is not None:
+            files += '/{}'.format(self.totalFiles)
+        done = format_bytes(self.bytes)
+        if self.totalBytes is not None:
+            done += '/' + format_bytes(self.totalBytes)
+
+        line = '{} files  {}  {}/s'.format(files, done, format_bytes(speed))
+        if self.wire:
+            line += '  ' + _wire_summary(self.bytes, self.wire)
+        if self.totalBytes is not None and speed:
+            eta = max(self.totalBytes - self.bytes, 0) / speed
+            line += '  ETA {:02}:{:02}:{:02}'.format(
+                int(eta // 3600), int(eta // 60 % 60), int(eta % 60))
+        print('\r' + line, end='\x1b[K', file=self.stream, flush=True)
+
+
+class Transfer:
+    '''progress of one transfer of aggregate progress'''
+    __slots__ = ('aggregate',)
+
+    def __init__(self, aggregate):
+        self.aggregate = aggregate
+
+    def update(self, length):
+        self.aggregate.update(length)
+
+    def update_wire(self, length):
+        self.aggregate.update_wire(length)
+
+    def finish(self):
+        self.aggregate.file_done()
+
+
+def format_bytes(number):
+    '''format number of bytes with binary unit'''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if number < 1024:
+            return '{:.1f} {}'.format(number, unit)
+        number /= 1024
+    return '{:.1f} TiB'.format(number)
+
+
+def _wire_summary(logical, wire):
+    return '{} on wire ({:.1f}x)'.format(format_bytes(wire),
+                                         logical / wire if wire else 0)
+
+
+def _is_terminal(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
@@ -0,0 +1,60 @@
+import collections
+import exceptions as exc
+
+
+END_OF_LINE = '\r\n'
+
+
+class Reply(collections.namedtuple('Reply', 'code lines')):
+    '''parsed reply of ftp server: three-digit code and lines of text'''
+    __slots__ = ()
+
+    @property
+    def text(self):
+        '''reply as it was sent by server'''
+        return END_OF_LINE.join(self.lines) + END_OF_LINE
+
+    @property
+    def is_error(self):
+        '''check that reply is transient or permanent negative'''
+        return self.code[:1] in ('4', '5')
+
+
+class ReplyReader:
+    '''incremental reader of rfc 959 replies from control socket,
+    bytes received after the end of reply are kept for the next one'''
+    def __init__(self, sock, encoding='utf-8', blockSize=4096):
+        self.sock = sock
+        self.encoding = encoding
+        self.blockSize = blockSize
+        self._buffer = bytearray()
+        self._searched = 0
+
+    def read(self):
+        '''read next reply from socket'''
+        line = self._readline()
+        lines = [line]
+        if line[3:4] == '-':
+            end = line[:3] + ' '
+            while not line.startswith(end):
+                line = self._readline()
+                lines.append(line)
+        return Reply(line[:3], lines)
+
+    def _readline(self):
+        '''read one line without line ending'''
+        while True:
+            index = self._buffer.find(b'\n', self._searched)
+            if index >= 0:
+                break
+            self._searched = len(self._buffer)
+            data = self.sock.recv(self.blockSize)
+            if not data:
+                raise exc.NotConnectedException(
+                    'Connection closed by remote server.')
+            self._buffer += data
+
+        line = bytes(self._buffer[:index])
+        del self._buffer[:index + 1]
+        self._searched = 0
+        return line.decode(self.encoding).rstrip('\r')
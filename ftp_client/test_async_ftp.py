@@ -0,0 +1,75 @@
+import unittest
+import os
+import tempfile
+import async_ftp
+import exceptions
+import fakeserver as fk
+
+
+class AsyncTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.serv = fk.AsyncFakeServer()
+        port = await self.serv.start()
+        self.client = async_ftp.AsyncClient()
+        self.banner = await self.client.connect('127.0.0.1', port)
+        await self.client.login('me', 'qwerty')
+        self.directory = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        if self.client.isConnected:
+            await self.client.close()
+        await self.serv.stop()
+        self.directory.cleanup()
+
+    async def test_multiline_banner(self):
+        self.assertEqual(self.banner,
+                         '220-Welcome\r\n220-to fake\r\n220 server\r\n')
+
+    async def test_login_incorrect(self):
+        with self.assertRaises(exceptions.FailedOperationException):
+            await self.client.login('me', 'smth')
+
+    async def test_list_of_files(self):
+        self.assertEqual(await self.client.ls(), ['file1', 'file2'])
+
+    async def test_slow_listing(self):
+        self.client.config.timeout = 0.3
+        self.serv.delay = 0.2
+        self.serv.files.update(('file{}'.format(i), b'') for i in range(3, 6))
+        self.assertEqual(await self.client.ls(),
+                         ['file{}'.format(i) for i in range(1, 6)])
+
+    async def test_get_file(self):
+        localFile = os.path.join(self.directory.name, 'file1')
+        result = await self.client.get('file1', localFile)
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        with open(localFile, 'rb') as f:
+            self.assertEqual(f.read(), b'file1data')
+
+    async def test_get_missing_file(self):
+        localFile = os.path.join(self.directory.name, 'file')
+        with self.assertRaises(exceptions.FailedOperationException):
+            await self.client.get('file', localFile)
+
+    async def test_send_file_active_mode(self):
+        self.client.config.isActive = True
+        localFile = os.path.join(self.directory.name, 'file4')
+        with open(localFile, 'wb') as f:
+            f.write(b'file4data')
+        result = await self.client.send(localFile, 'file4')
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.assertEqual(self.serv.files['file4'], b'file4data')
+        self.assertEqual(await self.client.size('file4'), '213 9\r\n')
+
+    async def test_cd_and_mkdir(self):
+        self.assertTrue((await self.client.cd('newdir')).startswith('550'))
+        await self.client.mkdir('newdir')
+        self.assertTrue((await self.client.cd('newdir')).startswith('250'))
+
+    async def test_close(self):
+        self.assertEqual(await self.client.close(), '221 Goodbye.\r\n')
+        self.assertFalse(self.client.isConnected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+import benchmark
+import ftp
+import loopserver
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_run(self):
+        report = benchmark.run([1024], [3], ['pasv'], repeat=1)
+        self.assertEqual([result['case'] for result in report['results']],
+                         ['get', 'send', 'send_stream', 'ls', 'get_tree',
+                          'send_tree'])
+        result = report['results'][0]
+        self.assertEqual((result['size'], result['count']), (1024, 1))
+        self.assertGreater(result['mb_per_s'], 0)
+
+    def test_send_stream(self):
+        serv = loopserver.LoopbackServer().start()
+        client = ftp.Client()
+        try:
+            client.connect('127.0.0.1', serv.port)
+            client.login('me', 'qwerty')
+            timings = benchmark._send_stream(client, 4 * 1024 ** 2)
+        finally:
+            client.close()
+            serv.stop()
+        self.assertLess(timings['first_byte_seconds'],
+                        timings['producer_seconds'])
+        self.assertEqual(len(serv.fs.files['/stream']), 4 * 1024 ** 2)
+
+    def test_missing_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run(
+                [sys.executable, benchmark.__file__, '-s', '1K', '-c', '1',
+                 '-m', 'pasv', '-n', '1', '-o', os.devnull, '--baseline',
+                 os.path.join(directory, 'baseline.json')],
+                capture_output=True, text=True)
+        self.assertEqual(result.returncode, benchmark.ERROR_NO_BASELINE)
+        self.assertIn('not found', result.stderr)
+
+    def test_compare(self):
+        baseline = {'results': [
+            {'case': 'get', 'mode': 'pasv', 'size': 1, 'count': 1,
+             'mb_per_s': 100, 'files_per_s': 1},
+            {'case': 'ls', 'mode': 'pasv', 'size': 0, 'count': 10,
+             'mb_per_s': None, 'files_per_s': 100}]}
+        report = {'results': [
+            {'case': 'get', 'mode': 'pasv', 'size': 1, 'count': 1,
+             'mb_per_s': 85, 'files_per_s': 1},
+            {'case': 'ls', 'mode': 'pasv', 'size': 0, 'count': 10,
+             'mb_per_s': None, 'files_per_s': 50}]}
+        regressions = benchmark.compare(baseline, report, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('files_per_s 50.00', regressions[0])
+
+    def test_sizes(self):
+        self.assertEqual(benchmark.sizes('1K,2G,10'),
+                         [1024, 2 * 1024 ** 3, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+import daemon
+import ftpc
+import loopserver
+
+
+FTPC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ftpc.py')
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.serv = loopserver.LoopbackServer(loopserver.MemoryFS(
+            {'/tree/a': b'adata', '/tree/sub/b': b'bdata'})).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'daemon.sock')
+        self.daemon = daemon.Daemon(self.path, keepalive=0)
+        self.thread = threading.Thread(target=self.daemon.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        self.serv.stop()
+        self.directory.cleanup()
+
+    def run_ftpc(self, *args):
+        return subprocess.run(
+            [sys.executable, FTPC, '-S', self.path, '-p',
+             str(self.serv.port), '-P', 'qwerty', '127.0.0.1', 'me'] +
+            list(args),
+            cwd=self.directory.name, capture_output=True, text=True)
+
+    def test_commands_share_session(self):
+        result = self.run_ftpc('ls', '/tree')
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.split('\n')[0],
+                         '-rw-r--r-- 1 owner group 5 Jan 01 2024 a')
+        key = ('127.0.0.1', self.serv.port, 'me', 'qwerty', 'utf-8', False)
+        [(client, used)] = self.daemon.sessions._idle[key]
+
+        result = self.run_ftpc('get', '/tree', 'copy')
+        self.assertEqual(result.returncode, 0)
+        with open(os.path.join(self.directory.name, 'copy', 'sub', 'b'),
+                  'rb') as f:
+            self.assertEqual(f.read(), b'bdata')
+
+        result = self.run_ftpc('send', 'copy', '/sent', '-j', '2')
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(self.serv.fs.files['/sent/sub/b'], b'bdata')
+        self.assertEqual(len(self.daemon.sessions), 1)
+        self.assertIs(self.daemon.sessions._take(key), client)
+
+    def test_errors(self):
+        result = self.run_ftpc('get', '/missing')
+        self.assertEqual(result.returncode, ftpc.ERROR_EXCEPTION)
+        self.assertEqual(result.stderr, '550 No such file.\n')
+
+        result = self.run_ftpc('rm', '/tree/a')
+        self.assertEqual(result.returncode, ftpc.ERROR_USAGE)
+
+        os.unlink(self.path)
+        result = self.run_ftpc('ls')
+        self.assertEqual(result.returncode, ftpc.ERROR_NOT_RUNNING)
+
+    def test_foreign_socket(self):
+        request, _ = ftpc.parse(['-p', str(self.serv.port), '127.0.0.1',
+                                 'me', 'pwd'])
+        with patch('os.getuid', return_value=os.getuid() + 1):
+            self.assertEqual(ftpc.call(request, self.path),
+                             ftpc.ERROR_NOT_RUNNING)
+        self.assertEqual(len(self.daemon.sessions), 0)
+
+        with patch.dict(os.environ, XDG_RUNTIME_DIR=self.directory.name):
+            os.chmod(self.directory.name, 0o755)
+            self.assertFalse(ftpc.is_private(self.directory.name))
+            with self.assertRaises(daemon.exceptions.FailedOperationException):
+                daemon.Daemon(ftpc.socket_path())
+            os.chmod(self.directory.name, 0o700)
+            self.assertTrue(ftpc.is_private(self.directory.name))
+
+    def test_eviction(self):
+        now = [0]
+        pool = daemon.SessionPool(timeout=10, keepalive=0,
+                                  clock=lambda: now[0])
+        request = {'host': '127.0.0.1', 'port': self.serv.port,
+                   'user': 'me', 'password': 'qwerty', 'encoding': 'utf-8',
+                   'active': False}
+        with pool.session(request) as first, pool.session(request) as second:
+            self.assertIsNot(first, second)
+        now[0] = 5
+        with pool.session(request) as client:
+            self.assertIs(client, first)
+        now[0] = 12
+        self.assertEqual(pool.evict(), 1)
+        self.assertFalse(second.isConnected)
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.close(), 1)
+        self.assertFalse(first.isConnected)
+
+
+class ThinClientTests(unittest.TestCase):
+    def test_parse(self):
+        request, path = ftpc.parse(['-S', '/tmp/s', '-p', '2121', '-a',
+                                    'host', 'me', 'get', 'a', 'b'])
+        self.assertEqual(path, '/tmp/s')
+        self.assertEqual((request['port'], request['active'],
+                          request['command'], request['args']),
+                         (2121, True, 'get', ['a', 'b']))
+        with self.assertRaises(ValueError):
+            ftpc.parse(['-x', 'host', 'me', 'ls'])
+        with self.assertRaises(ValueError):
+            ftpc.parse(['host', 'ls'])
+
+    def test_socket_path(self):
+        with patch.dict(os.environ, XDG_RUNTIME_DIR=''):
+            path = ftpc.socket_path()
+        self.assertEqual(os.path.dirname(path),
+                         '/tmp/ftp-client-{}'.format(os.getuid()))
+
+    def test_localize(self):
+        self.assertEqual(daemon.localize('get', ['dir/file'], '/work'),
+                         ['dir/file', '/work/dir/file'])
+        self.assertEqual(daemon.localize('send', ['-j', '2', 'file'], '/w'),
+                         ['/w/file', 'file', '-j', '2'])
+        self.assertEqual(daemon.localize('reput', ['/abs', 'r'], '/w'),
+                         ['/abs', 'r'])
+        self.assertEqual(daemon.localize('ls', ['dir'], '/w'), ['dir'])
+        with self.assertRaises(daemon.exceptions.FailedOperationException):
+            daemon.localize('get', ['file', '-'], '/w')
+        with self.assertRaises(daemon.exceptions.FailedOperationException):
+            daemon.localize('send', ['-', 'file'], '/w')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import argparse
+import tempfile
+from unittest.mock import patch
+import exceptions
+import loadtest
+import loopserver
+import metrics
+
+
+class LoadtestTests(unittest.TestCase):
+    def setUp(self):
+        self.serv = loopserver.LoopbackServer(loopserver.MemoryFS(
+            {'/loadtest.bin': 1000})).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.options = argparse.Namespace(
+            host='127.0.0.1', port=self.serv.port, directory='/',
+            remote_file='loadtest.bin', workdir=self.directory.name,
+            send_file=__file__, sessions=3, rate=0, duration=0.3, seed=0,
+            active=False,
+            mix=loadtest.mix('ls=1,get=1,send=1,cd=1'))
+
+    def tearDown(self):
+        self.serv.stop()
+        self.directory.cleanup()
+
+    def test_schedule(self):
+        now = [0]
+        schedule = loadtest.Schedule(10, 0.35, lambda: now[0])
+        starts = [schedule.next() for i in range(4)]
+        self.assertEqual([round(start, 6) for start in starts],
+                         [0, 0.1, 0.2, 0.3])
+        self.assertIsNone(schedule.next())
+
+    def test_run(self):
+        report = loadtest.run(self.options, [('me', 'qwerty')])
+        self.assertEqual(set(report['operations']),
+                         {'ls', 'get', 'send', 'cd'})
+        self.assertEqual(report['errors'], {})
+        self.assertGreater(report['bytes_in'], 0)
+        self.assertGreater(report['bytes_out'], 0)
+        self.assertIsNotNone(report['operations']['get']['p99'])
+
+    def test_errors_by_code(self):
+        self.options.remote_file = 'missing'
+        session = loadtest.Session(0, self.options, ('me', 'qwerty'),
+                                   metrics.Metrics())
+        self.assertEqual(session._execute('get'), '550')
+        self.assertIsNotNone(session.client)
+
+        with patch.object(session.client, 'ls',
+                          side_effect=exceptions.TimeoutException(
+                              '421 Timeout.\r\n')):
+            self.assertEqual(session._execute('ls'), '421')
+        self.assertIsNone(session.client)
+        self.assertIsNone(session._execute('ls'))
+        session.close()
+
+    def test_mix(self):
+        self.assertEqual(loadtest.mix('ls=2,get=0,cd=1'),
+                         [('ls', 2), ('cd', 1)])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            loadtest.mix('rm=1')
+
+    def test_parser(self):
+        parser = loadtest.setup_parser()
+        self.assertEqual(parser.parse_args(['host', '-s', '4']).sessions, 4)
+        with self.assertRaises(SystemExit), patch('sys.stderr'):
+            parser.parse_args(['host', '-s', '0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
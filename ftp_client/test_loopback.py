@@ -0,0 +1,375 @@
+import unittest
+import contextlib
+import errno
+import io
+import os
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import ANY, patch
+import ftp
+import loopserver
+import mirror
+
+
+class LoopbackTests(unittest.TestCase):
+    def setUp(self):
+        self.fs = loopserver.MemoryFS({'/data/big': 600 * 1024 + 5,
+                                       '/tree/a': b'adata',
+                                       '/tree/sub/b': b'bdata'})
+        self.serv = loopserver.LoopbackServer(self.fs).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = ftp.Client()
+        self.client.connect('127.0.0.1', self.serv.port)
+        self.client.login('me', 'qwerty')
+
+    def tearDown(self):
+        with contextlib.suppress(Exception):
+            self.client.close()
+        self.serv.stop()
+        self.directory.cleanup()
+
+    def local(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def check_roundtrip(self):
+        result = self.client.get('/data/big', self.local('big'))
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        with open(self.local('big'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(data, b''.join(self.fs.files['/data/big'].blocks()))
+
+        self.client.send(self.local('big'), '/upload')
+        self.assertEqual(self.fs.files['/upload'], data)
+
+    def test_passive_roundtrip(self):
+        self.check_roundtrip()
+
+    def test_active_roundtrip(self):
+        self.client.config.isActive = True
+        self.check_roundtrip()
+
+    def test_mapped_roundtrip(self):
+        self.client.config.mmap = True
+        self.check_roundtrip()
+        self.fs.write('/data/big', b'grown' * 1000)
+        with open(self.local('big'), 'r+b') as f:
+            f.truncate(3000)
+        with patch('os.posix_fallocate', create=True) as mockFallocate:
+            mockFallocate.side_effect = lambda fd, offset, size: (
+                os.ftruncate(fd, 2000))
+            self.client.get('/data/big', self.local('big'))
+        with open(self.local('big'), 'rb') as f:
+            self.assertEqual(f.read(), b'grown' * 1000)
+
+    def test_roundtrip_without_write_behind(self):
+        self.client.config.writeBuffers = 1
+        self.check_roundtrip()
+
+    def test_mode_z(self):
+        self.client.config.compression = 6
+        text = b''.join(b'%d,row,%d\n' % (i, i * 3) for i in range(20000))
+        self.fs.write('/tree/log.csv', text)
+        self.client.get('/tree/log.csv', self.local('log.csv'))
+        self.assertEqual(self.client._mode, 'Z')
+        with open(self.local('log.csv'), 'rb') as f:
+            self.assertEqual(f.read(), text)
+
+        self.client.send(self.local('log.csv'), '/up.csv')
+        self.assertEqual(self.fs.files['/up.csv'], text)
+        self.assertEqual(self.client._nlst('/tree'), ['a', 'log.csv', 'sub'])
+
+        counters = {(c['name'], c['labels']['direction']): c['value']
+                    for c in self.client.metrics.snapshot()['counters']
+                    if 'bytes' in c['name']}
+        self.assertEqual(counters[('ftp_logical_bytes_total', 'out')],
+                         len(text))
+        self.assertLess(counters[('ftp_bytes_total', 'out')] * 2, len(text))
+        self.assertLess(counters[('ftp_bytes_total', 'in')],
+                        counters[('ftp_logical_bytes_total', 'in')])
+
+    def test_streaming(self):
+        lines = self.client.iter_list('/tree')
+        self.assertEqual(next(lines),
+                         '-rw-r--r-- 1 owner group 5 Jan 01 2024 a')
+        self.assertEqual(len(list(lines)), 1)
+        self.assertEqual(self.client._lastResp, '226 Directory send OK.\r\n')
+
+        data = b''.join(self.fs.files['/data/big'].blocks())
+        for compression in (0, 6):
+            self.client.config.compression = compression
+            self.client._mode = None
+            chunks = [bytes(chunk) for chunk
+                      in self.client.iter_retr('/data/big', 4096)]
+            self.assertEqual(b''.join(chunks), data)
+            self.assertLessEqual(max(map(len, chunks)), 4096)
+
+            chunks = self.client.iter_retr('/data/big', 1000)
+            self.assertEqual(bytes(next(chunks)), data[:1000])
+            chunks.close()
+            f = io.BytesIO()
+            self.assertEqual(self.client.retr_into('/tree/sub/b', f),
+                             '226 Transfer complete.\r\n')
+            self.assertEqual(f.getvalue(), b'bdata')
+
+        stdout = io.TextIOWrapper(io.BytesIO())
+        self.client.config.debug = True
+        self.client.config.checksum = 'md5'
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.client.get('/tree/a', '-')
+        self.assertEqual(stdout.buffer.getvalue(), b'adata')
+        self.assertIn('150 Opening data connection.', stderr.getvalue())
+        self.assertTrue(self.client.checksums['/tree/a'].verified)
+
+    def test_stream_upload(self):
+        data = b''.join(self.fs.files['/data/big'].blocks())
+        with patch.object(loopserver.Handler, 'ftp_allo', autospec=True,
+                          side_effect=loopserver.Handler.ftp_allo) as allo:
+            self.client.stor_from(io.BytesIO(data), '/upload', len(data))
+            allo.assert_called_once_with(ANY, str(len(data)))
+            self.assertEqual(self.fs.files['/upload'], data)
+
+            self.client.config.compression = 6
+            self.client.config.checksum = 'crc32'
+            readFd, writeFd = os.pipe()
+            with open(readFd, 'rb') as stdin, open(writeFd, 'wb') as f:
+                f.write(b'piped')
+                f.close()
+                with patch('sys.stdin', io.TextIOWrapper(stdin)):
+                    self.client.send('-', '/piped')
+            self.assertEqual(allo.call_count, 1)
+        self.assertEqual(self.fs.files['/piped'], b'piped')
+        self.assertTrue(self.client.checksums['/piped'].verified)
+        with self.assertRaises(ftp.exc.FailedOperationException):
+            self.client.send('-')
+
+    def test_prefetch(self):
+        self.client.config.prefetch = True
+        for active in (False, True):
+            self.client.config.isActive = active
+            self.client.get('/tree', self.local('tree'))
+            self.assertIsNotNone(self.client._prefetched)
+            self.check_roundtrip()
+            with self.assertRaises(ftp.exc.FailedOperationException):
+                self.client.get('/missing', self.local('missing'))
+            self.assertEqual(self.client._nlst('/tree'), ['a', 'sub'])
+
+        f = io.StringIO()
+        self.client.config.debug = True
+        with contextlib.redirect_stdout(f):
+            with patch('ftp.PREFETCH_TTL', 0):
+                self.client.ls('/tree')
+            self.client.ls('/tree')
+        self.assertEqual(
+            [line.endswith('prefetched') for line in f.getvalue().split('\n')
+             if line.startswith('Data connection: ')], [False, True])
+
+    def test_prefetch_retry_keeps_offset(self):
+        data = b''.join(self.fs.files['/data/big'].blocks())
+        with open(self.local('big'), 'wb') as f:
+            f.write(data[:1000])
+        self.client.config.prefetch = True
+        self.client.ls('/tree')
+        self.assertIsNotNone(self.client._prefetched)
+
+        retr = loopserver.Handler.ftp_retr
+        dropped = []
+
+        def drop_once(handler, argument):
+            if dropped:
+                return retr(handler, argument)
+            dropped.append(argument)
+            handler._close_passive()
+            handler.reply("425 Can't open data connection.")
+
+        with patch.object(loopserver.Handler, 'ftp_retr', drop_once):
+            self.client.reget('/data/big', self.local('big'))
+        self.assertEqual(dropped, ['/data/big'])
+        with open(self.local('big'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_extended_passive_and_active(self):
+        self.client.config.epsv = True
+        self.check_roundtrip()
+        self.client.config.isActive = True
+        self.check_roundtrip()
+        with patch.object(loopserver.Handler, 'ftp_epsv', None):
+            self.client.config.isActive = False
+            self.check_roundtrip()
+        self.assertIs(self.client._epsv, False)
+
+    def test_ipv6(self):
+        serv = loopserver.LoopbackServer(self.fs, host='::1').start()
+        try:
+            for active in (False, True):
+                client = ftp.Client(ftp.Config(isActive=active,
+                                               prefetch=True))
+                client.connect('::1', serv.port)
+                client.login('me', 'qwerty')
+                client.get('/tree', self.local('tree'))
+                client.send(self.local('tree'), '/copy')
+                self.assertEqual(self.fs.files['/copy/sub/b'], b'bdata')
+                client.close()
+        finally:
+            serv.stop()
+
+    def test_checksums(self):
+        self.client.config.checksum = 'sha256'
+        self.client.get('/data/big', self.local('big'), jobs=2)
+        self.client.send(self.local('big'), '/upload')
+        results = self.client.checksums
+        self.assertEqual(sorted(results), ['/data/big', '/upload'])
+        self.assertTrue(all(result.verified for result in results.values()))
+        self.assertEqual(results['/upload'].local, results['/data/big'].local)
+
+    def test_segment_retries(self):
+        self.fs.files['/data/huge'] = loopserver.SyntheticFile(3 * 1024 ** 2)
+        retr = loopserver.Handler.ftp_retr
+        calls = []
+
+        def drop_first(handler, argument):
+            calls.append(argument)
+            if len(calls) > 1:
+                return retr(handler, argument)
+            handler.connection.shutdown(socket.SHUT_RDWR)
+
+        with patch.object(loopserver.Handler, 'ftp_retr', drop_first), \
+                patch('time.sleep') as sleep:
+            self.client.get('/data/huge', self.local('huge'), jobs=2)
+        self.assertEqual(len(calls), 3)
+        sleep.assert_called_once_with(self.client.config.retryDelay)
+        with open(self.local('huge'), 'rb') as f:
+            self.assertEqual(f.read(),
+                             b''.join(self.fs.files['/data/huge'].blocks()))
+
+        calls.clear()
+        with patch.object(loopserver.Handler, 'ftp_retr',
+                          lambda handler, argument: calls.append(argument) or
+                          handler.reply('550 Permission denied.')), \
+                patch('time.sleep') as sleep:
+            with self.assertRaises(ftp.exc.FailedOperationException):
+                self.client.get('/data/huge', self.local('huge'), jobs=2)
+        self.assertEqual(len(calls), 2)
+        sleep.assert_not_called()
+
+        full = OSError(errno.ENOSPC, 'No space left on device')
+        with patch('ftp.Client.retr_range', side_effect=full) as retr, \
+                patch('time.sleep') as sleep:
+            with self.assertRaises(OSError):
+                self.client.get('/data/huge', self.local('huge'), jobs=2)
+        self.assertEqual(retr.call_count, 2)
+        sleep.assert_not_called()
+
+    def test_recursive_get(self):
+        self.client.get('/tree', self.local('tree'), jobs=2)
+        with open(self.local(os.path.join('tree', 'sub', 'b')), 'rb') as f:
+            self.assertEqual(f.read(), b'bdata')
+
+    def test_get_dir_of_dos_listing(self):
+        def dos_line(name, content):
+            if content is None:
+                return '01-01-24  12:00AM       <DIR>          ' + name
+            return '01-01-24  12:00AM {:>20} {}'.format(len(content), name)
+
+        with patch.object(loopserver.Handler, 'ftp_feat',
+                          lambda handler, argument: handler.reply(
+                              '211 No features.')), \
+                patch('loopserver._unix_line', dos_line):
+            self.client.get('/tree', self.local('tree'), jobs=2)
+            self.client.get('/tree', self.local('serial'))
+            self.assertEqual(mirror.download(self.client, 'tree',
+                                             self.local('mirror')),
+                             (2, 0, 0))
+            self.assertEqual(self.client.absolute_path(), '/')
+            self.assertEqual([(entry.name, entry.type)
+                              for entry in self.client.mlsd('/tree')],
+                             [('a', None), ('sub', None)])
+        for name in ('tree', 'serial', 'mirror'):
+            with open(self.local(os.path.join(name, 'sub', 'b')), 'rb') as f:
+                self.assertEqual(f.read(), b'bdata')
+
+    def test_reget_of_larger_local_file(self):
+        with open(self.local('a'), 'wb') as f:
+            f.write(b'adata-local')
+        with self.assertRaises(ftp.exc.FailedOperationException):
+            self.client.reget('/tree/a', self.local('a'))
+        with open(self.local('a'), 'rb') as f:
+            self.assertEqual(f.read(), b'adata-local')
+
+    def test_mirror_under_resume(self):
+        self.client.config.resume = True
+        local = self.local('tree')
+        mirror.download(self.client, '/tree', local)
+        self.fs.write('/tree/a', b'ANEW-grown')
+        self.assertEqual(mirror.download(self.client, '/tree', local),
+                         (1, 1, 0))
+        with open(os.path.join(local, 'a'), 'rb') as f:
+            self.assertEqual(f.read(), b'ANEW-grown')
+
+        mirror.upload(self.client, local, '/copy')
+        with open(os.path.join(local, 'sub', 'b'), 'wb') as f:
+            f.write(b'BNEW-grown')
+        self.assertEqual(mirror.upload(self.client, local, '/copy'),
+                         (1, 1, 0))
+        self.assertEqual(self.fs.files['/copy/sub/b'], b'BNEW-grown')
+
+    def test_listing(self):
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.client.ls('/tree')
+        self.assertEqual(f.getvalue().split('\n')[0],
+                         '-rw-r--r-- 1 owner group 5 Jan 01 2024 a')
+        self.assertEqual([entry.name for entry in self.client.mlsd('/tree')],
+                         ['a', 'sub'])
+
+
+class ConcurrencyTests(unittest.TestCase):
+    TREE = {'/дерево/файл': b'file', '/дерево/папка/вложенный': b'nested'}
+
+    def setUp(self):
+        self.servers = [loopserver.LoopbackServer(
+                            loopserver.MemoryFS(self.TREE),
+                            encoding=encoding).start()
+                        for encoding in ('utf-8', 'cp1251')]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        for serv in self.servers:
+            serv.stop()
+        self.directory.cleanup()
+
+    def session(self, index):
+        '''download and upload tree by own client with own settings'''
+        serv = self.servers[index % 2]
+        config = ftp.Config(encoding=serv.encoding,
+                            isActive=index % 4 >= 2,
+                            bufferSize=1024 * (index + 1))
+        client = ftp.Client(config)
+        client.connect('127.0.0.1', serv.port)
+        client.login('me', 'qwerty')
+        local = os.path.join(self.directory.name, str(index))
+        try:
+            client.get('дерево', local)
+            client.send(local, 'копия{}'.format(index))
+            return client._nlst('копия{}/папка'.format(index))
+        finally:
+            client.close()
+
+    def test_concurrent_sessions(self):
+        cwd = os.getcwd()
+        with ThreadPoolExecutor(16) as executor:
+            listings = list(executor.map(self.session, range(16)))
+
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(listings, [['вложенный']] * 16)
+        for index in range(16):
+            local = os.path.join(self.directory.name, str(index))
+            with open(os.path.join(local, 'папка', 'вложенный'), 'rb') as f:
+                self.assertEqual(f.read(), b'nested')
+            fs = self.servers[index % 2].fs
+            self.assertEqual(fs.files['/копия{}/файл'.format(index)], b'file')
+
+
+if __name__ == '__main__':
+    unittest.main()
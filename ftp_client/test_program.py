@@ -6,6 +6,22 @@ import fakeserver as fk
 import contextlib
 import io
 import progress
+import parallel
+import reply
+import listing
+import cache
+import mirror
+import metrics
+import threading
+import throttle
+import keepalive
+import checksum
+import pipeline
+import time
+import zlib
+import tempfile
+import os
+import posixpath
 
 
 class Tests(unittest.TestCase):
@@ -50,20 +66,883 @@ class Tests(unittest.TestCase):
         self.assertEqual(result, '226 Transfer complete.\r\n')
         mockOpen().write.assert_called_once_with(b'file1data')
 
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_get_file_by_blocks(self, mockObject, mockBar):
+        self.client.config.bufferSize = 4
+        self.serv.dataMock = mockObject
+        written = []
+        mockOpen = mock_open()
+        mockOpen().write.side_effect = lambda data: written.append(
+            bytes(data))
+        with patch('builtins.open', mockOpen, create=True):
+            self.client.get('file1')
+        self.assertEqual(written, [b'file', b'1dat', b'a'])
+        self.assertEqual(mockBar.return_value.update.mock_calls,
+                         [call(4), call(4), call(1)])
+
+    @patch('progress.Progress', autospec=True)
     @patch('os.path', autospec=True)
     @patch('socket.socket', autospec=True)
-    def test_send_file(self, mockObject, mockPath):
+    def test_send_file(self, mockObject, mockPath, mockBar):
         mockPath.isdir.return_value = False
         self.serv.dataMock = mockObject
 
         with patch('builtins.open', mock_open(read_data=b'file4data'),
                    create=True) as m:
-            m.return_value.__iter__.return_value = iter([b'file4data'])
+            m.return_value.fileno.side_effect = io.UnsupportedOperation
             result = self.client.send('file4')
 
         self.assertEqual(result, '226 Transfer complete.\r\n')
         self.assertTrue(b'file4' in self.serv.files)
         self.assertEqual(b'file4data', self.serv.data[b'file4'])
+        mockBar.return_value.update.assert_called_once_with(9)
+
+    @patch('progress.Progress', autospec=True)
+    @patch('os.fstat', autospec=True)
+    @patch('os.sendfile', create=True)
+    @patch('os.path', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_send_file_by_sendfile(self, mockObject, mockPath, mockSendfile,
+                                   mockStat, mockBar):
+        mockPath.isdir.return_value = False
+        mockStat.return_value.st_mode = 0o100644
+        mockSendfile.side_effect = [5, 4, 0]
+        self.serv.dataMock = mockObject
+
+        with patch('builtins.open', mock_open(), create=True) as m:
+            m.return_value.tell.return_value = 0
+            result = self.client.send('file4')
+
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.assertEqual([c[1][2] for c in mockSendfile.mock_calls],
+                         [0, 5, 9])
+        self.assertEqual(mockBar.return_value.update.mock_calls,
+                         [call(5), call(4)])
+        m.return_value.read.assert_not_called()
+
+    @patch('progress.Progress', autospec=True)
+    @patch('os.fstat', autospec=True)
+    @patch('os.sendfile', create=True)
+    @patch('os.path', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_send_file_sendfile_fallback(self, mockObject, mockPath,
+                                         mockSendfile, mockStat, mockBar):
+        mockPath.isdir.return_value = False
+        mockStat.return_value.st_mode = 0o100644
+        mockSendfile.side_effect = OSError
+        self.serv.dataMock = mockObject
+
+        with patch('builtins.open', mock_open(read_data=b'file4data'),
+                   create=True) as m:
+            m.return_value.tell.return_value = 0
+            self.client.send('file4')
+
+        self.assertEqual(b'file4data', self.serv.data[b'file4'])
+
+    def test_reply_reader(self):
+        sock = unittest.mock.Mock()
+        sock.recv.side_effect = [b'211-Features:\r\n MDTM\r\n SI',
+                                 b'ZE\r\n211 End\r\n200 OK\r\n',
+                                 b'226 Tran', b'sfer complete.\r\n']
+        reader = reply.ReplyReader(sock)
+
+        resp = reader.read()
+        self.assertEqual(resp.code, '211')
+        self.assertEqual(resp.lines,
+                         ['211-Features:', ' MDTM', ' SIZE', '211 End'])
+        self.assertEqual(reader.read(), ('200', ['200 OK']))
+        resp = reader.read()
+        self.assertEqual(resp.text, '226 Transfer complete.\r\n')
+        self.assertFalse(resp.is_error)
+        self.assertEqual(sock.recv.call_count, 4)
+
+    def test_reply_reader_closed(self):
+        sock = unittest.mock.Mock()
+        sock.recv.side_effect = [b'421 Timeout', b'']
+        with self.assertRaises(ftp.exc.NotConnectedException):
+            reply.ReplyReader(sock).read()
+
+    def test_batch(self):
+        sent = []
+        self.serv.mockSock().sendall.side_effect = sent.append
+        self.serv.mockSock().recv.side_effect = [
+            b'213 1\r\n213 2\r\n', b'550 No such file\r\n213 4\r\n',
+            b'213 5\r\n']
+        result = self.client.batch([('SIZE', str(i)) for i in range(5)],
+                                   window=2)
+
+        self.assertEqual([r.code for r in result],
+                         ['213', '213', '550', '213', '213'])
+        self.assertEqual(result[3].lines, ['213 4'])
+        self.assertEqual(sent, [b'SIZE 0\r\nSIZE 1\r\n', b'SIZE 2\r\n',
+                                b'SIZE 3\r\n', b'SIZE 4\r\n'])
+
+    def test_batch_timeout(self):
+        self.serv.mockSock().recv.side_effect = [b'213 1\r\n421 Bye\r\n']
+        with self.assertRaises(ftp.exc.TimeoutException):
+            self.client.batch([('SIZE', 'a'), ('SIZE', 'b')])
+        self.assertFalse(self.client.isConnected)
+
+    @patch('socket.socket', autospec=True)
+    def test_sizes(self, mockObject):
+        self.serv.dataMock = mockObject
+        self.serv.files.append(b'other')
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.client.sizes('file*')
+        self.assertEqual(f.getvalue().split('\n'),
+                         ['{:>14} file{}'.format(20, i) for i in (1, 2, 3)]
+                         + ['{:>14} total'.format(60), ''])
+
+    def test_parse_mlsd_line(self):
+        entry = listing.parse_mlsd_line(
+            'Type=file;Size=1830;Modify=20200415131049.123;Perm=adfrw; '
+            'my file.txt\r\n')
+        self.assertEqual(entry, listing.Entry('my file.txt', 'file', 1830,
+                                              '20200415131049', 'adfrw'))
+        self.assertTrue(listing.parse_mlsd_line('type=dir; logs').is_dir)
+        self.assertIsNone(
+            listing.parse_mlsd_line('type=file;size=1.2K; big').size)
+
+    def test_parse_unix_line(self):
+        now = time.struct_time((2020, 4, 15, 0, 0, 0, 0, 0, 0))
+        self.assertEqual(
+            listing.parse_unix_line(
+                '-rw-r--r--   1 ftp ftp  1830 Apr 14 13:10 my file.txt',
+                now),
+            listing.Entry('my file.txt', 'file', 1830, '20200414131000',
+                          'rw-r--r--'))
+        self.assertEqual(
+            listing.parse_unix_line(
+                'drwxr-xr-x 2 ftp ftp 4096 Dec 31 23:59 logs', now).modify,
+            '20191231235900')
+        self.assertEqual(
+            listing.parse_unix_line(
+                'lrwxrwxrwx 1 ftp ftp 3 Jan  1  2019 last -> logs', now),
+            listing.Entry('last', 'link', 3, '20190101000000', 'rwxrwxrwx'))
+        self.assertIsNone(listing.parse_unix_line('total 8'))
+
+    @patch('socket.socket', autospec=True)
+    def test_mlsd(self, mockObject):
+        self.serv.dataMock = mockObject
+        self.serv.data[b'file2'] = b'12'
+        result = self.client.mlsd()
+        self.assertEqual([(e.name, e.type, e.size) for e in result],
+                         [('file1', 'file', 9), ('file2', 'file', 2),
+                          ('file3', 'file', 9), ('mydir', 'dir', None)])
+        self.assertEqual(self.client.features(), {'MLSD', 'SIZE'})
+
+    @patch('socket.socket', autospec=True)
+    def test_mlsd_list_fallback(self, mockObject):
+        self.serv.dataMock = mockObject
+        self.client._features = set()
+        self.serv.files = [
+            b'total 8',
+            b'drwxr-xr-x 2 ftp ftp 4096 Jan 1 2019 .',
+            b'-rw-r--r-- 1 ftp ftp 11 Jan 1 2019 file1',
+            b'drwxr-xr-x 2 ftp ftp 4096 Jan 1 2019 mydir']
+        result = self.client.mlsd()
+        self.assertEqual([(e.name, e.type, e.size) for e in result],
+                         [('file1', 'file', 11), ('mydir', 'dir', 4096)])
+
+    def test_mlst(self):
+        self.client._features = {'MLST'}
+        self.serv.mockSock().sendall.side_effect = None
+        self.serv.mockSock().recv.side_effect = [
+            b'250-Listing file1\r\n type=file;size=9; /file1\r\n250 End\r\n']
+        entry = self.client.mlst('file1')
+        self.assertEqual((entry.name, entry.size), ('/file1', 9))
+
+    def test_listing_cache(self):
+        now = [0]
+        listings = cache.ListingCache(ttl=10, maxSize=2,
+                                      clock=lambda: now[0])
+        listings.put(('h', '/a'), 'NLST', ['x'])
+        listings.put(('h', '/b'), 'NLST', ['y'])
+        self.assertEqual(listings.get(('h', '/a'), 'NLST'), ['x'])
+        self.assertIsNone(listings.get(('h', '/a'), 'MLSD'))
+        listings.put(('h', '/c'), 'NLST', ['z'])
+        self.assertIsNone(listings.get(('h', '/b'), 'NLST'))
+        now[0] = 11
+        self.assertIsNone(listings.get(('h', '/a'), 'NLST'))
+        self.assertEqual((listings.hits, listings.misses), (1, 3))
+        listings.invalidate(('h', '/c'))
+        self.assertEqual(len(listings), 1)
+
+    @patch('socket.socket', autospec=True)
+    def test_cached_listing(self, mockObject):
+        self.serv.dataMock = mockObject
+        self.client.hostName = 'MyAddress'
+        self.client.cache = cache.ListingCache()
+        self.client._cwd = '/'
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.client.ls()
+            self.client.ls('/')
+            self.client.cd('mydir')
+            self.client.ls('..')
+        self.assertEqual(f.getvalue(), 'file1\nfile2\nfile3\n' * 3)
+        self.assertEqual(self.client._nlst(), self.client._nlst())
+        self.assertEqual(self.client._cwd, '/mydir')
+        self.assertEqual((self.client.cache.hits,
+                          self.client.cache.misses), (3, 2))
+
+        self.client.mkdir('newdir')
+        self.assertIsNone(self.client.cache.get(('MyAddress', '/mydir'),
+                                                'NLST'))
+
+    def test_mirror_download(self):
+        remote = {'a': (b'aa', '20200101000000'),
+                  'sub/b': (b'bbb', '20200101000000')}
+        received = []
+
+        class Client:
+            hostName = 'host'
+            facts = True
+
+            def absolute_path(self, path=''):
+                return '/' + path
+
+            def send_cmd(self, *args):
+                return '200 OK'
+
+            def size(self, path):
+                return '550 Could not get file size.'
+
+            def mlsd(self, path):
+                path = path.rstrip('/')
+                prefix = path[len('root/'):] if '/' in path else ''
+                names = {name[len(prefix):].lstrip('/').split('/')[0]
+                         for name in remote if name.startswith(prefix)}
+                for name in sorted(names):
+                    full = posixpath.join(prefix, name)
+                    if full in remote and self.facts:
+                        yield listing.Entry(name, 'file',
+                                            len(remote[full][0]),
+                                            remote[full][1])
+                    elif full in remote:
+                        yield listing.Entry(name, 'file')
+                    else:
+                        yield listing.Entry(name, 'dir')
+
+            def get_file(self, remotePath, localPath, resume=None):
+                received.append(remotePath)
+                with open(localPath, 'wb') as f:
+                    f.write(remote[remotePath[len('root/'):]][0])
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(mirror.download(Client(), 'root', directory),
+                             (2, 0, 0))
+            remote['a'] = (b'new', '20200102000000')
+            del remote['sub/b']
+            self.assertEqual(mirror.download(Client(), 'root', directory,
+                                             delete=True), (1, 0, 1))
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ['.ftp-mirror.sqlite', 'a', 'sub'])
+            self.assertEqual(os.listdir(os.path.join(directory, 'sub')), [])
+            Client.facts = False
+            for i in range(2):
+                self.assertEqual(mirror.download(Client(), 'root', directory),
+                                 (1, 0, 0))
+        self.assertEqual(received, ['root/a', 'root/sub/b'] + ['root/a'] * 3)
+
+    def test_mirror_upload(self):
+        client = unittest.mock.Mock(hostName='host')
+        client.absolute_path.side_effect = lambda path: '/' + path
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'sub'))
+            for name in ('a', os.path.join('sub', 'b')):
+                with open(os.path.join(directory, name), 'w') as f:
+                    f.write(name)
+            self.assertEqual(mirror.upload(client, directory, 'root'),
+                             (2, 0, 0))
+            self.assertEqual(mirror.upload(client, directory, 'root'),
+                             (0, 2, 0))
+            os.remove(os.path.join(directory, 'a'))
+            client.delete.return_value = '550 Permission denied.'
+            self.assertEqual(mirror.upload(client, directory, 'root',
+                                           delete=True), (0, 1, 0))
+            client.delete.return_value = '250 File deleted.'
+            self.assertEqual(mirror.upload(client, directory, 'root',
+                                           delete=True), (0, 1, 1))
+
+        self.assertEqual(client.mkdir.mock_calls,
+                         [call('root'), call('root/sub')])
+        self.assertEqual([c[1][1] for c in client.send_file.mock_calls],
+                         ['root/a', 'root/sub/b'])
+        self.assertEqual(client.delete.mock_calls, [call('root/a')] * 2)
+
+    def test_progress_not_terminal(self):
+        stream = io.StringIO()
+        bar = progress.Progress(10, stream)
+        bar.update(4)
+        bar.update(6)
+        bar.finish()
+        self.assertEqual(bar.counter, 10)
+        self.assertIsNone(bar.pbar)
+        self.assertEqual(stream.getvalue(), '')
+
+    @patch('time.monotonic', autospec=True)
+    @patch('progress.ProgressBar', autospec=True)
+    def test_progress_rate_limited(self, mockBar, mockTime):
+        stream = io.StringIO()
+        stream.isatty = lambda: True
+        mockTime.side_effect = [0, 0.1, 0.2, 0.3]
+        bar = progress.Progress(100, stream)
+        for i in range(4):
+            bar.update(10)
+        bar.finish()
+
+        pbar = mockBar.return_value
+        self.assertEqual(pbar.update.mock_calls,
+                         [call(10), call(40), call(40)])
+        pbar.finish.assert_called_once_with()
+
+    def test_aggregate_progress(self):
+        stream = io.StringIO()
+        stream.isatty = lambda: True
+        bar = progress.AggregateProgress(4000, 4, stream)
+
+        def transfer():
+            part = bar.transfer(1000)
+            for i in range(100):
+                part.update(10)
+            part.finish()
+
+        threads = [threading.Thread(target=transfer) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bar.finish()
+
+        self.assertEqual((bar.bytes, bar.files), (4000, 4))
+        self.assertIn('4/4 files  3.9 KiB/3.9 KiB', stream.getvalue())
+        self.assertTrue(stream.getvalue().endswith('\n'))
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_aggregate_progress_of_dir(self, mockObject, mockBar):
+        self.serv.dataMock = mockObject
+        with patch('progress.AggregateProgress',
+                   wraps=progress.AggregateProgress) as mockAggregate, \
+                patch('os.mkdir'), \
+                patch('os.path.isdir', return_value=False), \
+                patch('builtins.open', mock_open(), create=True):
+            self.client.get('mydir')
+
+        mockBar.assert_not_called()
+        mockAggregate.assert_called_once_with(None, None)
+        self.assertIsNone(self.client.progress)
+
+    def test_token_bucket(self):
+        now = [0]
+        slept = []
+
+        def sleep(delay):
+            slept.append(delay)
+            now[0] += delay
+
+        bucket = throttle.TokenBucket(100, lambda: now[0], sleep)
+        bucket.consume(50)
+        bucket.consume(50)
+        self.assertEqual(slept, [0.5, 0.5])
+        now[0] += 10
+        bucket.consume(50)
+        self.assertEqual(len(slept), 2)
+
+        bucket.set_rate(0)
+        bucket.consume(10 ** 9)
+        self.assertEqual(len(slept), 2)
+
+    def test_throttled_compressed_transfer(self):
+        bucket = unittest.mock.Mock()
+        bar = throttle.Throttled(unittest.mock.Mock(), [bucket])
+        bar.update(100)
+        bar.update_wire(10)
+        bar.update(100)
+        self.assertEqual(bucket.consume.mock_calls, [call(100), call(10)])
+        self.assertEqual(bar.bar.update.mock_calls, [call(100), call(100)])
+        bar.bar.update_wire.assert_called_once_with(10)
+
+    def test_parse_rate(self):
+        self.assertEqual(throttle.parse_rate('200M'), 200 * 1024 ** 2)
+        self.assertEqual(throttle.parse_rate('1.5k'), 1536)
+        self.assertEqual(throttle.parse_rate('0'), 0)
+        self.assertEqual(throttle.format_rate(50 * 1024 ** 2), '50M/s')
+        self.assertEqual(throttle.format_rate(0), 'unlimited')
+        with self.assertRaises(ValueError):
+            throttle.parse_rate('fast')
+
+    @patch('progress.Progress', autospec=True)
+    def test_rate(self, mockBar):
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            self.client.rate('200M', '50M')
+        self.assertEqual(f.getvalue(),
+                         'total: 200M/s, per transfer: 50M/s\n')
+        bar = self.client._new_progress(10)
+        self.assertIsInstance(bar, throttle.Throttled)
+        self.assertIs(bar.buckets[0], self.client.limit)
+        self.assertEqual(bar.buckets[1].rate, 50 * 1024 ** 2)
+
+        with contextlib.redirect_stdout(f):
+            self.client.rate('0', '0')
+        self.assertIs(self.client._new_progress(10), mockBar.return_value)
+        with self.assertRaises(ftp.exc.FailedOperationException):
+            self.client.rate('fast')
+
+    def test_histogram_quantiles(self):
+        histogram = metrics.Histogram()
+        for value in range(1, 101):
+            histogram.observe(value)
+        self.assertEqual([histogram.quantile(q) for q in (0.5, 0.95, 0.99)],
+                         [50, 95, 99])
+        self.assertEqual((histogram.count, histogram.sum), (100, 5050))
+        self.assertIsNone(metrics.Histogram().quantile(0.5))
+
+    def test_metrics_export(self):
+        registry = metrics.Metrics()
+        registry.count('ftp_error_replies_total', code='550')
+        registry.count('ftp_error_replies_total', code='550')
+        registry.observe('ftp_command_seconds', 0.5, command='SIZE')
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'],
+                         [{'name': 'ftp_error_replies_total',
+                           'labels': {'code': '550'}, 'value': 2}])
+        self.assertEqual(snapshot['histograms'][0]['p99'], 0.5)
+
+        text = registry.to_prometheus()
+        self.assertIn('# TYPE ftp_error_replies_total counter\n'
+                      'ftp_error_replies_total{code="550"} 2\n', text)
+        self.assertIn('ftp_command_seconds{command="SIZE",quantile="0.5"} '
+                      '0.5\n', text)
+        self.assertIn('ftp_command_seconds_count{command="SIZE"} 1\n', text)
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_transfer_metrics(self, mockObject, mockBar):
+        self.serv.dataMock = mockObject
+        with patch('builtins.open', mock_open(), create=True):
+            self.client.get('file1')
+        self.client.size('missing')
+
+        snapshot = self.client.metrics.snapshot()
+        counters = {(c['name'], tuple(c['labels'].values())): c['value']
+                    for c in snapshot['counters']}
+        self.assertEqual(counters[('ftp_bytes_total', ('in',))], 9)
+        self.assertEqual(counters[('ftp_transfers_total', ('in',))], 1)
+        self.assertEqual(counters[('ftp_error_replies_total', ('550',))], 1)
+        names = {(h['name'], tuple(h['labels'].values()))
+                 for h in snapshot['histograms']}
+        self.assertIn(('ftp_command_seconds', ('SIZE',)), names)
+        self.assertIn(('ftp_phase_seconds', ('pasv',)), names)
+        self.assertIn(('ftp_phase_seconds', ('RETR', 'data_connection')),
+                      names)
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_mode_z_fallback(self, mockObject, mockBar):
+        self.client.config.compression = 6
+        self.serv.dataMock = mockObject
+        sent = []
+        self.serv.mockSock().sendall.side_effect = lambda data: (
+            sent.append(data), self.serv.send(data))
+        with patch('builtins.open', mock_open(), create=True) as m:
+            self.client.get('file1')
+        m().write.assert_called_once_with(b'file1data')
+        self.assertEqual(self.client._mode, 'S')
+        self.assertNotIn(b'MODE Z\r\n', sent)
+
+    def test_progress_wire_bytes(self):
+        stream = io.StringIO()
+        bar = progress.AggregateProgress(stream=stream)
+        bar.visible = True
+        part = metrics.Meter(bar.transfer())
+        part.update(1000)
+        part.update_wire(250)
+        bar.finish()
+        self.assertEqual((bar.bytes, bar.wire, part.wire), (1000, 250, 250))
+        self.assertIn('250.0 B on wire (4.0x)', stream.getvalue())
+
+    def test_checksum(self):
+        for algorithm, digest in (('crc32', '0d4a1185'),
+                                  ('md5', '5eb63bbbe01eeed093cb22bb8f5acdc3')):
+            f = checksum.HashingFile(io.BytesIO(),
+                                     checksum.Checksum(algorithm))
+            f.write(b'hello ')
+            f.write(b'world')
+            self.assertEqual(f.checksum.hexdigest(), digest)
+        self.assertFalse(ftp._is_regular_file(f))
+
+        self.assertEqual(checksum.parse_digest(
+            '213 MD5 0-11 5EB63BBBE01EEED093CB22BB8F5ACDC3 a b', 'md5'),
+            '5eb63bbbe01eeed093cb22bb8f5acdc3')
+        self.assertEqual(checksum.parse_digest('250 D4A1185', 'crc32'),
+                         '0d4a1185')
+        self.assertIsNone(checksum.parse_digest('250 abc', 'md5'))
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_get_with_checksum(self, mockObject, mockBar):
+        self.client.config.checksum = 'crc32'
+        self.serv.dataMock = mockObject
+        self.serv.cmds[b'XCRC'] = lambda name: setattr(
+            self.serv.mockSock().recv, 'return_value',
+            b'250 %08X\r\n' % zlib.crc32(self.serv.data[name]))
+        with patch('builtins.open', mock_open(), create=True):
+            self.client.get('file1')
+        self.assertEqual(self.client.checksums['/file1'],
+                         ('crc32', '/file1', '%08x' % zlib.crc32(b'file1data'),
+                          None))
+
+        self.serv.feat = lambda *args: setattr(
+            self.serv.mockSock().recv, 'return_value',
+            b'211-Features:\r\n XCRC\r\n211 End\r\n')
+        self.serv.cmds[b'FEAT'] = self.serv.feat
+        self.client._features = None
+        with patch('builtins.open', mock_open(), create=True):
+            self.client.get('file1')
+        self.assertTrue(self.client.checksums['/file1'].verified)
+
+        self.serv.cmds[b'XCRC'] = lambda name: setattr(
+            self.serv.mockSock().recv, 'return_value', b'250 1234ABCD\r\n')
+        with patch('builtins.open', mock_open(), create=True), \
+                self.assertRaisesRegex(ftp.exc.FailedOperationException,
+                                       'Checksum mismatch of /file1'):
+            self.client.get('file1')
+
+    def test_write_behind(self):
+        f = io.BytesIO()
+        with pipeline.WriteBehind(f, 4, depth=2) as writer:
+            buffer = writer.buffer()
+            buffer[:3] = b'abc'
+            writer.write(buffer, 3)
+            self.assertIsNone(writer._thread)
+            for block in (b'defg', b'hi'):
+                buffer = writer.buffer()
+                buffer[:len(block)] = block
+                writer.write(buffer, len(block))
+        self.assertEqual(f.getvalue(), b'abcdefghi')
+        self.assertEqual(writer._allocated, 2)
+
+        f = unittest.mock.Mock()
+        f.write.side_effect = OSError('No space left on device')
+        writer = pipeline.WriteBehind(f, 4, depth=1)
+        with self.assertRaises(OSError):
+            for i in range(10):
+                writer.write(writer.buffer(), 4)
+            writer.close()
+
+        writer = pipeline.WriteBehind(f, 4, depth=1)
+        with self.assertRaises(socket.timeout):
+            with writer:
+                writer.write(writer.buffer(), 4)
+                writer.write(writer.buffer(), 4)
+                raise socket.timeout('timed out')
+        self.assertIsInstance(writer._error, OSError)
+
+    def test_preallocate(self):
+        with tempfile.TemporaryFile() as f:
+            if pipeline.preallocate(f, 10000):
+                self.assertEqual(os.fstat(f.fileno()).st_size, 10000)
+        self.assertFalse(pipeline.preallocate(io.BytesIO(), 10000))
+        with tempfile.TemporaryFile() as f:
+            self.assertFalse(pipeline.preallocate(f, 0))
+
+    def test_split_ranges(self):
+        with patch('parallel.MIN_SEGMENT_SIZE', 10):
+            self.assertEqual(parallel.split_ranges(32, 3),
+                             [(0, 11), (11, 11), (22, 10)])
+            self.assertEqual(parallel.split_ranges(15, 8), [(0, 15)])
+
+    @patch('parallel.MIN_SEGMENT_SIZE', 4)
+    def test_get_segmented(self):
+        data = b'0123456789abcdef'
+        sessions = []
+
+        class Session:
+            def __init__(self, directory):
+                self.directory = directory
+                self.closed = False
+                sessions.append(self)
+
+            def retr_range(self, remoteFile, f, length, bar):
+                offset = f.tell()
+                if offset == 4 and not hasattr(Session, 'failed'):
+                    Session.failed = True
+                    f.write(data[offset:offset + 2])
+                    raise socket.timeout
+                f.write(data[offset:offset + length])
+                bar.update(length)
+                return '226 Transfer complete.\r\n'
+
+            def close(self):
+                self.closed = True
+
+        self.client.spawn_session = Session
+        bar = unittest.mock.Mock()
+        with tempfile.TemporaryDirectory() as directory:
+            localFile = os.path.join(directory, 'file')
+            result = parallel.get_segmented(self.client, '/dir', 'file',
+                                            localFile, len(data), 4, bar)
+            with open(localFile, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.assertEqual(len(sessions), 5)
+        self.assertTrue(all(s.closed and s.directory == '/dir'
+                            for s in sessions))
+
+    def test_session_pool(self):
+        done = []
+
+        class Session:
+            def __init__(self, directory):
+                self.closed = False
+
+            def get(self, remoteFile, localFile):
+                done.append((remoteFile, localFile))
+                return '226 Transfer complete.\r\n'
+
+            def close(self):
+                self.closed = True
+
+        self.client.spawn_session = Session
+        tasks = [('get', 'f{}'.format(i), 'l{}'.format(i))
+                 for i in range(10)]
+        with parallel.SessionPool(self.client, 3, '/') as pool:
+            sessions = pool.sessions
+            result = pool.run(tasks)
+
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.assertEqual(sorted(done), sorted(t[1:] for t in tasks))
+        self.assertEqual(len(sessions), 3)
+        self.assertTrue(all(s.closed for s in sessions))
+
+    def test_session_pool_error(self):
+        class Session:
+            def __init__(self, directory):
+                pass
+
+            def send(self, *args):
+                raise socket.timeout
+
+            def close(self):
+                pass
+
+        self.client.spawn_session = Session
+        with parallel.SessionPool(self.client, 2) as pool:
+            with self.assertRaises(socket.timeout):
+                pool.run([('send', 'a', 'a'), ('send', 'b', 'b')])
+
+    @patch('parallel.SessionPool', autospec=True)
+    @patch('os.mkdir', autospec=True)
+    @patch('os.path.isdir', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_get_dir_parallel(self, mockObject, mockIsdir, mockMkdir,
+                              mockPool):
+        mockIsdir.return_value = False
+        self.serv.dataMock = mockObject
+        self.client._remote_dir = lambda: '/'
+        self.client.get('mydir', jobs=2)
+
+        mockMkdir.assert_called_once_with('mydir')
+        mockPool.assert_called_once_with(self.client, 2, '/')
+        pool = mockPool.return_value.__enter__.return_value
+        pool.run.assert_called_once_with(
+            [('get_file', 'mydir/myfile1',
+              os.path.join('mydir', 'myfile1')),
+             ('get_file', 'mydir/myfile2',
+              os.path.join('mydir', 'myfile2'))])
+
+    def test_jobs_option(self):
+        with patch.object(self.client, 'get') as mockGet:
+            ftp._with_jobs_option(self.client.get, self.client.config)(
+                '-j', '3', 'a', 'b')
+        mockGet.assert_called_once_with('a', 'b', jobs=3)
+        with self.assertRaises(Exception):
+            self.client.commands['get']('-j', 'x', 'a')
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_reget(self, mockObject, mockBar):
+        self.serv.dataMock = mockObject
+        with tempfile.TemporaryDirectory() as directory:
+            localFile = os.path.join(directory, 'file1')
+            with open(localFile, 'wb') as f:
+                f.write(b'file')
+            result = self.client.reget('file1', localFile)
+            with open(localFile, 'rb') as f:
+                self.assertEqual(f.read(), b'file1data')
+
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.serv.mockSock().sendall.assert_any_call(b'REST 4\r\n')
+        mockBar.return_value.update.assert_has_calls([call(4), call(5)])
+
+    @patch('progress.Progress', autospec=True)
+    @patch('socket.socket', autospec=True)
+    def test_reput(self, mockObject, mockBar):
+        self.serv.dataMock = mockObject
+        self.serv.data[b'file4'] = b'file'
+        self.serv.size = lambda name: setattr(
+            self.serv.mockSock().recv, 'return_value', b'213 4\r\n')
+        self.serv.cmds[b'SIZE'] = self.serv.size
+        with tempfile.TemporaryDirectory() as directory:
+            localFile = os.path.join(directory, 'file4')
+            with open(localFile, 'wb') as f:
+                f.write(b'file4data')
+            with patch('os.sendfile', side_effect=OSError, create=True):
+                result = self.client.reput(localFile, 'file4')
+
+        self.assertEqual(result, '226 Transfer complete.\r\n')
+        self.serv.mockSock().sendall.assert_any_call(b'APPE file4\r\n')
+        self.assertEqual(self.serv.data[b'file4'], b'file4data')
+
+    @patch('time.sleep', autospec=True)
+    def test_retry_with_reconnect(self, mockSleep):
+        self.client.connect('MyAddress')
+        self.client.login('me', 'qwerty')
+        self.client.cd('mydir')
+        attempts = [socket.timeout, ConnectionError, self.client.pwd]
+
+        def reget_once(*args):
+            attempt = attempts.pop(0)
+            if isinstance(attempt, type):
+                raise attempt
+            return attempt()
+
+        with patch('socket.socket', self.serv.mockSock), \
+                patch.object(self.client, '_reget_once',
+                             side_effect=reget_once):
+            result = self.client.reget('file1', 'file1')
+
+        self.assertEqual(result, '257 "/" is the current directory\r\n')
+        self.assertEqual(mockSleep.mock_calls,
+                         [call(ftp.RETRY_DELAY), call(ftp.RETRY_DELAY * 2)])
+        self.assertEqual(self.serv.mockSock().connect.call_count, 2)
+        self.assertEqual(self.sent_commands()[-4:],
+                         [b'USER me', b'PASS qwerty', b'CWD mydir', b'PWD'])
+
+    @patch('time.sleep', autospec=True)
+    def test_retry_not_local_errors(self, mockSleep):
+        with patch.object(self.client, '_reget_once',
+                          side_effect=PermissionError) as mockReget:
+            with self.assertRaises(PermissionError):
+                self.client.reget('file1', 'file1')
+        mockReget.assert_called_once_with('file1', 'file1')
+        mockSleep.assert_not_called()
+
+    def sent_commands(self):
+        return [command for args in
+                self.serv.mockSock().sendall.call_args_list
+                for command in args[0][0].split(b'\r\n')[:-1]]
+
+    def close_control_connection(self):
+        recv = self.serv.mockSock().recv
+        recv.side_effect = lambda *args: (
+            setattr(recv, 'side_effect', None) or b'')
+
+    def test_lazy_reconnect(self):
+        self.client.connect('MyAddress')
+        self.client.login('me', 'qwerty')
+        self.client.cd('mydir')
+        self.close_control_connection()
+        with patch('socket.socket', self.serv.mockSock):
+            with self.assertRaises(ftp.exc.NotConnectedException):
+                self.client.send_cmd('MKD', 'new')
+            self.assertFalse(self.client.isConnected)
+            self.assertTrue(self.client.isLost)
+            result = self.client.pwd()
+        self.assertEqual(result, '257 "/" is the current directory\r\n')
+        self.assertTrue(self.client.isConnected)
+        self.assertEqual(self.sent_commands()[-5:],
+                         [b'MKD new', b'USER me', b'PASS qwerty',
+                          b'CWD mydir', b'PWD'])
+        self.assertEqual(self.client.metrics.snapshot()['counters'][-1],
+                         {'name': 'ftp_reconnects_total', 'labels': {},
+                          'value': 1})
+
+    def test_idempotent_retry(self):
+        self.client.connect('MyAddress')
+        self.client.login('me', 'qwerty')
+        self.close_control_connection()
+        with patch('socket.socket', self.serv.mockSock):
+            result = self.client.pwd()
+        self.assertEqual(result, '257 "/" is the current directory\r\n')
+        self.assertEqual(self.sent_commands()[-4:],
+                         [b'PWD', b'USER me', b'PASS qwerty', b'PWD'])
+
+        self.client.close()
+        self.assertFalse(self.client.isLost)
+        with self.assertRaises(OSError):
+            self.client.pwd()
+
+    def test_idempotent_retry_with_parameters(self):
+        self.client.connect('MyAddress')
+        self.client.login('me', 'qwerty')
+        self.close_control_connection()
+        with patch('socket.socket', self.serv.mockSock):
+            self.client.send_cmd('TYPE I')
+        self.assertEqual(self.sent_commands()[-4:],
+                         [b'TYPE I', b'USER me', b'PASS qwerty', b'TYPE I'])
+        self.assertIn({'TYPE'}, [
+            set(histogram['labels'].values()) for histogram
+            in self.client.metrics.snapshot()['histograms']
+            if histogram['name'] == 'ftp_command_seconds'])
+
+    def test_execute_retry(self):
+        def lose(*args):
+            self.client.isLost = True
+            raise ConnectionError
+
+        calls = []
+        for command in ('ls', 'send'):
+            self.client.commands[command] = lambda *args, command=command: (
+                calls.append(command) or
+                (lose() if calls.count(command) == 1 else 'ok'))
+
+        self.assertEqual(self.client.execute('ls', 'mydir'), 'ok')
+        with self.assertRaises(ConnectionError):
+            self.client.execute('send', 'file')
+        self.assertEqual(calls, ['ls', 'ls', 'send'])
+
+    def test_keep_alive(self):
+        self.client.connect('MyAddress')
+        self.assertGreater(self.client.keep_alive(30), 29)
+        self.client._lastActivity -= 40
+        self.assertEqual(self.client.keep_alive(30), 30)
+        self.assertEqual(self.sent_commands(), [b'NOOP'])
+
+        self.client._lastActivity -= 40
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with self.client._lock:
+                locked.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        locked.wait()
+        self.assertEqual(self.client.keep_alive(30), 30)
+        release.set()
+        thread.join()
+        self.assertEqual(self.sent_commands(), [b'NOOP'])
+
+    def test_keepalive_thread(self):
+        checked = threading.Event()
+        client = unittest.mock.Mock()
+        client.keep_alive.side_effect = lambda interval: checked.set() or 0.01
+        thread = keepalive.Keepalive(client, 0.01)
+        thread.start()
+        self.assertTrue(checked.wait(5))
+        thread.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        client.keep_alive.assert_called_with(0.01)
 
     def test_not_connected(self):
         self.client.connect('MyAddress')
@@ -105,6 +984,7 @@ class Tests(unittest.TestCase):
         mockOs.basename.side_effect = lambda x: x
         mockOs.isdir.side_effect = lambda x: False
         mockOs.expanduser.side_effect = lambda x: x
+        mockOs.join.side_effect = posixpath.join
         self.serv.dataMock = mockObject
         mockOpen = mock_open()
 
@@ -113,19 +993,23 @@ class Tests(unittest.TestCase):
 
         self.assertEqual(result, '226 Transfer complete.\r\n')
         mockMkdir.assert_called_once_with('mydir')
-        self.assertEqual(mockChdir.mock_calls, [call('mydir'), call('..')])
+        mockChdir.assert_not_called()
         self.assertEqual(mockOpen.call_args_list,
-                         [call('myfile1', 'wb'), call('myfile2', 'wb')])
+                         [call('mydir/myfile1', 'wb'),
+                          call('mydir/myfile2', 'wb')])
         self.assertEqual(mockOpen().write.mock_calls,
                          [call(b'myfile1data'), call(b'myfile2data')])
 
+    @patch('progress.Progress', autospec=True)
     @patch('os.chdir', autospec=True)
     @patch('os.walk', autospec=True)
     @patch('os.path', autospec=True)
     @patch('socket.socket', autospec=True)
-    def test_send_dir(self, mockObject, mockOs, mockWalk, mockChdir):
+    def test_send_dir(self, mockObject, mockOs, mockWalk, mockChdir,
+                      mockBar):
         mockOs.expanduser.side_effect = lambda x: x
         mockOs.isdir.side_effect = lambda x: x == 'favdir'
+        mockOs.join.side_effect = posixpath.join
         mockWalk.side_effect =\
             lambda x: [('favdir', [], ['myfile3', 'myfile4'])]
         self.serv.dataMock = mockObject
@@ -133,14 +1017,14 @@ class Tests(unittest.TestCase):
 
         with patch('builtins.open', mockOpen,
                    create=True) as m:
-            m.return_value.__iter__.side_effect =\
-                lambda: iter([b'myfile3data'])
+            m.return_value.fileno.side_effect = io.UnsupportedOperation
             result = self.client.send('favdir')
 
         self.assertEqual(result, '226 Transfer complete.\r\n')
-        self.assertEqual(mockChdir.mock_calls, [call('favdir'), call('..')])
+        mockChdir.assert_not_called()
         self.assertEqual(mockOpen.call_args_list,
-                         [call('myfile3', 'rb'), call('myfile4', 'rb')])
+                         [call('favdir/myfile3', 'rb'),
+                          call('favdir/myfile4', 'rb')])
         self.assertEqual(
             self.serv.dirs[b'favdir'],
             ([b'myfile3', b'myfile4'],
@@ -157,6 +1041,31 @@ class Tests(unittest.TestCase):
         self.serv.mockSock().sendall.assert_called_with(
             b'PORT 127,0,0,1,130,39\r\n')
 
+    def test_extended_data_addresses(self):
+        self.client.sock.family = socket.AF_INET6
+        self.client.sock.getpeername.return_value = ('::1', 21, 0, 0)
+        self.client.sock.getsockname.return_value = ('::1', 40000, 0, 0)
+        self.assertEqual(self.client._passive_command(), 'EPSV')
+        self.assertEqual(self.client._passive_address(
+            '229 Entering Extended Passive Mode (|||50123|)'),
+            ('::1', 50123))
+        with self.assertRaises(ftp.exc.FailedOperationException):
+            self.client._passive_address('229 Entering (|||x|)')
+
+        listener = unittest.mock.Mock()
+        listener.getsockname.return_value = ('::', 33319, 0, 0)
+        self.assertEqual(self.client._active_command(listener),
+                         ('EPRT', '|2|::1|33319|'))
+        self.client.sock.family = socket.AF_INET
+        self.client.sock.getsockname.return_value = ('10.0.0.2', 40000)
+        self.client.config.epsv = True
+        self.assertEqual(self.client._active_command(listener),
+                         ('EPRT', '|1|10.0.0.2|33319|'))
+        self.assertFalse(self.client._refuses_extended('229 ok'))
+        self.assertTrue(self.client._refuses_extended('500 Unknown'))
+        self.assertEqual(self.client._active_command(listener),
+                         ('PORT', '10,0,0,2,130,39'))
+
     @patch('socket.socket', autospec=True)
     def test_correct_exit(self, mockObject):
         self.client.connect('Myaddr')
@@ -165,6 +1074,19 @@ class Tests(unittest.TestCase):
         self.serv.mockSock().close.assert_called_once_with()
         self.assertTrue(self.client.timeToExit)
 
+    @patch('socket.socket', autospec=True)
+    def test_exit_stops_keepalive_first(self, mockObject):
+        self.client.connect('Myaddr')
+        self.client.keepalive = unittest.mock.Mock()
+        states = []
+        close = self.client.close
+        self.client.close = lambda: states.append(
+            (self.client.keepalive.stop.called,
+             self.client._lock._is_owned())) or close()
+        self.client.exit()
+        self.assertEqual(states, [(True, True)])
+        self.serv.mockSock().sendall.assert_called_with(b'QUIT\r\n')
+
 
 if __name__ == '__main__':
     unittest.main()
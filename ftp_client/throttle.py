@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+
+
+BURST_TIME = 0.5
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class TokenBucket:
+    '''token bucket which lets through rate bytes per second on average
+    and up to BURST_TIME seconds of rate at once, rate 0 means no limit,
+    it can be shared by several threads'''
+    def __init__(self, rate=0, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._stamp = clock()
+        self.rate = 0
+        self._tokens = 0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        '''change rate, transfers which wait for tokens catch it up
+        with their next block'''
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self._tokens = min(self._tokens, self._capacity)
+
+    def consume(self, amount):
+        '''take amount tokens, sleeping until bucket pays off debt
+        if there are not enough of them'''
+        with self._lock:
+            if not self.rate:
+                return
+            self._refill()
+            self._tokens -= amount
+            delay = -self._tokens / self.rate
+        if delay > 0:
+            self.sleep(delay)
+
+    @property
+    def _capacity(self):
+        return self.rate * BURST_TIME
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self._capacity,
+                           self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+
+class Throttled:
+    '''progress of transfer which waits for tokens of all buckets
+    before counting transferred bytes; since first bytes of compressed
+    transfer are counted, buckets are charged for bytes on the wire
+    instead of inflated ones'''
+    __slots__ = ('bar', 'buckets', 'compressed')
+
+    def __init__(self, bar, buckets):
+        self.bar = bar
+        self.buckets = buckets
+        self.compressed = False
+
+    def update(self, length):
+        if not self.compressed:
+            self._consume(length)
+        self.bar.update(length)
+
+    def update_wire(self, length):
+        self.compressed = True
+        self._consume(length)
+        self.bar.update_wire(length)
+
+    def _consume(self, length):
+        for bucket in self.buckets:
+            bucket.consume(length)
+
+    def finish(self):
+        self.bar.finish()
+
+
+def parse_rate(value):
+    '''parse rate in bytes per second with optional K, M or G suffix,
+    for example "200M", 0 means no limit'''
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)(?:i?B)?(?:/s)?',
+                         value.strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError('Invalid rate: {}'.format(value))
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+def format_rate(rate):
+    '''format rate in bytes per second for user'''
+    if not rate:
+        return 'unlimited'
+    for unit in ('G', 'M', 'K'):
+        if rate % UNITS[unit] == 0:
+            return '{}{}/s'.format(rate // UNITS[unit], unit)
+    return '{}/s'.format(rate)